@@ -1,74 +1,310 @@
-from flask import Flask, jsonify, request, render_template_string, Response, make_response
+from flask import Flask, jsonify, request, render_template_string, Response, make_response, g
 import os
 import json
 import time
 import io
 import csv
 import threading
+import atexit
 import requests
 
 # 复用现有核心逻辑
 import test as core
 import db
+import metrics
+import scheduler
+import engine
+import sim_ledger
+import simulation
+import cost_models
+import archive
+import db_writer
+import replica
 
 app = Flask(__name__)
 
+# 性能指标：决策周期各阶段与HTTP路由耗时
+DECISION_STAGE_SECONDS = metrics.histogram("onlydecide_decision_stage_duration_seconds", "自动决策周期各阶段耗时")
+DECISION_CYCLES_TOTAL = metrics.counter("onlydecide_decision_cycles_total", "自动决策周期次数（按结果）")
+LAST_DECISION_TIMESTAMP = metrics.gauge("onlydecide_last_decision_timestamp_seconds", "最近一次自动决策完成的Unix时间")
+HTTP_REQUEST_SECONDS = metrics.histogram("onlydecide_http_request_duration_seconds", "Flask路由耗时")
+HTTP_REQUESTS_TOTAL = metrics.counter("onlydecide_http_requests_total", "Flask请求次数（按路由与状态码）")
+
+
+def _stage_done(stage: str, started: float) -> float:
+    """记录某阶段耗时，返回下一阶段的起点"""
+    now = time.perf_counter()
+    DECISION_STAGE_SECONDS.observe(now - started, stage=stage)
+    return now
+
 # 诊断：记录每次请求的路径，帮助定位404来源
 @app.before_request
 def _log_incoming_request_path():
+    g._metrics_start = time.perf_counter()
     try:
         core.write_echo(f"收到请求: {request.method} {request.path}")
     except Exception:
         pass
 
+
+@app.after_request
+def _record_request_metrics(response):
+    try:
+        started = getattr(g, '_metrics_start', None)
+        # 按路由规则而非实际路径打标签，避免查询参数/路径参数导致标签爆炸
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        if started is not None:
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, route=route, method=request.method)
+        HTTP_REQUESTS_TOTAL.inc(route=route, method=request.method, status=str(response.status_code))
+    except Exception:
+        pass
+    return response
+
 # 初始化核心组件（使用 test.py 中的密钥与配置）
 dc = core.OKXDataCollector(core.OKX_API_KEY, core.OKX_SECRET, core.OKX_PASSWORD)
 ai = core.DeepSeekAI(core.DEEPSEEK_API_KEY)
 
-# 数据库初始化
-DB_PATH = os.path.join(os.path.dirname(__file__), 'decisions.db')
+# 数据库初始化：路径可由环境变量 ONLYDECIDE_DB 指定（须在导入 app 前设置，写线程、快照、模拟账本与成本模型都按此路径建立）
+DB_PATH = os.environ.get('ONLYDECIDE_DB') or os.path.join(os.path.dirname(__file__), 'decisions.db')
 db.init_db(DB_PATH)
+if getattr(core, 'DB_WAL_MODE', True):
+    # 在后台线程打开连接之前切换到 WAL（需要独占数据库）
+    try:
+        db.set_journal_mode(DB_PATH, wal=True)
+    except Exception as e:
+        core.write_error(f"切换WAL日志模式失败: {e}")
 
 
-def generate_and_store_ai_decision():
-    """采集数据、生成AI决策并写入数据库与日志（单次执行）。"""
+def _run_backfills():
+    """在线迁移：后台分批执行结构迁移的数据回填，不阻塞启动与决策写入"""
     try:
-        symbol = getattr(core, 'SYMBOL', 'ETH-USDT-SWAP')
-        klines_5 = dc.get_kline_data(symbol=symbol, bar="5m", limit=6)
-        klines_30 = dc.get_kline_data(symbol=symbol, bar="30m", limit=6)
-        klines_2h = dc.get_kline_data(symbol=symbol, bar="2H", limit=6)
-        klines_1d = dc.get_kline_data(symbol=symbol, bar="1D", limit=6)
-        current_price = dc.get_current_price(symbol=symbol)
+        n = db.run_backfills(
+            DB_PATH,
+            batch_size=int(getattr(core, 'DB_BACKFILL_BATCH_SIZE', 500) or 500),
+            pause=float(getattr(core, 'DB_BACKFILL_PAUSE', 0.05) or 0.0),
+        )
+        if n:
+            core.write_echo(f"数据库迁移回填完成，共改写 {n} 行")
+    except Exception as e:
+        core.write_error(f"数据库迁移回填失败（下次启动从进度处继续）: {e}")
 
-        market_data = {
-            "current_price": current_price,
-            "kline_5min": klines_5,
-            "kline_30min": klines_30,
-            "kline_2h": klines_2h,
-            "kline_1d": klines_1d
-        }
-        account_status = dc.get_account_balance()
-        position_info = dc.get_position_info(symbol=symbol)
+
+threading.Thread(target=_run_backfills, name='SchemaBackfill', daemon=True).start()
+
+# JSON 字段压缩：开启后没有字典时用最近的决策生成（已有行用 compress_blobs.py migrate 改写）
+if getattr(core, 'DB_BLOB_COMPRESSION', False):
+    try:
+        if db.active_blob_dict(DB_PATH) is None:
+            core.write_echo(f"已生成JSON字段压缩字典: id={db.train_blob_dictionary(DB_PATH)}")
+    except Exception as e:
+        core.write_error(f"生成JSON字段压缩字典失败（按未压缩写入）: {e}")
+
+# 异步批量写库：决策、模拟持仓写回与盘口快照由同一个写线程合并为事务提交
+DB_WRITER = db_writer.DBWriter(
+    DB_PATH,
+    max_batch=int(getattr(core, 'DB_WRITER_MAX_BATCH', 200) or 200),
+    max_delay=float(getattr(core, 'DB_WRITER_MAX_DELAY', 0.05) or 0.0),
+    wal=bool(getattr(core, 'DB_WAL_MODE', True)),
+    on_error=lambda kind, e: core.write_error(f"异步写库失败[{kind}]: {e}"),
+).start()
+# 退出时先由模拟账本写回（atexit 后注册先执行），再写完队列并停止写线程
+atexit.register(DB_WRITER.stop)
+
+# 只读快照：回测、导出、统计读取定期生成的主库快照（未启动或快照过期时读主库）
+REPLICA = replica.SnapshotReplica(
+    DB_PATH,
+    interval=float(getattr(core, 'DB_REPLICA_INTERVAL', 300) or 300),
+    max_age=float(getattr(core, 'DB_REPLICA_MAX_AGE', 900) or 900),
+    on_error=lambda e: core.write_error(f"生成只读快照失败（查询改读主库）: {e}"),
+)
+
+
+def _archive_loop():
+    """定期把超过保留期（DECISION_RETENTION_DAYS）的决策移到按月压缩归档"""
+    while True:
+        try:
+            n = archive.archive_decisions(
+                DB_PATH,
+                float(getattr(core, 'DECISION_RETENTION_DAYS', 0) or 0),
+                batch_size=int(getattr(core, 'DB_BACKFILL_BATCH_SIZE', 500) or 500),
+            )
+            if n:
+                core.write_echo(f"已归档 {n} 条超过保留期的决策")
+        except Exception as e:
+            core.write_error(f"归档历史决策失败: {e}")
+        time.sleep(float(getattr(core, 'DECISION_ARCHIVE_INTERVAL', 21600) or 21600))
+
+
+def _engine_symbols():
+    """引擎跟踪的交易对：当前交易对在前，其后为 SYMBOLS 中的额外交易对"""
+    return [getattr(core, 'SYMBOL', 'ETH-USDT-SWAP')] + list(getattr(core, 'SYMBOLS', []) or [])
+
+
+# 多交易对决策引擎：每个交易对按K线收盘对齐独立调度，周期与偏移、超时策略每轮动态读取
+ENGINE = engine.DecisionEngine(
+    job=lambda symbol: generate_and_store_ai_decision(symbol),
+    symbols=_engine_symbols,
+    interval=lambda: int(getattr(core, 'AI_FREQUENCY', 10) or 10),
+    offset=lambda: float(getattr(core, 'AI_SCHEDULE_OFFSET', 0) or 0),
+    policy=lambda: getattr(core, 'AI_SCHEDULE_OVERRUN', 'skip'),
+    max_workers=int(getattr(core, 'ENGINE_MAX_WORKERS', 4) or 4),
+    limits={
+        'okx': int(getattr(core, 'ENGINE_OKX_CONCURRENCY', 4) or 4),
+        'llm': int(getattr(core, 'ENGINE_LLM_CONCURRENCY', 2) or 2),
+    },
+    on_error=lambda symbol, e: core.write_error(f"自动AI决策调度异常[{symbol}]: {e}"),
+)
+
+
+def _log_sim_event(event):
+    try:
+        if event['type'] == 'open':
+            if event.get('override_usdt') is not None:
+                core.write_echo(f"模拟交易应用自定义仓位: {float(event['override_usdt']):.2f} USDT -> {event['size_eth']:.6f} ETH")
+            core.write_echo(f"模拟开仓: {event['side']} size={event['size_eth']:.6f} @ {event['entry_price']:.2f}")
+        elif event['reason'] in ('tp', 'sl'):
+            core.write_echo(f"模拟{'止盈' if event['reason'] == 'tp' else '止损'}触发: id={event['id']} {event['symbol']} "
+                            f"trigger={event['signal_price']:.2f} exit={event['exit_price']:.2f}")
+        else:
+            core.write_echo(f"模拟平仓: id={event['id']} exit={event['exit_price']:.2f} 杠杆={event['leverage']}x "
+                            f"pnl={event['pnl_usdt']:.2f}")
+    except Exception:
+        pass
+
+
+# 仿真内存账本：开平仓与查询在内存中完成，后台批量写回 sim_positions；启动时从表重建
+SIM_LEDGER = sim_ledger.SimLedger(
+    DB_PATH,
+    flush_interval=float(getattr(core, 'SIM_LEDGER_FLUSH_INTERVAL', 1.0) or 1.0),
+    initial_equity=float(getattr(core, 'SIM_INITIAL_EQUITY', 10000.0) or 10000.0),
+    leverage=lambda: int(getattr(core, 'LEVERAGE', 1) or 1),
+    on_error=lambda e: core.write_error(f"模拟账本写库失败（稍后重试）: {e}"),
+    writer=DB_WRITER,
+    flush_timeout=float(getattr(core, 'SIM_LEDGER_FLUSH_TIMEOUT', 10.0) or 10.0),
+).load()
+# 进程退出前写回尚未持久化的模拟记录
+atexit.register(SIM_LEDGER.stop)
+
+# 仿真成本模型：分档手续费、按盘口快照的滑点、按缓存资金费率历史的资金费
+SIM_FEES = cost_models.TieredFeeModel(
+    tiers=lambda: getattr(core, 'SIM_FEE_TIERS', None),
+    volume=lambda: getattr(core, 'SIM_FEE_VOLUME_30D', 0.0),
+)
+SIM_SLIPPAGE = cost_models.DepthSlippageModel(
+    DB_PATH,
+    bps=lambda: getattr(core, 'SIM_SLIPPAGE_BPS', 0.0),
+    max_age=lambda: getattr(core, 'SIM_DEPTH_MAX_AGE', 900),
+    writer=DB_WRITER,
+)
+FUNDING_HISTORY = cost_models.FundingHistory(DB_PATH)
+SIM_FUNDING = cost_models.HistoricalFundingModel(FUNDING_HISTORY, rate=lambda: getattr(core, 'SIM_FUNDING_RATE', 0.0))
+
+# 仿真引擎：实时模拟、手动决策与回测共用；成本与仓位参数每次按当前配置读取
+SIM_ENGINE = simulation.SimulationEngine(
+    SIM_LEDGER,
+    fees=SIM_FEES,
+    slippage=SIM_SLIPPAGE,
+    funding=SIM_FUNDING,
+    leverage=simulation.LeverageModel(lambda: int(getattr(core, 'LEVERAGE', 1) or 1)),
+    sizer=simulation.PositionSizer(
+        override_usdt=lambda: (getattr(core, 'USER_OVERRIDE_POSITION_SIZE', None)
+                               if bool(getattr(core, 'USER_OVERRIDE_ENABLED', False)) else None),
+        min_size=lambda: float(getattr(core, 'MIN_ORDER_SIZE', 0.001) or 0.001),
+        max_size=lambda: float(getattr(core, 'MAX_ORDER_SIZE', 10.0) or 10.0),
+    ),
+    lock=ENGINE.ledger,
+    tpsl=lambda: bool(getattr(core, 'SIM_TPSL_ENABLED', True)),
+    on_event=_log_sim_event,
+)
+
+# 仿真模式止盈止损监控：按触发价排序的内存索引，平仓与决策周期共用交易对账本锁
+TPSL_MONITOR = SIM_ENGINE.tpsl
+TPSL_MONITOR.load()
+
+
+def _apply_simulation(symbol: str, decision: dict, current_price: float):
+    """仿真模式：将决策交给仿真引擎开/平仓（按交易对串行），返回本次开平仓事件"""
+    try:
+        return SIM_ENGINE.step(simulation.signal_from_decision(symbol, decision, current_price))
+    except Exception as e:
+        core.write_error(f"模拟交易处理失败: {e}")
+        return []
+
+
+def _record_cost_inputs(symbol: str):
+    """记录仿真成本模型的输入：盘口深度快照与资金费率历史（失败只记录错误，不影响本轮决策）"""
+    if getattr(core, 'SIM_DEPTH_SNAPSHOT_ENABLED', True):
+        try:
+            SIM_SLIPPAGE.record(symbol, dc.get_order_book(symbol, depth=int(getattr(core, 'SIM_DEPTH_LEVELS', 50) or 50)))
+        except Exception as e:
+            core.write_error(f"[{symbol}] 记录盘口深度快照失败: {e}")
+    try:
+        # 资金费率每8小时结算一次，按 SIM_FUNDING_REFRESH 间隔同步即可
+        ENGINE.cache.get((symbol, 'funding'), lambda: FUNDING_HISTORY.refresh(symbol, dc.get_funding_rate_history),
+                         ttl=float(getattr(core, 'SIM_FUNDING_REFRESH', 3600) or 3600))
+    except Exception as e:
+        core.write_error(f"[{symbol}] 同步资金费率历史失败: {e}")
+
+
+def generate_and_store_ai_decision(symbol: str = None):
+    """采集数据、生成AI决策并写入数据库与日志（单次执行，默认当前交易对）。"""
+    cycle_start = time.perf_counter()
+    stage_start = cycle_start
+    outcome = 'error'
+    try:
+        symbol = symbol or getattr(core, 'SYMBOL', 'ETH-USDT-SWAP')
+        with ENGINE.limits.slot('okx'):
+            klines_5 = dc.get_kline_data(symbol=symbol, bar="5m", limit=6)
+            klines_30 = dc.get_kline_data(symbol=symbol, bar="30m", limit=6)
+            klines_2h = dc.get_kline_data(symbol=symbol, bar="2H", limit=6)
+            klines_1d = dc.get_kline_data(symbol=symbol, bar="1D", limit=6)
+            current_price = dc.get_current_price(symbol=symbol)
+
+            market_data = {
+                "current_price": current_price,
+                "kline_5min": klines_5,
+                "kline_30min": klines_30,
+                "kline_2h": klines_2h,
+                "kline_1d": klines_1d
+            }
+            # 账户余额与交易对无关，同一根K线收盘时各交易对共用一次请求
+            account_status = ENGINE.cache.get('account', dc.get_account_balance,
+                                              ttl=float(getattr(core, 'ENGINE_ACCOUNT_TTL', 0) or 0))
+            if account_status.get('unavailable'):
+                # 不可用的空账户不缓存，下一次重新请求
+                ENGINE.cache.drop(lambda key: key == 'account')
+            position_info = dc.get_position_info(symbol=symbol)
+            _record_cost_inputs(symbol)
+        ENGINE.cache.put((symbol, 'snapshot'), {'market_data': market_data, 'position_info': position_info})
+        stage_start = _stage_done('collection', stage_start)
 
         # 使用当前符号写入历史与提示
         recent_rows = db.get_recent_decisions(DB_PATH, symbol=symbol, limit=10)
         history_for_prompt = db.summarize_history_for_prompt(recent_rows)
+        stage_start = _stage_done('history', stage_start)
 
-        decision = ai.get_trading_decision(market_data, account_status, position_info, history=history_for_prompt, symbol=symbol)
+        with ENGINE.limits.slot('llm'):
+            decision = ai.get_trading_decision(market_data, account_status, position_info, history=history_for_prompt, symbol=symbol)
+        stage_start = _stage_done('ai', stage_start)
 
         try:
-            db.insert_decision(DB_PATH, symbol, market_data, account_status, position_info, decision)
+            # 异步写入，不等待落盘；失败由 DB_WRITER.on_error 记录
+            DB_WRITER.insert_decision(symbol, market_data, account_status, position_info, decision)
             td = (decision or {}).get('trading_decision', {})
             core.write_echo(f"自动AI决策完成：action={td.get('action')} conf={td.get('confidence_level')} price={market_data['current_price']}")
         except Exception as e:
             core.write_error(f"写入AI决策到数据库失败: {e}")
+        stage_start = _stage_done('db_insert', stage_start)
 
         # 若交易模式为 live，则尝试执行交易
-        try:
-            mode = globals().get('TRADING_MODE', 'simulation')
-        except Exception:
-            mode = 'simulation'
-        if str(mode).lower() == 'live':
+        live = core.is_live_mode()
+        if live and symbol != getattr(core, 'SYMBOL', 'ETH-USDT-SWAP'):
+            # 实盘执行器按 core.SYMBOL 下单，其余交易对只记录决策
+            core.write_echo(f"交易模式=live，{symbol} 非当前交易对，仅记录决策")
+        elif live and core.has_unavailable(account_status, position_info):
+            # 账户或持仓未能获取（空账户/空仓只是占位），不据此下单
+            core.write_error(f"交易模式=live，[{symbol}] 账户或持仓数据不可用，本周期不下单")
+        elif live:
             try:
                 core.write_echo("交易模式=live，开始执行交易")
                 executor = core.OKXTradingExecutor(dc, ai)
@@ -80,99 +316,28 @@ def generate_and_store_ai_decision():
             except Exception as e:
                 core.write_error(f"执行交易失败: {e}")
         else:
-            # 仿真模式：将决策映射为模拟持仓开/平仓，应用自定义仓位与杠杆
-            try:
-                symbol = getattr(core, 'SYMBOL', 'ETH-USDT-SWAP')
-                td = (decision or {}).get('trading_decision', {})
-                pm = (decision or {}).get('position_management', {})
-                action = (td.get('action') or 'hold').lower()
-
-                # 读取当前是否有模拟持仓
-                open_pos = db.sim_get_open_position(DB_PATH, symbol=symbol)
-
-                # 仿真平仓规则：
-                # - 若已有持仓且出现下一条信号(open_long/open_short/hold)，则以当前价平仓
-                if open_pos:
-                    if action in ('open_long', 'open_short', 'hold'):
-                        lev = int(getattr(core, 'LEVERAGE', 1) or 1)
-                        db.sim_close_position(DB_PATH, open_pos['id'], exit_price=current_price, leverage=lev)
-                        try:
-                            core.write_echo(f"模拟平仓: id={open_pos['id']} exit={current_price:.2f} 杠杆={lev}x")
-                        except Exception:
-                            pass
-                        # 若当前信号是开仓，则在同一价格开新仓（信号切换）
-                        if action in ('open_long', 'open_short'):
-                            # 计算开仓数量：优先使用用户自定义USDT->ETH，否则使用AI建议
-                            try:
-                                size_eth = float(pm.get('position_size') or 0.0)
-                            except Exception:
-                                size_eth = 0.0
-                            if bool(getattr(core, 'USER_OVERRIDE_ENABLED', False)) and (getattr(core, 'USER_OVERRIDE_POSITION_SIZE', None) is not None):
-                                try:
-                                    usdt_amt = float(getattr(core, 'USER_OVERRIDE_POSITION_SIZE', 0) or 0)
-                                except Exception:
-                                    usdt_amt = 0.0
-                                try:
-                                    size_eth = (usdt_amt / current_price) if (current_price and current_price > 0) else 0.0
-                                    core.write_echo(f"模拟交易应用自定义仓位: {usdt_amt:.2f} USDT -> {size_eth:.6f} ETH")
-                                except Exception:
-                                    pass
-                            # 边界处理
-                            min_sz = float(getattr(core, 'MIN_ORDER_SIZE', 0.001) or 0.001)
-                            max_sz = float(getattr(core, 'MAX_ORDER_SIZE', 10.0) or 10.0)
-                            size_eth = max(min_sz, min(size_eth, max_sz)) if size_eth > 0 else 0.0
-                            if size_eth > 0:
-                                side = 'long' if action == 'open_long' else 'short'
-                                tp_price = pm.get('take_profit_price') or None
-                                sl_price = pm.get('stop_loss_price') or None
-                                db.sim_open_position(DB_PATH, symbol, side, size_eth, current_price, tp_price=tp_price, sl_price=sl_price)
-                                core.write_echo(f"模拟开仓: {side} size={size_eth:.6f} @ {current_price:.2f}")
-                else:
-                    # 无持仓时，若为开仓信号则按设置开仓
-                    if action in ('open_long', 'open_short'):
-                        try:
-                            size_eth = float(pm.get('position_size') or 0.0)
-                        except Exception:
-                            size_eth = 0.0
-                        if bool(getattr(core, 'USER_OVERRIDE_ENABLED', False)) and (getattr(core, 'USER_OVERRIDE_POSITION_SIZE', None) is not None):
-                            try:
-                                usdt_amt = float(getattr(core, 'USER_OVERRIDE_POSITION_SIZE', 0) or 0)
-                            except Exception:
-                                usdt_amt = 0.0
-                            size_eth = (usdt_amt / current_price) if (current_price and current_price > 0) else 0.0
-                            try:
-                                core.write_echo(f"模拟交易应用自定义仓位: {usdt_amt:.2f} USDT -> {size_eth:.6f} ETH")
-                            except Exception:
-                                pass
-                        min_sz = float(getattr(core, 'MIN_ORDER_SIZE', 0.001) or 0.001)
-                        max_sz = float(getattr(core, 'MAX_ORDER_SIZE', 10.0) or 10.0)
-                        size_eth = max(min_sz, min(size_eth, max_sz)) if size_eth > 0 else 0.0
-                        if size_eth > 0:
-                            side = 'long' if action == 'open_long' else 'short'
-                            tp_price = pm.get('take_profit_price') or None
-                            sl_price = pm.get('stop_loss_price') or None
-                            db.sim_open_position(DB_PATH, symbol, side, size_eth, current_price, tp_price=tp_price, sl_price=sl_price)
-                            core.write_echo(f"模拟开仓: {side} size={size_eth:.6f} @ {current_price:.2f}")
-            except Exception as e:
-                core.write_error(f"模拟交易处理失败: {e}")
+            _apply_simulation(symbol, decision, current_price)
+        _stage_done('live_execution' if live else 'simulation', stage_start)
+        outcome = 'ok'
+        LAST_DECISION_TIMESTAMP.set(time.time())
+    except core.DataUnavailable as e:
+        # 行情或账户数据不可用：跳过LLM调用与写库，避免伪造数据进入决策与回测
+        outcome = 'unavailable'
+        core.write_error(f"[{symbol}] 数据不可用，跳过本轮自动AI决策: {e}")
     except Exception as e:
         core.write_error(f"自动AI决策失败: {e}")
+    finally:
+        DECISION_STAGE_SECONDS.observe(time.perf_counter() - cycle_start, stage='cycle')
+        DECISION_CYCLES_TOTAL.inc(outcome=outcome)
 
 
 def _background_ai_loop():
-    """后台循环：按 AI_FREQUENCY 周期自动生成并写库。"""
+    """后台循环：为每个跟踪的交易对在 AI_FREQUENCY 边界之后 AI_SCHEDULE_OFFSET 秒自动生成并写库。"""
     try:
-        core.write_echo(f"自动AI决策线程已启动")
+        core.write_echo(f"自动AI决策线程已启动，交易对: {', '.join(ENGINE.symbols())}")
     except Exception:
         pass
-    while True:
-        # 每轮动态读取频率，支持页面调整后端刷新间隔
-        freq = int(getattr(core, 'AI_FREQUENCY', 10) or 10)
-        generate_and_store_ai_decision()
-        try:
-            time.sleep(max(1, freq))
-        except Exception:
-            time.sleep(10)
+    ENGINE.run_forever()
 
 
 def tail_file(path: str, max_lines: int = 80):
@@ -283,37 +448,66 @@ def api_config():
                             pass
                 except Exception:
                     pass
+            # 更新调度偏移（秒，K线收盘后多久触发）与超时策略
+            if 'ai_schedule_offset' in payload:
+                try:
+                    off = float(payload.get('ai_schedule_offset') or 0)
+                    if off >= 0:
+                        core.AI_SCHEDULE_OFFSET = off
+                        try:
+                            core.write_echo(f"更新AI调度偏移为: {off}s")
+                        except Exception:
+                            pass
+                except Exception:
+                    pass
+            if 'ai_schedule_overrun' in payload:
+                try:
+                    policy = str(payload.get('ai_schedule_overrun') or '')
+                    if policy in scheduler.OVERRUN_POLICIES:
+                        core.AI_SCHEDULE_OVERRUN = policy
+                except Exception:
+                    pass
+            # 更新AI流式响应开关
+            if 'ai_stream_enabled' in payload:
+                try:
+                    core.AI_STREAM_ENABLED = bool(payload.get('ai_stream_enabled'))
+                    try:
+                        core.write_echo(f"更新AI流式响应: {core.AI_STREAM_ENABLED}")
+                    except Exception:
+                        pass
+                except Exception:
+                    pass
         cfg = {
             'symbol': getattr(core, 'SYMBOL', 'ETH-USDT-SWAP'),
             'leverage': getattr(core, 'LEVERAGE', 50),
             'override_enabled': getattr(core, 'USER_OVERRIDE_ENABLED', False),
             'override_position_size': getattr(core, 'USER_OVERRIDE_POSITION_SIZE', None),
             'position_unit': getattr(core, 'USER_POSITION_UNIT', 'USDT'),
-            'ai_frequency': getattr(core, 'AI_FREQUENCY', 10)
+            'ai_frequency': getattr(core, 'AI_FREQUENCY', 10),
+            'ai_stream_enabled': getattr(core, 'AI_STREAM_ENABLED', False),
+            'ai_schedule_offset': getattr(core, 'AI_SCHEDULE_OFFSET', 0),
+            'ai_schedule_overrun': getattr(core, 'AI_SCHEDULE_OVERRUN', 'skip')
         }
         return jsonify({'success': True, 'config': cfg})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-# 轻量级交易模式接口（仅供前端展示切换，不触发真实交易）
-TRADING_MODE = 'simulation'
-
+# 交易模式接口：读写 core.TRADING_MODE（决策周期、数据采集与仿真共用这一个设置）
 @app.route('/api/trading_mode', methods=['GET', 'POST'])
 def api_trading_mode():
-    global TRADING_MODE
     if request.method == 'GET':
-        return jsonify({'success': True, 'mode': TRADING_MODE})
+        return jsonify({'success': True, 'mode': core.TRADING_MODE})
     try:
         payload = request.get_json(silent=True) or {}
         mode = str(payload.get('mode', '')).lower()
         if mode not in ('simulation', 'live'):
             return jsonify({'success': False, 'error': 'invalid mode'}), 400
-        TRADING_MODE = mode
+        core.TRADING_MODE = mode
         try:
             core.write_echo(f"切换交易模式: {mode}")
         except Exception:
             pass
-        return jsonify({'success': True, 'mode': TRADING_MODE})
+        return jsonify({'success': True, 'mode': core.TRADING_MODE})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -355,8 +549,136 @@ def api_symbol():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@app.route('/api/symbols', methods=['GET', 'POST'])
+def api_symbols():
+    """获取或更新额外跟踪的交易对列表（当前交易对始终参与调度）。"""
+    try:
+        if request.method == 'POST':
+            payload = request.get_json(force=True, silent=True) or {}
+            raw = payload.get('symbols', [])
+            if isinstance(raw, str):
+                raw = raw.split(',')
+            symbols = []
+            for sym in raw or []:
+                sym = str(sym).strip()
+                if not sym:
+                    continue
+                if '-USDT-SWAP' not in sym:
+                    return jsonify({'success': False, 'error': f'仅支持USDT永续合约: {sym}'}), 400
+                if sym not in symbols:
+                    symbols.append(sym)
+            core.SYMBOLS = symbols
+            try:
+                core.write_echo(f"更新跟踪交易对: {', '.join(symbols) or '(仅当前交易对)'}")
+            except Exception:
+                pass
+        snapshots = {}
+        for sym in ENGINE.symbols():
+            snap, age = ENGINE.cache.peek((sym, 'snapshot'))
+            if snap:
+                snapshots[sym] = {'current_price': snap['market_data'].get('current_price'), 'age': age}
+        return jsonify({'success': True, 'symbol': getattr(core, 'SYMBOL', 'ETH-USDT-SWAP'),
+                        'symbols': ENGINE.symbols(), 'snapshots': snapshots})
+    except Exception as e:
+        core.write_error(f"跟踪交易对更新失败: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/market_feed')
+def api_market_feed():
+    """WebSocket行情订阅状态（未启用时 enabled=false）"""
+    try:
+        if dc.feed is None:
+            return jsonify({'success': True, 'enabled': False})
+        return jsonify({'success': True, 'enabled': True, 'feed': dc.feed.status()})
+    except Exception as e:
+        core.write_error(f"读取行情订阅状态失败: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/sim_ledger')
+def api_sim_ledger():
+    """模拟账本：未平仓持仓、最近成交、已实现盈亏与权益（内存读取，不访问数据库）"""
+    try:
+        symbol = request.args.get('symbol') or None
+        try:
+            limit = max(1, min(int(request.args.get('limit', 50)), 200))
+        except Exception:
+            limit = 50
+        return jsonify({
+            'success': True,
+            'symbol': symbol,
+            'positions': SIM_LEDGER.list_open_positions(symbol),
+            'fills': SIM_LEDGER.fills(symbol, limit=limit),
+            'equity': SIM_LEDGER.equity(symbol),
+            'ledger': SIM_LEDGER.status(),
+        })
+    except Exception as e:
+        core.write_error(f"读取模拟账本失败: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/sim_positions')
+def api_sim_positions():
+    """按开仓时间范围（start/end，毫秒时间戳或ISO时间）查询模拟持仓记录，时间倒序"""
+    try:
+        symbol = request.args.get('symbol') or None
+        try:
+            limit = max(1, min(int(request.args.get('limit', 200)), 5000))
+        except Exception:
+            limit = 200
+        SIM_LEDGER.flush()
+        rows = db.sim_positions_range(
+            DB_PATH, symbol,
+            start_ms=_parse_range_ms(request.args.get('start')),
+            end_ms=_parse_range_ms(request.args.get('end')),
+            limit=limit,
+        )
+        return jsonify({'success': True, 'symbol': symbol, 'data': rows})
+    except Exception as e:
+        core.write_error(f"读取模拟持仓记录失败: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+def _parse_range_ms(value):
+    """解析查询参数中的时间（毫秒时间戳或ISO时间），无法解析时返回 None"""
+    if value in (None, ''):
+        return None
+    if str(value).isdigit():
+        return int(value)
+    dt = simulation.parse_time(value)
+    return int(dt.timestamp() * 1000) if dt is not None else None
+
+
+@app.route('/api/equity_curve')
+def api_equity_curve():
+    """模拟账户权益曲线：读取预先维护的 equity_snapshots，按点数上限降采样（symbol 缺省为全部交易对合计）"""
+    try:
+        symbol = request.args.get('symbol') or '*'
+        try:
+            points = max(2, min(int(request.args.get('points', 500)), 5000))
+        except Exception:
+            points = 500
+        # 先写回内存账本中尚未落库的平仓，保证曲线包含最新权益
+        SIM_LEDGER.flush()
+        curve = db.get_equity_snapshots(
+            DB_PATH, symbol,
+            start_ms=_parse_range_ms(request.args.get('start')),
+            end_ms=_parse_range_ms(request.args.get('end')),
+            max_points=points,
+            kind=request.args.get('kind'),
+        )
+        return jsonify({'success': True, 'symbol': symbol, 'initial_equity': SIM_LEDGER.initial_equity,
+                        'kind': curve[0]['kind'] if curve else None, 'curve': curve})
+    except Exception as e:
+        core.write_error(f"读取权益曲线失败: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 @app.route('/api/summary')
 def api_summary():
+    # 采集失败的部分置空并在 unavailable 中列出，不再回填伪造数据
+    unavailable = []
     try:
         symbol = getattr(core, 'SYMBOL', 'ETH-USDT-SWAP')
         klines_5 = dc.get_kline_data(symbol=symbol, bar="5m", limit=6)
@@ -367,19 +689,27 @@ def api_summary():
     except Exception as e:
         core.write_error(f"API summary 数据采集失败: {e}")
         klines_5, klines_30, klines_2h, klines_1d = [], [], [], []
-        current_price = 3500.0
+        current_price = None
+        unavailable.append('market_data')
 
+    # 仿真模式下账户接口失败时返回标记 unavailable 的空账户/空仓
     try:
         account_status = dc.get_account_balance()
+        if account_status.get('unavailable'):
+            unavailable.append('account_status')
     except Exception as e:
         core.write_error(f"API summary 账户状态失败: {e}")
-        account_status = {"available_OKX": 0.0, "total_equity": 0.0, "available_OKXWALLET": 0.0}
+        account_status = None
+        unavailable.append('account_status')
 
     try:
         position_info = dc.get_position_info(symbol=getattr(core, 'SYMBOL', 'ETH-USDT-SWAP'))
+        if position_info.get('unavailable'):
+            unavailable.append('position_info')
     except Exception as e:
         core.write_error(f"API summary 持仓信息失败: {e}")
-        position_info = {"position_side": "flat", "position_size": 0.0, "entry_price": 0.0, "leverage": getattr(core, 'LEVERAGE', 50)}
+        position_info = None
+        unavailable.append('position_info')
 
     return jsonify({
         "market_data": {
@@ -390,7 +720,8 @@ def api_summary():
             "kline_1d": klines_1d
         },
         "account_status": account_status,
-        "position_info": position_info
+        "position_info": position_info,
+        "unavailable": unavailable
     })
 
 
@@ -420,13 +751,22 @@ def api_ai_decision():
 
         decision = ai.get_trading_decision(market_data, account_status, position_info, history=history_for_prompt, symbol=symbol)
 
-        # 写入数据库
+        # 写入数据库（等待写线程确认落盘，返回行id）
+        decision_id = None
         try:
-            db.insert_decision(DB_PATH, symbol, market_data, account_status, position_info, decision)
+            decision_id = DB_WRITER.insert_decision(symbol, market_data, account_status, position_info, decision).result(timeout=10)
         except Exception as e:
             core.write_error(f"写入AI决策到数据库失败: {e}")
 
-        return jsonify({"success": True, "decision": decision, "current_price": current_price})
+        # 仿真模式下与自动周期一样交给仿真引擎开/平仓
+        sim_events = None
+        if not core.is_live_mode():
+            sim_events = _apply_simulation(symbol, decision, current_price)
+
+        return jsonify({"success": True, "decision": decision, "decision_id": decision_id, "current_price": current_price, "simulation": sim_events})
+    except core.DataUnavailable as e:
+        core.write_error(f"市场数据不可用，跳过AI决策: {e}")
+        return jsonify({"success": False, "unavailable": True, "error": str(e)}), 503
     except Exception as e:
         core.write_error(f"AI决策调用失败: {e}")
         return jsonify({"success": False, "error": str(e)}), 500
@@ -524,8 +864,10 @@ def api_logs_clear_error():
 @app.route('/api/available_symbols')
 def api_available_symbols():
     try:
-        url = 'https://www.okx.com/api/v5/public/instruments'
+        url = getattr(core, 'OKX_BASE_URL', 'https://www.okx.com') + '/api/v5/public/instruments'
         params = {'instType': 'SWAP'}
+        if getattr(core, 'OKX_RATE_LIMIT_ENABLED', False):
+            core.OKX_RATE_LIMITER.acquire('/api/v5/public/instruments')
         resp = requests.get(url, params=params, timeout=10)
         data = resp.json() if resp.ok else {}
         items = (data or {}).get('data', [])
@@ -592,7 +934,12 @@ def api_decision_history():
             return jsonify({"success": True, "total": result.get('total', 0), "data": output})
         else:
             limit = max(1, min(200, to_int(limit_str or '10', 10)))
-            rows = db.get_recent_decisions(DB_PATH, symbol=symbol, limit=limit)
+            start_ms = _parse_range_ms(request.args.get('start'))
+            end_ms = _parse_range_ms(request.args.get('end'))
+            if start_ms is not None or end_ms is not None:
+                rows = db.get_decisions_range(DB_PATH, symbol=symbol, start_ms=start_ms, end_ms=end_ms, limit=limit)
+            else:
+                rows = db.get_recent_decisions(DB_PATH, symbol=symbol, limit=limit)
             output = []
             for r in rows:
                 output.append({
@@ -614,25 +961,23 @@ def api_decision_history():
 
 
 # === 回测：基于实际执行交易的简单配对交易回测 ===
-def simulate_backtest_history(db_path: str, symbol: str, initial_equity: float, fee_rate: float = 0.0, override_size: float = None, override_leverage: float = None):
-    """基于数据库中实际执行的交易进行回测（含TP/SL命中判定）。
+def simulate_backtest_history(db_path: str, symbol: str, initial_equity: float, fee_rate: float = None, override_size: float = None, override_leverage: float = None,
+                              start_ms: int = None, end_ms: int = None):
+    """基于数据库中的AI决策回放，与实时模拟盘使用同一仿真引擎（simulation.SimulationEngine）。
 
     规则：
-    - 只回测真正开单的单子，而不是所有AI返回的信号
-    - 开单前会检查有没有持仓，如果有的话就会跳过开单
-    - 当检测到TP/SL命中时按该时刻价格平仓；若未命中，则在下一条信号到来时以该信号的价格平仓；
-    - hold：不新开仓；若当前有仓位，则在该信号时刻视为平仓（若之前未命中TP/SL）；
-    - 盈亏以 USDT 计（ETH数量 * 价格差），手续费按费率对开/平两侧计提（notional * fee_rate）。
-    - 末尾未平仓不强制平仓。
+    - 只有开仓信号且当前无持仓时开仓；已有持仓时出现下一条信号(open_long/open_short/hold)则以该信号价格平仓，
+      若该信号为开仓则在同一价格开新仓；
+    - 每条决策的价格先用于检查止盈止损，命中时按触发价平仓（同时命中以止损为准）；
+    - 盈亏以 USDT 计（ETH数量 * 价格差 * 杠杆）；手续费、滑点与资金费使用与实时模拟相同的成本模型
+      （分档费率、盘口快照、本地缓存的资金费率历史），回测过程不访问交易所；
+    - 指定 fee_rate 时手续费改为按该固定费率对开/平两侧计提（名义价值 * fee_rate）；
+    - 末尾未平仓不强制平仓；
+    - start_ms/end_ms 限定回放的决策时间窗口 [start_ms, end_ms)（毫秒），缺省为全部历史。
     """
-    rows = db.get_all_decisions(db_path, symbol)
-    ordered = list(reversed(rows))  # 时间正序
+    # 时间正序；回放只需要标量字段，不读取JSON字段与归档文件
+    ordered = db.get_decisions_range(db_path, symbol, start_ms=start_ms, end_ms=end_ms, ascending=True, blobs=False)
 
-    trades = []
-    equity = float(initial_equity)
-    peak = equity
-    max_dd = 0.0
-    equity_curve = []  # [{time, equity}]
     # 杠杆倍数（未提供则使用全局默认，最低为1）
     try:
         default_leverage = getattr(core, 'LEVERAGE', 1)
@@ -640,145 +985,60 @@ def simulate_backtest_history(db_path: str, symbol: str, initial_equity: float,
         default_leverage = 1
     lev = (override_leverage if (override_leverage is not None and override_leverage > 0) else default_leverage) or 1
 
-    i = 0
-    n = len(ordered)
-    position = None  # {side, entry_price, size, enter_time, tp, sl}
-
-    def parse_float(x, default=0.0):
-        try:
-            return float(x)
-        except Exception:
-            return default
+    # 回测使用不落库的内存账本
+    sim = simulation.SimulationEngine(
+        sim_ledger.SimLedger(None, initial_equity=initial_equity),
+        fees=(simulation.FeeModel(fee_rate) if fee_rate is not None else SIM_ENGINE.fees),
+        slippage=SIM_ENGINE.slippage,
+        funding=SIM_ENGINE.funding,
+        leverage=simulation.LeverageModel(lev),
+        sizer=simulation.PositionSizer(override_size=override_size),
+    )
 
+    trades = []
+    equity = float(initial_equity)
+    peak = equity
+    max_dd = 0.0
     # 在曲线中加入起始点，避免前端“数据不足”
-    try:
-        start_ts = (ordered[0].get('timestamp') if ordered else None)
-    except Exception:
-        start_ts = None
-    equity_curve.append({'time': (start_ts or 'START'), 'equity': equity})
-
-    while i < n:
-        row = ordered[i]
-        price_i = parse_float(row.get('current_price'))
-        action_i = (row.get('action') or 'hold').lower()
-        size_i = parse_float(row.get('position_size'))
-        ts_i = row.get('timestamp')
-
-        # 检查是否有持仓，如果有持仓则跳过开单（模拟真实交易逻辑）
-        if position is None:
-            if action_i == 'open_long' and size_i > 0:
-                position = {
-                    'side': 'long',
-                    'entry_price': price_i,
-                    'size': (override_size if (override_size is not None and override_size > 0) else size_i),
-                    'enter_time': ts_i,
-                    'tp': parse_float(row.get('take_profit_price'), None),
-                    'sl': parse_float(row.get('stop_loss_price'), None)
-                }
-                # 记录开仓时间点权益
-                equity_curve.append({'time': ts_i, 'equity': equity})
-            elif action_i == 'open_short' and size_i > 0:
-                position = {
-                    'side': 'short',
-                    'entry_price': price_i,
-                    'size': (override_size if (override_size is not None and override_size > 0) else size_i),
-                    'enter_time': ts_i,
-                    'tp': parse_float(row.get('take_profit_price'), None),
-                    'sl': parse_float(row.get('stop_loss_price'), None)
-                }
-                # 记录开仓时间点权益
-                equity_curve.append({'time': ts_i, 'equity': equity})
-            i += 1
-            continue
-
-        # 已有持仓：从当前位置向后扫描，寻找最早的TP/SL命中或下一条信号
-        j = i
-        exit_j = None
-        exit_price = None
-        exit_time = None
-        exit_reason = None  # 'tp'|'sl'|'signal'
-
-        while j < n:
-            rj = ordered[j]
-            price_j = parse_float(rj.get('current_price'))
-            action_j = (rj.get('action') or 'hold').lower()
-            ts_j = rj.get('timestamp')
-
-            tp = position.get('tp')
-            sl = position.get('sl')
-            side = position['side']
-            # TP/SL判定（以决策序列中最早出现为准）
-            if tp is not None and sl is not None:
-                if side == 'long':
-                    if price_j >= tp:
-                        exit_j, exit_price, exit_time, exit_reason = j, price_j, ts_j, 'tp'
-                        break
-                    if price_j <= sl:
-                        exit_j, exit_price, exit_time, exit_reason = j, price_j, ts_j, 'sl'
-                        break
-                else:  # short
-                    if price_j <= tp:
-                        exit_j, exit_price, exit_time, exit_reason = j, price_j, ts_j, 'tp'
-                        break
-                    if price_j >= sl:
-                        exit_j, exit_price, exit_time, exit_reason = j, price_j, ts_j, 'sl'
-                        break
-
-            # 若未命中TP/SL，遇到下一条信号则以该信号价格平仓
-            if action_j in ('open_long', 'open_short', 'hold'):
-                exit_j, exit_price, exit_time, exit_reason = j, price_j, ts_j, 'signal'
-                break
-
-            j += 1
-
-        if exit_j is None:
-            # 序列末尾仍持仓，则不强制平仓，结束
-            break
-
-        # 计算盈亏并记录交易
-        side = position['side']
-        entry_price = position['entry_price']
-        size_pos = position['size']
-        # 计算毛盈亏并按杠杆放大；手续费同样按杠杆放大
-        pnl_gross = (exit_price - entry_price) * size_pos if side == 'long' else (entry_price - exit_price) * size_pos
-        pnl = pnl_gross * lev
-        fee_entry = fee_rate * entry_price * size_pos * lev
-        fee_exit = fee_rate * exit_price * size_pos * lev
-        pnl_net = pnl - fee_entry - fee_exit
-        equity += pnl_net
-        ret_pct = ((exit_price - entry_price) / entry_price) if side == 'long' else ((entry_price - exit_price) / entry_price)
-
-        trades.append({
-            'enter_time': position['enter_time'],
-            'exit_time': exit_time,
-            'side': side,
-            'entry_price': entry_price,
-            'exit_price': exit_price,
-            'size': size_pos,
-            'pnl_usdt': pnl_net,
-            'return_pct': ret_pct,
-            'exit_reason': exit_reason
-        })
-
-        # 更新回撤与权益曲线
-        if equity > peak:
-            peak = equity
-        dd = (peak - equity) / peak if peak > 0 else 0.0
-        if dd > max_dd:
-            max_dd = dd
-        equity_curve.append({'time': exit_time, 'equity': equity})
+    equity_curve = [{'time': ((ordered[0].get('timestamp') if ordered else None) or 'START'), 'equity': equity}]
 
-        # 移动索引到退出点，并根据当前行是否开新仓
-        position = None
-        i = exit_j
-        # 继续循环会在此行检查是否开新仓
+    for row in ordered:
+        for ev in sim.step(row):
+            if ev['type'] == 'open':
+                # 记录开仓时间点权益
+                equity_curve.append({'time': ev['open_time'], 'equity': equity})
+                continue
+            side = ev['side']
+            entry_price = ev['entry_price']
+            exit_price = ev['exit_price']
+            equity += ev['pnl_usdt']
+            ret_pct = 0.0
+            if entry_price:
+                ret_pct = ((exit_price - entry_price) / entry_price) if side == 'long' else ((entry_price - exit_price) / entry_price)
+            trades.append({
+                'enter_time': ev['open_time'],
+                'exit_time': ev['close_time'],
+                'side': side,
+                'entry_price': entry_price,
+                'exit_price': exit_price,
+                'size': ev['size_eth'],
+                'pnl_usdt': ev['pnl_usdt'],
+                'return_pct': ret_pct,
+                'fees': ev['fees'],
+                'funding': ev['funding'],
+                'exit_reason': ev['reason']
+            })
+            # 更新回撤与权益曲线
+            if equity > peak:
+                peak = equity
+            dd = (peak - equity) / peak if peak > 0 else 0.0
+            if dd > max_dd:
+                max_dd = dd
+            equity_curve.append({'time': ev['close_time'], 'equity': equity})
 
     # 若曲线点位仍不足两点，补充结束点
     if len(equity_curve) < 2:
-        try:
-            end_ts = (ordered[-1].get('timestamp') if ordered else None)
-        except Exception:
-            end_ts = None
+        end_ts = ordered[-1].get('timestamp') if ordered else None
         equity_curve.append({'time': (end_ts or 'END'), 'equity': equity})
 
     wins = sum(1 for t in trades if (t.get('pnl_usdt') or 0) > 0)
@@ -802,7 +1062,8 @@ def api_backtest():
     try:
         symbol = request.args.get('symbol') or getattr(core, 'SYMBOL', 'ETH-USDT-SWAP')
         initial_equity = request.args.get('initial_equity', '10000')
-        fee_rate = request.args.get('fee_rate', '0')
+        # 未指定 fee_rate 时使用配置的分档手续费
+        fee_rate = request.args.get('fee_rate')
         # 新增：自定义仓位与杠杆
         override_size_str = request.args.get('position_size')
         override_leverage_str = request.args.get('leverage')
@@ -811,9 +1072,9 @@ def api_backtest():
         except Exception:
             initial_equity = 10000.0
         try:
-            fee_rate = float(fee_rate)
+            fee_rate = float(fee_rate) if fee_rate not in (None, '') else None
         except Exception:
-            fee_rate = 0.0
+            fee_rate = None
         try:
             override_size = float(override_size_str) if override_size_str is not None else None
         except Exception:
@@ -826,13 +1087,50 @@ def api_backtest():
             core.write_echo(f"回测参数: override_size={override_size}, override_leverage={override_leverage}, fee_rate={fee_rate}, symbol={symbol}")
         except Exception:
             pass
-        metrics, trades, curve = simulate_backtest_history(DB_PATH, symbol, initial_equity, fee_rate, override_size=override_size, override_leverage=override_leverage)
+        metrics, trades, curve = simulate_backtest_history(REPLICA.path(), symbol, initial_equity, fee_rate, override_size=override_size, override_leverage=override_leverage,
+                                                           start_ms=_parse_range_ms(request.args.get('start')),
+                                                           end_ms=_parse_range_ms(request.args.get('end')))
         return jsonify({'success': True, 'metrics': metrics, 'trades': trades, 'curve': curve})
     except Exception as e:
         core.write_error(f"回测计算失败: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@app.route('/api/metrics')
+def api_metrics():
+    """Prometheus 文本格式指标；?format=json 时返回JSON摘要"""
+    try:
+        if (request.args.get('format') or '').lower() == 'json':
+            return jsonify({'success': True, 'metrics': metrics.summary()})
+        return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+    except Exception as e:
+        core.write_error(f"导出指标失败: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/metrics/summary')
+def api_metrics_summary():
+    """指标JSON摘要（直方图含 p50/p90/p99）"""
+    try:
+        return jsonify({'success': True, 'metrics': metrics.summary()})
+    except Exception as e:
+        core.write_error(f"导出指标摘要失败: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/scheduler')
+def api_scheduler():
+    """自动决策调度状态：下一次触发时间、最近延迟与跳过次数（scheduler 为当前交易对）"""
+    try:
+        status = ENGINE.state(getattr(core, 'SYMBOL', 'ETH-USDT-SWAP')).status()
+        status['now'] = time.time()
+        return jsonify({'success': True, 'scheduler': status, 'engine': ENGINE.status(), 'tpsl': TPSL_MONITOR.status(),
+                        'db_writer': DB_WRITER.status(), 'replica': REPLICA.status()})
+    except Exception as e:
+        core.write_error(f"读取调度状态失败: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 # 诊断用：简单Ping路由，排除环境问题
 @app.route('/api/ping')
 def api_ping():
@@ -844,7 +1142,8 @@ def api_backtest2():
     try:
         symbol = request.args.get('symbol') or getattr(core, 'SYMBOL', 'ETH-USDT-SWAP')
         initial_equity = request.args.get('initial_equity', '10000')
-        fee_rate = request.args.get('fee_rate', '0')
+        # 未指定 fee_rate 时使用配置的分档手续费
+        fee_rate = request.args.get('fee_rate')
         # 新增：自定义仓位与杠杆（别名路由）
         override_size_str = request.args.get('position_size')
         override_leverage_str = request.args.get('leverage')
@@ -853,9 +1152,9 @@ def api_backtest2():
         except Exception:
             initial_equity = 10000.0
         try:
-            fee_rate = float(fee_rate)
+            fee_rate = float(fee_rate) if fee_rate not in (None, '') else None
         except Exception:
-            fee_rate = 0.0
+            fee_rate = None
         try:
             override_size = float(override_size_str) if override_size_str is not None else None
         except Exception:
@@ -868,7 +1167,9 @@ def api_backtest2():
             core.write_echo(f"回测参数(backtest2): override_size={override_size}, override_leverage={override_leverage}, fee_rate={fee_rate}, symbol={symbol}")
         except Exception:
             pass
-        metrics, trades, curve = simulate_backtest_history(DB_PATH, symbol, initial_equity, fee_rate, override_size=override_size, override_leverage=override_leverage)
+        metrics, trades, curve = simulate_backtest_history(REPLICA.path(), symbol, initial_equity, fee_rate, override_size=override_size, override_leverage=override_leverage,
+                                                           start_ms=_parse_range_ms(request.args.get('start')),
+                                                           end_ms=_parse_range_ms(request.args.get('end')))
         return jsonify({'success': True, 'metrics': metrics, 'trades': trades, 'curve': curve})
     except Exception as e:
         core.write_error(f"回测计算失败(backtest2): {e}")
@@ -937,7 +1238,11 @@ def api_decision_history_export():
     try:
         symbol = request.args.get('symbol')
         fmt = (request.args.get('format') or 'csv').lower()
-        rows = db.get_all_decisions(DB_PATH, symbol=symbol)
+        # 可选 start/end（毫秒时间戳或ISO时间）限定导出的时间窗口
+        rows = db.get_decisions_range(REPLICA.path(), symbol=symbol,
+                                      start_ms=_parse_range_ms(request.args.get('start')),
+                                      end_ms=_parse_range_ms(request.args.get('end')),
+                                      blobs=False)
         if fmt == 'json':
             # 精简字段输出
             output = []
@@ -978,10 +1283,84 @@ def api_decision_history_export():
         return jsonify({"success": False, "error": str(e)}), 500
 
 
+@app.route('/api/decision_history/search')
+def api_decision_history_search():
+    """按 reason 全文搜索决策：q 为空白分隔的关键词（全部包含），可选 symbol、start/end、action（逗号分隔）"""
+    try:
+        query = (request.args.get('q') or '').strip()
+        if not query:
+            return jsonify({"success": False, "error": "缺少搜索关键词 q"}), 400
+        try:
+            limit = max(1, min(200, int(request.args.get('limit', 50))))
+            offset = max(0, int(request.args.get('offset', 0)))
+        except Exception:
+            limit, offset = 50, 0
+        actions = [a.strip() for a in (request.args.get('action') or '').split(',') if a.strip()]
+        result = db.search_decisions(DB_PATH, query,
+                                     symbol=request.args.get('symbol') or None,
+                                     start_ms=_parse_range_ms(request.args.get('start')),
+                                     end_ms=_parse_range_ms(request.args.get('end')),
+                                     actions=actions or None, limit=limit, offset=offset)
+        output = []
+        for r in result['data']:
+            output.append({
+                "id": r.get("id"),
+                "timestamp": r.get("timestamp"),
+                "symbol": r.get("symbol"),
+                "current_price": r.get("current_price"),
+                "action": r.get("action"),
+                "confidence_level": r.get("confidence_level"),
+                "reason": r.get("reason"),
+                "reason_highlight": r.get("reason_highlight"),
+                "position_size": r.get("position_size"),
+                "stop_loss_price": r.get("stop_loss_price"),
+                "take_profit_price": r.get("take_profit_price"),
+                "executed": r.get("executed", 0)
+            })
+        return jsonify({"success": True, "data": output, "has_more": result['has_more'],
+                        "limit": limit, "offset": offset})
+    except Exception as e:
+        core.write_error(f"搜索决策历史失败: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@app.route('/api/decision_stats')
+def api_decision_stats():
+    """决策统计（读取增量维护的汇总表）：可选 symbol、start/end、bucket=hour|day、tz（时区小时偏移，如 8）"""
+    try:
+        try:
+            tz = max(-12, min(14, int(request.args.get('tz', 0))))
+        except Exception:
+            tz = 0
+        bucket = 'day' if request.args.get('bucket') == 'day' else 'hour'
+        stats = db.decision_stats(REPLICA.path(),
+                                  symbol=request.args.get('symbol') or None,
+                                  start_ms=_parse_range_ms(request.args.get('start')),
+                                  end_ms=_parse_range_ms(request.args.get('end')),
+                                  bucket=bucket, tz_offset_hours=tz)
+        return jsonify({"success": True, "stats": stats})
+    except Exception as e:
+        core.write_error(f"读取决策统计失败: {e}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@app.route('/api/decision_history/archive')
+def api_decision_history_archive():
+    """决策归档状态：按月归档文件大小与热表中已归档/未归档的行数"""
+    try:
+        return jsonify({'success': True, 'retention_days': getattr(core, 'DECISION_RETENTION_DAYS', 0),
+                        'archive': archive.status(DB_PATH)})
+    except Exception as e:
+        core.write_error(f"读取决策归档状态失败: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 @app.route('/api/decision_history/clear', methods=['POST'])
 def api_decision_history_clear():
     """清除所有历史决策数据"""
     try:
+        # 先写完队列中的决策，避免清除后又落库
+        DB_WRITER.flush()
         deleted_count = db.clear_all_decisions(DB_PATH)
         core.write_echo(f"已清除所有历史决策数据，共删除 {deleted_count} 条记录")
         return jsonify({
@@ -1061,6 +1440,29 @@ if __name__ == '__main__':
                 print("已注册路由:", r)
     except Exception as e:
         core.write_error(f"列出路由失败: {e}")
+    # 可选：WebSocket行情订阅，价格与K线读取改为内存查找
+    if getattr(core, 'OKX_WS_ENABLED', False):
+        try:
+            feed = dc.start_market_feed()
+            for sym in _engine_symbols():
+                feed.track(sym)
+        except Exception as e:
+            core.write_error(f"WebSocket行情启动失败: {e}")
+    # 仿真止盈止损监控：轮询兜底，WebSocket行情可用时由价格推送驱动
+    if getattr(core, 'SIM_TPSL_ENABLED', True):
+        try:
+            TPSL_MONITOR.start(lambda sym: dc.get_current_price(symbol=sym),
+                               interval=float(getattr(core, 'SIM_TPSL_POLL_INTERVAL', 2) or 2))
+            if dc.feed is not None:
+                dc.feed.add_listener(TPSL_MONITOR.on_tick)
+        except Exception as e:
+            core.write_error(f"止盈止损监控启动失败: {e}")
+    # 只读快照：后台定期刷新
+    if getattr(core, 'DB_REPLICA_ENABLED', True):
+        REPLICA.start()
+    # 冷热分层：后台归档超过保留期的决策
+    if float(getattr(core, 'DECISION_RETENTION_DAYS', 0) or 0) > 0:
+        threading.Thread(target=_archive_loop, name='DecisionArchive', daemon=True).start()
     # 启动后台AI线程（守护线程，不阻塞退出）
     try:
         bg = threading.Thread(target=_background_ai_loop, name='AIBackgroundLoop', daemon=True)
@@ -1068,4 +1470,4 @@ if __name__ == '__main__':
     except Exception as e:
         core.write_error(f"后台AI线程启动失败: {e}")
     # 监听到所有网卡，允许外网访问；端口 5123
-    app.run(host='0.0.0.0', port=5123, debug=False)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5123, debug=False)
\ No newline at end of file
@@ -0,0 +1,174 @@
+"""决策冷热分层：把超过保留期的决策的 JSON 大字段移到按月分区的压缩归档文件。
+
+decisions 表每行有四个 JSON 字段（行情、账户、持仓、原始决策），占据了库文件的绝大部分。
+归档后：
+- 热表保留该行及全部标量字段（时间、价格、动作、仓位、止盈止损、executed），四个 JSON 字段
+  置空并在 archived 列记录所在月份。回测与导出只读取标量字段，不需要打开归档；
+- 完整行（含 JSON）按月追加到 <库名>_archive/decisions-YYYY-MM.jsonl.gz，每次追加写一个
+  独立的 gzip 成员，文件可以直接用 zcat 查看；
+- db.py 的历史查询遇到已归档的行时按月份读取归档补齐 JSON 字段（最近读取的几个月常驻内存），
+  调用方无需区分冷热数据。
+
+先写归档文件并 fsync，再在一个事务内更新热表；中途中断时重跑会再次追加同一批行，
+读取时同一 id 以最后一次为准。未回填毫秒时间列的旧行不参与归档（见 db.run_backfills）。
+
+压缩使用标准库 gzip（环境中没有 zstd）。
+
+归档后的 JSON 字段只存在于归档目录中：备份数据库时必须连同归档目录一起备份。
+默认不归档（test.DECISION_RETENTION_DAYS = 0）。
+
+用法:
+    python archive.py --days 30
+    python archive.py --days 30 --vacuum      # 归档后 VACUUM 回收空间（期间阻塞写入）
+"""
+
+import argparse
+import gzip
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List
+
+import db
+import metrics
+
+ARCHIVED_ROWS_TOTAL = metrics.counter("onlydecide_archived_decisions_total", "移入归档文件的决策行数")
+ARCHIVE_READ_SECONDS = metrics.histogram("onlydecide_archive_read_seconds", "读取一个月归档文件的耗时")
+
+_DAY_MS = 86400 * 1000
+# 内存中保留的月份数
+_CACHE_MONTHS = 4
+_cache: "OrderedDict[str, tuple]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def archive_dir(db_path: str) -> str:
+    """数据库对应的归档目录（decisions.db -> decisions_archive/）"""
+    return os.path.splitext(os.path.abspath(db_path))[0] + "_archive"
+
+
+def month_key(ts_ms: int) -> str:
+    return datetime.fromtimestamp((ts_ms or 0) / 1000.0, tz=timezone.utc).strftime("%Y-%m")
+
+
+def month_path(directory: str, month: str) -> str:
+    return os.path.join(directory, f"decisions-{month}.jsonl.gz")
+
+
+def write_rows(directory: str, rows_by_month: Dict[str, List[Dict]]):
+    """把完整行按月追加到归档文件，返回前落盘"""
+    os.makedirs(directory, exist_ok=True)
+    for month, rows in rows_by_month.items():
+        path = month_path(directory, month)
+        with open(path, "ab") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="ab") as gz:
+                for row in rows:
+                    gz.write(json.dumps(row, ensure_ascii=False).encode("utf-8") + b"\n")
+            raw.flush()
+            os.fsync(raw.fileno())
+        with _cache_lock:
+            _cache.pop(path, None)
+
+
+def read_month(directory: str, month: str) -> Dict[int, Dict]:
+    """读取一个月的归档，返回 {id: 行}；文件未变化时使用缓存"""
+    path = month_path(directory, month)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return {}
+    stamp = (st.st_mtime_ns, st.st_size)
+    with _cache_lock:
+        cached = _cache.get(path)
+        if cached is not None and cached[0] == stamp:
+            _cache.move_to_end(path)
+            return cached[1]
+    started = time.perf_counter()
+    rows: Dict[int, Dict] = {}
+    with gzip.open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                rows[int(row["id"])] = row
+    ARCHIVE_READ_SECONDS.observe(time.perf_counter() - started)
+    with _cache_lock:
+        _cache[path] = (stamp, rows)
+        _cache.move_to_end(path)
+        while len(_cache) > _CACHE_MONTHS:
+            _cache.popitem(last=False)
+    return rows
+
+
+def fetch(directory: str, month: str, ids: Iterable[int]) -> Dict[int, Dict]:
+    rows = read_month(directory, month)
+    return {i: rows[i] for i in ids if i in rows}
+
+
+def remove_all(directory: str) -> int:
+    """删除全部归档文件（清除历史决策时调用），返回删除的文件数"""
+    removed = 0
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            if name.startswith("decisions-") and name.endswith(".jsonl.gz"):
+                os.remove(os.path.join(directory, name))
+                removed += 1
+    with _cache_lock:
+        _cache.clear()
+    return removed
+
+
+def archive_decisions(db_path: str, retention_days: float, batch_size: int = 500,
+                      now_ms: int = None, vacuum: bool = False) -> int:
+    """归档早于保留期的决策，返回归档的行数；retention_days <= 0 时不归档"""
+    if not retention_days or retention_days <= 0:
+        return 0
+    now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+    cutoff = now_ms - int(retention_days * _DAY_MS)
+    directory = archive_dir(db_path)
+    total = 0
+    while True:
+        rows = db.decisions_for_archive(db_path, cutoff, limit=batch_size)
+        if not rows:
+            break
+        by_month: Dict[str, List[Dict]] = {}
+        for row in rows:
+            by_month.setdefault(month_key(row["ts_ms"]), []).append(row)
+        write_rows(directory, by_month)
+        db.mark_decisions_archived(db_path, {r["id"]: m for m, part in by_month.items() for r in part})
+        total += len(rows)
+        ARCHIVED_ROWS_TOTAL.inc(len(rows))
+    if vacuum and total:
+        db.vacuum(db_path)
+    return total
+
+
+def status(db_path: str) -> Dict:
+    """归档文件列表（月份、字节数）与热表中已归档/未归档的行数"""
+    directory = archive_dir(db_path)
+    files = []
+    if os.path.isdir(directory):
+        for name in sorted(os.listdir(directory)):
+            if name.startswith("decisions-") and name.endswith(".jsonl.gz"):
+                files.append({"month": name[len("decisions-"):-len(".jsonl.gz")],
+                              "bytes": os.path.getsize(os.path.join(directory, name))})
+    return {"directory": directory, "files": files, **db.archive_counts(db_path)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="归档早于保留期的决策")
+    parser.add_argument("--db", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "decisions.db"))
+    parser.add_argument("--days", type=float, required=True, help="热表保留的天数")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--vacuum", action="store_true", help="归档后执行 VACUUM 回收空间")
+    args = parser.parse_args()
+    db.init_db(args.db)
+    n = archive_decisions(args.db, args.days, batch_size=args.batch_size, vacuum=args.vacuum)
+    print(f"已归档 {n} 条决策")
+    print(json.dumps(status(args.db), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""决策解析基准：以 huixian.txt 中真实的“AI原始响应”为语料，对比旧解析流程与 decision_parser。
+
+用法: python bench_parser.py [回显文件路径] [--repeat N] [--json]
+"""
+
+import argparse
+import json
+import os
+import re
+import time
+from typing import Dict, List
+
+import decision_parser
+
+
+def _legacy_validate(decision: Dict) -> bool:
+    try:
+        if "trading_decision" not in decision or "position_management" not in decision:
+            return False
+        td = decision["trading_decision"]
+        pm = decision["position_management"]
+        if not all(field in td for field in ["action", "confidence_level", "reason"]):
+            return False
+        if not all(field in pm for field in ["position_size", "stop_loss_price", "take_profit_price"]):
+            return False
+        if td["action"] not in ["hold", "open_long", "open_short"]:
+            return False
+        if td["confidence_level"] not in ["high", "medium", "low"]:
+            return False
+        return True
+    except Exception:
+        return False
+
+
+def _legacy_parse(response: str) -> Dict:
+    """原 DeepSeekAI._parse_ai_response 的解析路径（去掉日志），仅作基准对照"""
+    try:
+        decision = json.loads(response)
+        if _legacy_validate(decision):
+            return decision
+    except Exception:
+        pass
+    pattern = r'\{\s*"trading_decision"\s*:\s*\{[^{}]*\},\s*"position_management"\s*:\s*\{[^{}]*\}\s*\}'
+    for match in re.findall(pattern, response, re.DOTALL):
+        try:
+            json_str = re.sub(r'\s+', ' ', match.replace('\n', ' ').replace('\t', ' ')).strip()
+            decision = json.loads(json_str)
+            if _legacy_validate(decision):
+                return decision
+        except Exception:
+            continue
+    decision = decision_parser.default_hold_decision("", confidence_level="medium")
+    for p in [r'"action"\s*:\s*"(\w+)"', r'action["\']?\s*:\s*["\']?(\w+)', r'操作["\']?\s*:\s*["\']?(\w+)']:
+        m = re.search(p, response, re.IGNORECASE)
+        if m and m.group(1).lower() in ["hold", "open_long", "open_short"]:
+            decision["trading_decision"]["action"] = m.group(1).lower()
+            break
+    for p in [r'"reason"\s*:\s*"([^"]*)"', r'reason["\']?\s*:\s*["\']?([^"\']+)', r'理由["\']?\s*:\s*["\']?([^"\']+)']:
+        m = re.search(p, response, re.IGNORECASE)
+        if m and m.group(1).strip():
+            decision["trading_decision"]["reason"] = m.group(1).strip()
+            break
+    if not decision["trading_decision"]["reason"]:
+        decision["trading_decision"]["reason"] = decision_parser.DEFAULT_REASON
+    return decision
+
+
+def _raw_newline(response: str) -> str:
+    """在 reason 字符串中间插入未转义的换行（模型输出多行理由的常见形式）"""
+    m = re.search(r'"reason"\s*:\s*"([^"\\]{2,})', response)
+    if not m:
+        return response
+    mid = (m.start(1) + m.end(1)) // 2
+    return response[:mid] + "\n" + response[mid:]
+
+
+def _variants(corpus: List[str]) -> Dict[str, List[str]]:
+    """真实语料 + 常见的包裹形式（前后说明文字、markdown代码块、字符串内换行）"""
+    return {
+        "raw": corpus,
+        "prose": [f"根据以上分析，给出如下决策：\n{r}\n以上仅供参考。" for r in corpus],
+        "fenced": [f"```json\n{r}\n```" for r in corpus],
+        "multiline_reason": [_raw_newline(r) for r in corpus],
+    }
+
+
+def _same(legacy: Dict, new: Dict) -> bool:
+    """旧路径把换行等空白压缩为空格后再解析，reason 按压缩空白后比较"""
+    def norm(d: Dict) -> str:
+        d = json.loads(json.dumps(d))
+        td = d.get("trading_decision", {})
+        td["reason"] = re.sub(r"\s+", " ", str(td.get("reason", ""))).strip()
+        return json.dumps(d, sort_keys=True, ensure_ascii=False)
+    return norm(legacy) == norm(new)
+
+
+def _time_parser(fn, corpus: List[str], repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in corpus:
+            fn(text)
+    elapsed = time.perf_counter() - start
+    return elapsed / max(1, repeat * len(corpus)) * 1e6
+
+
+def run_benchmark(echo_path: str, repeat: int = 200) -> Dict:
+    corpus = decision_parser.load_echo_corpus(echo_path)
+    results = {"corpus_size": len(corpus), "repeat": repeat, "cases": {}}
+    if not corpus:
+        return results
+    for name, texts in _variants(corpus).items():
+        mismatches = sum(
+            1 for t in texts
+            if not _same(_legacy_parse(t), decision_parser.parse_decision(t)[0])
+        )
+        legacy_us = _time_parser(_legacy_parse, texts, repeat)
+        new_us = _time_parser(lambda t: decision_parser.parse_decision(t), texts, repeat)
+        results["cases"][name] = {
+            "legacy_us_per_response": round(legacy_us, 2),
+            "parser_us_per_response": round(new_us, 2),
+            "speedup": round(legacy_us / new_us, 2) if new_us > 0 else None,
+            "mismatches": mismatches,
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AI决策解析基准")
+    parser.add_argument("echo_file", nargs="?", default=os.path.join(os.path.dirname(__file__), "huixian.txt"))
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--json", action="store_true", help="输出JSON结果")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.echo_file, args.repeat)
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+    print(f"语料: {results['corpus_size']} 条AI原始响应, 每条重复 {results['repeat']} 次")
+    for name, r in results["cases"].items():
+        print(
+            f"{name:>7}: 旧流程 {r['legacy_us_per_response']:.1f}us, 新解析器 {r['parser_us_per_response']:.1f}us, "
+            f"加速 {r['speedup']}x, 结果不一致 {r['mismatches']} 条"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,558 @@
+"""端到端基准：决策周期各阶段耗时、db.py 查询吞吐、回测耗时与 Flask 接口并发吞吐。
+
+全部在本地完成：交易所与AI由 mock_servers.py 模拟，数据库与日志使用临时目录中的文件
+（app 在导入前经 ONLYDECIDE_DB 指向临时库）。decisions.db 与 huixian.txt 只作为行情回放、
+数据模板与解析/压缩样本被读取，不会写入。
+结果输出为JSON，可与之前某次提交的结果对比。
+
+用法:
+    python benchmark.py --output bench_results.json
+    python benchmark.py --db-sizes 10000,100000,1000000 --suites db     # 完整的百万行数据库基准
+    python benchmark.py --compare old.json --output new.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+import db  # noqa: E402
+import db_writer  # noqa: E402
+import decision_parser  # noqa: E402
+import mock_servers  # noqa: E402
+
+SUITES = ("pipeline", "parser", "db", "backtest", "api", "blobs")
+SYMBOL = "ETH-USDT-SWAP"
+
+
+def _percentiles(samples: List[float]) -> Dict:
+    """毫秒样本的统计摘要"""
+    if not samples:
+        return {"count": 0}
+    s = sorted(samples)
+    n = len(s)
+
+    def pct(p):
+        return round(s[min(n - 1, int(p * n))], 3)
+
+    return {
+        "count": n,
+        "mean_ms": round(sum(s) / n, 3),
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "max_ms": round(s[-1], 3),
+    }
+
+
+def _time_ms(fn: Callable, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return (time.perf_counter() - start) * 1000, result
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR,
+                             capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+# ==================== 合成数据 ====================
+def _sample_row_template() -> Dict:
+    """以真实数据库中的一行作为JSON大小模板；没有则用合成模板"""
+    real_db = os.path.join(BASE_DIR, "decisions.db")
+    try:
+        conn = sqlite3.connect(f"file:{real_db}?mode=ro", uri=True)
+        try:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute("SELECT * FROM decisions ORDER BY id DESC LIMIT 1").fetchone()
+            if row:
+                return {k: db.decode_blob(real_db, row[k]) for k in row.keys()}
+        finally:
+            conn.close()
+    except Exception:
+        pass
+    klines = [{"timestamp": "2025-11-10 14:00:00", "open": 3600.0, "high": 3610.0, "low": 3590.0,
+               "close": 3605.0, "volume": 1500.0}] * 6
+    md = {"current_price": 3605.0, "kline_5min": klines, "kline_30min": klines, "kline_2h": klines, "kline_1d": klines}
+    return {
+        "market_data_json": json.dumps(md, ensure_ascii=False),
+        "account_status_json": json.dumps({"available_OKX": 4.51, "total_equity": 4.52}),
+        "position_info_json": json.dumps({"position_side": "flat", "position_size": 0.0, "entry_price": 0.0, "leverage": 50}),
+        "raw_decision_json": "{}",
+        "reason": "基于多时间维度K线分析做出的决策",
+    }
+
+
+def populate_decisions(db_path: str, rows: int, symbols=(SYMBOL,), seed: int = 7, batch: int = 20000) -> None:
+    """批量写入合成决策（价格随机游走，动作与TP/SL合理），用于查询与回测基准"""
+    db.init_db(db_path)
+    tpl = _sample_row_template()
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    price = 3500.0
+    conn = sqlite3.connect(db_path)
+    try:
+        buf = []
+        for i in range(rows):
+            price = max(100.0, price * (1 + rng.gauss(0, 0.002)))
+            action = rng.choices(("hold", "open_long", "open_short"), (6, 2, 2))[0]
+            size = 0.1 if action != "hold" else 0.0
+            sign = 1 if action == "open_long" else -1
+            tp = round(price * (1 + 0.006 * sign), 2) if size else 0.0
+            sl = round(price * (1 - 0.004 * sign), 2) if size else 0.0
+            decision = {
+                "trading_decision": {"action": action, "confidence_level": rng.choice(("high", "medium", "low")),
+                                     "reason": tpl.get("reason") or ""},
+                "position_management": {"position_size": size, "stop_loss_price": sl, "take_profit_price": tp},
+            }
+            ts = start + timedelta(minutes=5 * i)
+            buf.append((
+                ts.isoformat(), symbols[i % len(symbols)], price, action,
+                decision["trading_decision"]["confidence_level"], decision["trading_decision"]["reason"],
+                size, sl, tp, tpl.get("market_data_json"), tpl.get("account_status_json"),
+                tpl.get("position_info_json"), json.dumps(decision, ensure_ascii=False), 0,
+                int(ts.timestamp() * 1000),
+            ))
+            if len(buf) >= batch:
+                _flush_rows(conn, buf)
+                buf = []
+        if buf:
+            _flush_rows(conn, buf)
+    finally:
+        conn.close()
+
+
+def _flush_rows(conn: sqlite3.Connection, buf: List[tuple]) -> None:
+    conn.executemany(
+        """
+        INSERT INTO decisions (
+            timestamp, symbol, current_price, action, confidence_level, reason,
+            position_size, stop_loss_price, take_profit_price,
+            market_data_json, account_status_json, position_info_json, raw_decision_json, executed, ts_ms
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        buf,
+    )
+    conn.commit()
+
+
+# ==================== 各项基准 ====================
+class _StageTimer:
+    """临时包装函数以统计各阶段耗时（仅在基准进程内生效）"""
+
+    def __init__(self):
+        self.current: Dict[str, float] = {}
+        self._patches = []
+
+    def wrap(self, owner, attr: str, stage: str):
+        original = getattr(owner, attr)
+
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.current[stage] = self.current.get(stage, 0.0) + (time.perf_counter() - start) * 1000
+
+        setattr(owner, attr, wrapper)
+        self._patches.append((owner, attr, original))
+
+    def restore(self):
+        for owner, attr, original in reversed(self._patches):
+            setattr(owner, attr, original)
+        self._patches = []
+
+
+def _import_app(tmp_dir: str):
+    """导入 app，数据库与日志文件使用 tmp_dir 中的文件
+
+    app 导入时即按数据库路径建立写线程、模拟账本与成本模型并开始写入，
+    因此路径与日志文件必须在首次导入之前设置；同一进程内各基准共用这一个 app 数据库。
+    """
+    import test as core
+    if "app" not in sys.modules:
+        os.environ["ONLYDECIDE_DB"] = os.path.join(tmp_dir, "app.db")
+        core.ECHO_FILE = os.path.join(tmp_dir, "huixian.txt")
+        core.ERROR_FILE = os.path.join(tmp_dir, "baocuo.txt")
+    import app as app_module
+    # 模拟账本导入时即从库中加载并补写权益快照，决策周期的开平仓也经它写回 sim_positions
+    for path in (app_module.DB_PATH, app_module.SIM_LEDGER.db_path):
+        if os.path.dirname(os.path.abspath(path)) != os.path.abspath(tmp_dir):
+            raise RuntimeError(f"app 已使用数据库 {path} 导入，基准必须在导入 app 之前设置临时库")
+    return app_module, core
+
+
+def _stop_app():
+    """删除临时目录前写回模拟账本并停止写线程（否则退出时的 atexit 写回指向已删除的文件）"""
+    app_module = sys.modules.get("app")
+    if app_module is not None:
+        app_module.SIM_LEDGER.stop()
+        app_module.DB_WRITER.stop()
+
+
+def bench_pipeline(tmp_dir: str, server: mock_servers.MockServer, cycles: int) -> Dict:
+    """决策周期分阶段耗时：采集、提示词构建、LLM、解析、写库、仿真"""
+    app_module, core = _import_app(tmp_dir)
+    server.point_clients(app_module.dc, app_module.ai)
+
+    timer = _StageTimer()
+    dc, ai = app_module.dc, app_module.ai
+    for attr in ("get_kline_data", "get_current_price", "get_account_balance", "get_position_info"):
+        timer.wrap(dc, attr, "collection")
+    timer.wrap(ai, "_build_prompt", "prompt_build")
+    timer.wrap(ai, "get_trading_decision", "ai_total")
+    timer.wrap(ai, "_parse_ai_response", "parse")
+    # 决策经写线程异步写库：周期内只计入入队耗时（db_insert），入队到提交完成的延迟另行统计
+    writer = app_module.DB_WRITER
+    submit = writer.insert_decision
+    commit_ms: List[float] = []
+
+    def insert_decision(*args, **kwargs):
+        start = time.perf_counter()
+        future = submit(*args, **kwargs)
+        future.add_done_callback(lambda _f: commit_ms.append((time.perf_counter() - start) * 1000))
+        return future
+
+    writer.insert_decision = insert_decision
+    timer.wrap(writer, "insert_decision", "db_insert")
+    timer.wrap(db, "get_recent_decisions", "history_read")
+    timer.wrap(app_module, "_apply_simulation", "simulation")
+
+    stages: Dict[str, List[float]] = {}
+    totals: List[float] = []
+    try:
+        for _ in range(cycles):
+            timer.current = {}
+            total_ms, _ = _time_ms(app_module.generate_and_store_ai_decision)
+            cur = dict(timer.current)
+            ai_total = cur.pop("ai_total", 0.0)
+            cur["llm"] = max(0.0, ai_total - cur.get("prompt_build", 0.0) - cur.get("parse", 0.0))
+            cur["other"] = max(0.0, total_ms - sum(cur.values()))
+            for k, v in cur.items():
+                stages.setdefault(k, []).append(v)
+            totals.append(total_ms)
+        writer.flush()
+    finally:
+        timer.restore()
+        del writer.insert_decision
+    return {
+        "cycles": cycles,
+        "cycle": _percentiles(totals),
+        "stages": {k: _percentiles(v) for k, v in sorted(stages.items())},
+        "db_commit": _percentiles(commit_ms),
+    }
+
+
+def bench_parser(repeat: int) -> Dict:
+    import bench_parser
+    return bench_parser.run_benchmark(os.path.join(BASE_DIR, "huixian.txt"), repeat)
+
+
+def bench_db(tmp_dir: str, sizes: List[int], queries: int) -> Dict:
+    """db.py 常用查询在不同数据量下的耗时/吞吐"""
+    results = {}
+    for n in sizes:
+        db_path = os.path.join(tmp_dir, f"db_{n}.db")
+        load_ms, _ = _time_ms(populate_decisions, db_path, n)
+        out = {"rows": n, "populate_ms": round(load_ms, 1),
+               "file_mb": round(os.path.getsize(db_path) / 1024 / 1024, 2)}
+        cases = {
+            "get_recent_decisions": lambda: db.get_recent_decisions(db_path, symbol=SYMBOL, limit=10),
+            "get_decisions_paginated_p1": lambda: db.get_decisions_paginated(db_path, SYMBOL, 1, 20),
+            "get_decisions_paginated_deep": lambda: db.get_decisions_paginated(db_path, SYMBOL, max(1, n // 40), 20),
+            "sim_get_open_position": lambda: db.sim_get_open_position(db_path, symbol=SYMBOL),
+            # reason 全文搜索（trigram 索引）：命中大量行时取最近 20 条，以及无命中的词
+            "search_decisions_common": lambda: db.search_decisions(db_path, "K线分析", symbol=SYMBOL,
+                                                                   actions=["open_long"], limit=20),
+            "search_decisions_miss": lambda: db.search_decisions(db_path, "黄金交叉", symbol=SYMBOL, limit=20),
+            # 全部历史的统计（读取汇总表）
+            "decision_stats_all": lambda: db.decision_stats(db_path, bucket="day"),
+        }
+        for name, fn in cases.items():
+            samples = [_time_ms(fn)[0] for _ in range(queries)]
+            stats = _percentiles(samples)
+            stats["qps"] = round(1000.0 / stats["mean_ms"], 1) if stats.get("mean_ms") else None
+            out[name] = stats
+        # 全量读取（导出/回测路径），只跑一次
+        out["get_all_decisions"] = _percentiles([_time_ms(db.get_all_decisions, db_path, SYMBOL)[0]])
+        # 时间窗口读取（最近约一天的决策，索引范围扫描）
+        last_ms = db.get_recent_decisions(db_path, symbol=SYMBOL, limit=1)[0]["ts_ms"]
+        out["get_decisions_range_1d"] = _percentiles([
+            _time_ms(db.get_decisions_range, db_path, SYMBOL, last_ms - 86400000, None, None, True)[0]
+            for _ in range(queries)
+        ])
+        # 单条写入吞吐
+        md = {"current_price": 3500.0}
+        decision = decision_parser.default_hold_decision("bench")
+        insert_samples = [
+            _time_ms(db.insert_decision, db_path, SYMBOL, md, {}, {}, decision)[0] for _ in range(queries)
+        ]
+        stats = _percentiles(insert_samples)
+        stats["rows_per_s"] = round(1000.0 / stats["mean_ms"], 1) if stats.get("mean_ms") else None
+        out["insert_decision"] = stats
+        # 经写线程批量写入（每批一个事务），按 rows/s 与逐条同步写入对比
+        writer = db_writer.DBWriter(db_path, wal=False).start()
+        ms, futures = _time_ms(lambda: [writer.insert_decision(SYMBOL, md, {}, {}, decision) for _ in range(queries)])
+        flush_ms, _ = _time_ms(lambda: [f.result() for f in futures])
+        writer.stop()
+        total_ms = ms + flush_ms
+        out["db_writer_insert_decision"] = {"rows": queries, "total_ms": round(total_ms, 2),
+                                            "rows_per_s": round(queries * 1000.0 / total_ms, 1) if total_ms else None,
+                                            "batches": writer.batches}
+        results[str(n)] = out
+        os.remove(db_path)
+    return results
+
+
+def bench_backtest(tmp_dir: str, lengths: List[int]) -> Dict:
+    """回测耗时随历史长度的变化"""
+    db_path = os.path.join(tmp_dir, "backtest.db")
+    app_module, _core = _import_app(tmp_dir)
+    results = {}
+    for n in lengths:
+        if os.path.exists(db_path):
+            os.remove(db_path)
+        populate_decisions(db_path, n)
+        ms, (metrics, trades, _curve) = _time_ms(
+            app_module.simulate_backtest_history, db_path, SYMBOL, 10000.0, 0.0005
+        )
+        results[str(n)] = {"rows": n, "runtime_ms": round(ms, 2), "trades": len(trades),
+                           "us_per_row": round(ms * 1000 / max(1, n), 3)}
+    return results
+
+
+def bench_blobs(sample_rows: int, repeat: int) -> Dict:
+    """JSON 字段压缩：文本 / deflate / deflate+共享字典 的存储大小与编解码耗时
+
+    样本取自 decisions.db（只读）：较早的一半用于生成字典，较新的一半用于测量，
+    模拟字典生成之后写入的新数据。
+    """
+    real_db = os.path.join(BASE_DIR, "decisions.db")
+    texts: List[str] = []
+    try:
+        conn = sqlite3.connect(f"file:{real_db}?mode=ro", uri=True)
+        try:
+            cols = ", ".join(db._BLOB_COLUMNS)
+            for row in conn.execute(f"SELECT {cols} FROM decisions ORDER BY id DESC LIMIT ?", (sample_rows,)):
+                texts.extend(db.decode_blob(real_db, v) for v in row if v)
+        finally:
+            conn.close()
+    except Exception:
+        pass
+    texts.reverse()
+    if len(texts) < 8:
+        tpl = _sample_row_template()
+        texts = [tpl[c] for _ in range(sample_rows) for c in db._BLOB_COLUMNS if tpl.get(c)]
+    half = len(texts) // 2
+    train, test = texts[:half], texts[half:]
+    codecs = {"text": None, "deflate": (0, b""), "deflate_dict": (1, db.build_blob_dictionary(train))}
+    raw_bytes = sum(len(t.encode("utf-8")) for t in test)
+    results: Dict = {"blobs": len(test), "dict_bytes": len(codecs["deflate_dict"][1])}
+    for name, codec in codecs.items():
+        encode_ms, stored = _time_ms(lambda: [db.encode_blob(t, codec) if codec else t for t in test])
+        zdict = codec[1] if codec else b""
+        # 解码计时包含 json.loads（读取路径的完整开销）
+        decode_samples = [
+            _time_ms(lambda: [json.loads(db.decompress_blob(v, zdict) if isinstance(v, bytes) else v)
+                              for v in stored])[0]
+            for _ in range(repeat)
+        ]
+        size = sum(len(v) if isinstance(v, bytes) else len(v.encode("utf-8")) for v in stored)
+        results[name] = {
+            "bytes": size,
+            "ratio": round(size / raw_bytes, 4) if raw_bytes else None,
+            "encode_us_per_blob": round(encode_ms * 1000 / max(1, len(test)), 2),
+            "decode_us_per_blob": round(_percentiles(decode_samples)["p50_ms"] * 1000 / max(1, len(test)), 2),
+        }
+    return results
+
+
+def bench_api(tmp_dir: str, rows: int, clients: int, requests_per_client: int) -> Dict:
+    """Flask 接口在并发客户端下的吞吐与延迟"""
+    import requests
+    from werkzeug.serving import make_server
+
+    app_module, core = _import_app(tmp_dir)
+    populate_decisions(app_module.DB_PATH, rows)
+    # 日志接口读取的是回显/错误文件，准备一份与真实体量相当的文件
+    src_echo = os.path.join(BASE_DIR, "huixian.txt")
+    if os.path.exists(src_echo):
+        shutil.copyfile(src_echo, core.ECHO_FILE)
+
+    httpd = make_server("127.0.0.1", 0, app_module.app, threaded=True)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    base = f"http://127.0.0.1:{httpd.server_port}"
+    endpoints = {
+        "/api/decision_history": f"{base}/api/decision_history?symbol={SYMBOL}&page=1&page_size=20",
+        "/api/logs": f"{base}/api/logs",
+        "/api/backtest": f"{base}/api/backtest?symbol={SYMBOL}&fee_rate=0.0005",
+    }
+    results = {}
+    try:
+        for name, url in endpoints.items():
+            samples: List[float] = []
+            errors = [0]
+            lock = threading.Lock()
+
+            def worker():
+                session = requests.Session()
+                local = []
+                for _ in range(requests_per_client):
+                    start = time.perf_counter()
+                    try:
+                        resp = session.get(url, timeout=60)
+                        ok = resp.status_code == 200
+                    except Exception:
+                        ok = False
+                    local.append((time.perf_counter() - start) * 1000)
+                    if not ok:
+                        with lock:
+                            errors[0] += 1
+                with lock:
+                    samples.extend(local)
+
+            wall_start = time.perf_counter()
+            threads = [threading.Thread(target=worker) for _ in range(clients)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            wall = time.perf_counter() - wall_start
+            stats = _percentiles(samples)
+            stats["rps"] = round(len(samples) / wall, 1) if wall > 0 else None
+            stats["errors"] = errors[0]
+            results[name] = stats
+    finally:
+        httpd.shutdown()
+    return {"rows": rows, "clients": clients, "requests_per_client": requests_per_client, "endpoints": results}
+
+
+# ==================== 结果对比 ====================
+def _flatten(obj, prefix="") -> Dict[str, float]:
+    out = {}
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            out.update(_flatten(v, f"{prefix}.{k}" if prefix else str(k)))
+    elif isinstance(obj, (int, float)) and not isinstance(obj, bool):
+        out[prefix] = float(obj)
+    return out
+
+
+def compare_results(old: Dict, new: Dict, threshold: float = 0.10) -> List[str]:
+    """对比两次结果中的耗时类指标（*_ms / *_us*），列出变化超过阈值的项"""
+    a = _flatten(old.get("results", {}))
+    b = _flatten(new.get("results", {}))
+    lines = []
+    for key in sorted(set(a) & set(b)):
+        if not (key.endswith("_ms") or "_us" in key.rsplit(".", 1)[-1]):
+            continue
+        if a[key] <= 0:
+            continue
+        change = (b[key] - a[key]) / a[key]
+        if abs(change) >= threshold:
+            tag = "变慢" if change > 0 else "变快"
+            lines.append(f"{tag} {change * 100:+.1f}%  {key}: {a[key]:.3f} -> {b[key]:.3f}")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="onlyDecide 端到端基准")
+    parser.add_argument("--suites", default=",".join(SUITES), help=f"逗号分隔，可选: {','.join(SUITES)}")
+    parser.add_argument("--cycles", type=int, default=20, help="决策周期基准的循环次数")
+    parser.add_argument("--llm-latency", default="fixed:5", help="模拟LLM延迟分布，如 lognormal:1500,0.4")
+    parser.add_argument("--okx-latency", default="fixed:2", help="模拟OKX延迟分布")
+    parser.add_argument("--db-sizes", default="10000,100000", help="数据库基准的行数列表")
+    parser.add_argument("--db-queries", type=int, default=50, help="每种查询的重复次数")
+    parser.add_argument("--backtest-lengths", default="1000,10000,50000")
+    parser.add_argument("--api-rows", type=int, default=10000)
+    parser.add_argument("--api-clients", type=int, default=8)
+    parser.add_argument("--api-requests", type=int, default=25, help="每个客户端的请求数")
+    parser.add_argument("--parser-repeat", type=int, default=100)
+    parser.add_argument("--blob-rows", type=int, default=2000, help="压缩基准从 decisions.db 读取的行数")
+    parser.add_argument("--output", help="结果JSON输出路径（默认打印到标准输出）")
+    parser.add_argument("--compare", help="与之前的结果JSON对比")
+    args = parser.parse_args()
+
+    suites = [s.strip() for s in args.suites.split(",") if s.strip()]
+    import logging
+    # 控制台日志会淹没结果，这里只保留警告以上
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    tmp_dir = tempfile.mkdtemp(prefix="onlydecide_bench_")
+    results: Dict = {}
+    try:
+        if "pipeline" in suites:
+            server = mock_servers.MockServer(
+                market=mock_servers.MarketReplay.from_db(os.path.join(BASE_DIR, "decisions.db")),
+                llm=mock_servers.MockLLM(decision_parser.load_echo_corpus(os.path.join(BASE_DIR, "huixian.txt"))),
+            )
+            server.configure("default", latency=args.okx_latency)
+            server.configure("chat", latency=args.llm_latency)
+            with server:
+                results["pipeline"] = bench_pipeline(tmp_dir, server, args.cycles)
+        if "parser" in suites:
+            results["parser"] = bench_parser(args.parser_repeat)
+        if "db" in suites:
+            sizes = [int(x) for x in args.db_sizes.split(",") if x.strip()]
+            results["db"] = bench_db(tmp_dir, sizes, args.db_queries)
+        if "backtest" in suites:
+            lengths = [int(x) for x in args.backtest_lengths.split(",") if x.strip()]
+            results["backtest"] = bench_backtest(tmp_dir, lengths)
+        if "api" in suites:
+            results["api"] = bench_api(tmp_dir, args.api_rows, args.api_clients, args.api_requests)
+        if "blobs" in suites:
+            results["blobs"] = bench_blobs(args.blob_rows, args.db_queries)
+    finally:
+        _stop_app()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    output = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    text = json.dumps(output, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"基准结果已写入: {args.output}")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            old = json.load(f)
+        lines = compare_results(old, output)
+        print(f"对比 {old.get('meta', {}).get('commit')} -> {output['meta']['commit']}:")
+        for line in lines or ["无显著变化"]:
+            print("  " + line)
+
+
+if __name__ == "__main__":
+    main()
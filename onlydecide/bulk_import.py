@@ -0,0 +1,166 @@
+"""批量导入历史决策：新部署初始化、从导出文件或其他实例迁移数据。
+
+支持的输入（按扩展名识别，也可用 --format 指定）：
+- csv：/api/decision_history/export 导出的 CSV（如 exported_history.csv，带 BOM），
+  或任何包含 symbol、timestamp 等同名列的 CSV；
+- json：/api/decision_history/export?format=json 的响应（{"data": [...]}）或记录数组；
+- jsonl / jsonl.gz：每行一条记录，包括 archive.py 生成的按月归档文件（含完整 JSON 字段）。
+
+导入的行使用新的 id。按 (symbol, 毫秒时间) 去重：库中已有或同一批输入中先出现过的记录跳过；
+缺少交易对或时间无法解析的记录计为无效。
+
+默认在一个事务内先删除 decisions 的二级索引与触发器，用 executemany 写入后再重建，并一次性补写
+全文索引与统计汇总（见 db.bulk_insert_decisions）；导入期间程序的写入会等待，适合停机或初始化时执行。
+程序运行中导入少量数据时使用 --online：保留索引与触发器，每批一个事务。
+
+JSON 字段压缩已启用时，导入的 JSON 字段按当前字典压缩；导入的数据早于保留期时由归档任务照常归档。
+
+用法:
+    python bulk_import.py exported_history.csv
+    python bulk_import.py decisions_archive/decisions-2025-*.jsonl.gz --batch-size 100000
+    python bulk_import.py history.json --online
+"""
+
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+import db
+
+
+def detect_format(path: str) -> str:
+    name = path.lower()
+    if name.endswith(".gz"):
+        name = name[:-3]
+    for fmt in ("csv", "jsonl", "json"):
+        if name.endswith("." + fmt):
+            return fmt
+    raise ValueError(f"无法识别文件格式，请用 --format 指定: {path}")
+
+
+def _open_text(path: str) -> io.TextIOBase:
+    # utf-8-sig 去掉导出 CSV 开头的 BOM
+    if path.lower().endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8-sig", newline="")
+    return open(path, "r", encoding="utf-8-sig", newline="")
+
+
+def read_records(path: str, fmt: Optional[str] = None) -> Iterator[Dict]:
+    """逐条读取输入文件中的记录（字典）"""
+    fmt = fmt or detect_format(path)
+    with _open_text(path) as f:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+        elif fmt == "jsonl":
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        elif fmt == "json":
+            data = json.load(f)
+            if isinstance(data, dict):
+                data = data.get("data") or []
+            yield from data
+        else:
+            raise ValueError(f"不支持的格式: {fmt}")
+
+
+class ImportStats:
+    """导入进度：读取、写入、重复与无效的行数"""
+
+    def __init__(self):
+        self.read = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.started = time.perf_counter()
+
+    def rate(self) -> float:
+        elapsed = time.perf_counter() - self.started
+        return self.read / elapsed if elapsed > 0 else 0.0
+
+    def as_dict(self) -> Dict:
+        return {
+            "read": self.read,
+            "inserted": self.inserted,
+            "duplicates": self.duplicates,
+            "invalid": self.invalid,
+            "seconds": round(time.perf_counter() - self.started, 2),
+            "rows_per_s": round(self.rate(), 1),
+        }
+
+
+def _batches(db_path: str, records: Iterable[Dict], batch_size: int, stats: ImportStats) -> Iterator[List[tuple]]:
+    """转换并去重，按 batch_size 分批；每个交易对已有的时间在首次出现时从库中读取"""
+    seen: Dict[str, set] = {}
+    batch: List[tuple] = []
+    for record in records:
+        stats.read += 1
+        row = db.import_decision_row(db_path, record)
+        if row is None:
+            stats.invalid += 1
+            continue
+        symbol, ts_ms = row[1], row[-1]
+        keys = seen.get(symbol)
+        if keys is None:
+            keys = seen[symbol] = db.decision_time_keys(db_path, symbol)
+        if ts_ms in keys:
+            stats.duplicates += 1
+            continue
+        keys.add(ts_ms)
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def import_files(db_path: str, paths: List[str], fmt: Optional[str] = None, batch_size: int = 50000,
+                 rebuild_indexes: bool = True,
+                 progress: Optional[Callable[[ImportStats], None]] = None) -> ImportStats:
+    """导入多个文件（作为一次导入），返回统计；progress 在每批写入后调用"""
+    db.init_db(db_path)
+    stats = ImportStats()
+
+    def records() -> Iterator[Dict]:
+        for path in paths:
+            yield from read_records(path, fmt)
+
+    def on_batch(n: int):
+        stats.inserted += n
+        if progress:
+            progress(stats)
+
+    db.bulk_insert_decisions(db_path, _batches(db_path, records(), batch_size, stats),
+                             rebuild_indexes=rebuild_indexes, on_batch=on_batch)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量导入历史决策（CSV / JSON / JSONL，支持 .gz）")
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--db", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "decisions.db"))
+    parser.add_argument("--format", choices=("csv", "json", "jsonl"), help="默认按扩展名识别")
+    parser.add_argument("--batch-size", type=int, default=50000, help="每次 executemany 的行数")
+    parser.add_argument("--online", action="store_true", help="保留索引与触发器、每批一个事务（程序运行时导入）")
+    args = parser.parse_args()
+
+    def report(stats: ImportStats):
+        print(f"已读取 {stats.read} 行，写入 {stats.inserted}，重复 {stats.duplicates}，无效 {stats.invalid}，"
+              f"{stats.rate():.0f} 行/秒", file=sys.stderr)
+
+    stats = import_files(args.db, args.files, fmt=args.format, batch_size=args.batch_size,
+                         rebuild_indexes=not args.online, progress=report)
+    if not args.online:
+        print("索引与触发器已重建", file=sys.stderr)
+    print(json.dumps(stats.as_dict(), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
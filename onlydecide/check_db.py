@@ -1,28 +1,431 @@
+"""数据库诊断：结构与迁移状态、表/索引占用、碎片、WAL 大小、db.py 各查询的执行计划与耗时。
+
+执行计划与耗时来自真实调用：以只读方式打开数据库，按常用场景（最近决策、分页、时间范围、回测/导出、
+全文搜索、统计、模拟持仓、权益曲线、归档等）调用 db.py 的读取函数，记录它们实际执行的 SQL，
+对每条语句做 EXPLAIN QUERY PLAN，标出全表扫描（SCAN 表且未使用索引）与临时B树排序/分组
+（USE TEMP B-TREE）。行数少于 --min-rows 的表扫描不计；本来就要扫描或聚合的场景（短词搜索、统计）
+只标注不计为问题，批量读取（回测、导出、归档计数等）也不受 --max-ms 限制。
+诊断本身不写入数据库；发现问题（未应用的迁移、非预期的扫描或超过 --max-ms 的查询）时以退出码 1 结束，
+可放在部署或定期任务中及早发现数据层的性能退化。
+
+--fix 会修改数据库，建议在程序停止时执行：
+- db.init_db：补齐缺少的表与索引、应用尚未执行的迁移，并完成迁移的数据回填；
+- 按 db.init_db 新建库的结构补回缺少的索引（迁移已应用后被删除的索引 init_db 不会重建）；
+- ANALYZE：更新查询规划器使用的统计信息；
+- WAL 模式下 checkpoint 并截断 WAL 文件；
+- 空闲页比例超过 --vacuum-threshold（或指定 --vacuum）时 VACUUM（期间阻塞写入）。
+
+用法:
+    python check_db.py
+    python check_db.py --db /path/to/decisions.db --repeat 5 --max-ms 100
+    python check_db.py --json > report.json
+    python check_db.py --fix
+"""
+
+import argparse
+import json
+import os
+import re
 import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple
+from urllib.request import pathname2url
+
+import db
+
+DEFAULT_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "decisions.db")
+_DAY_MS = 86400 * 1000
+
+
+def _connect_ro(db_path: str, **kwargs) -> sqlite3.Connection:
+    return sqlite3.connect("file:" + pathname2url(os.path.abspath(db_path)) + "?mode=ro", uri=True, **kwargs)
 
-def check_database_structure():
+
+def check_database_structure(db_path: str = DEFAULT_DB):
+    """打印 decisions 表结构与迁移状态，返回是否存在 executed 列"""
     try:
-        conn = sqlite3.connect('decisions.db')
+        conn = _connect_ro(db_path)
         cur = conn.cursor()
-        
+
         # 检查表结构
         cur.execute('PRAGMA table_info(decisions)')
         columns = cur.fetchall()
-        
+
         print("数据库字段结构:")
         for col in columns:
             print(f"字段 {col[1]}: 类型 {col[2]}, 允许空值: {col[3]}, 默认值: {col[4]}")
-        
+
         # 检查是否有executed字段
         executed_exists = any(col[1] == 'executed' for col in columns)
         print(f"\n是否存在executed字段: {executed_exists}")
-        
+
         conn.close()
+
+        # 结构迁移状态（executed 等字段由 db.init_db 的迁移自动补齐）
+        print("\n结构迁移:")
+        for m in db.schema_status(db_path):
+            if m['applied_at'] is None:
+                state = "未应用"
+            elif m['completed_at']:
+                state = "已完成"
+            else:
+                state = f"回填中 {m['backfill_cursor']}/{m['backfill_until']}"
+            print(f"v{m['version']} {m['name']}: {state}")
         return executed_exists
-        
+
     except Exception as e:
         print(f"检查数据库时出错: {e}")
         return False
 
+
+# ==================== 存储 ====================
+def storage_report(db_path: str) -> Dict:
+    """文件与 WAL 大小、空闲页比例，以及各表/索引的页数、字节数与填充率（需要 DBSTAT 虚拟表）"""
+    conn = _connect_ro(db_path)
+    try:
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        wal_path = db_path + "-wal"
+        out = {
+            "file_bytes": os.path.getsize(db_path),
+            "page_size": page_size,
+            "page_count": page_count,
+            "freelist_pages": freelist,
+            "freelist_ratio": round(freelist / page_count, 4) if page_count else 0.0,
+            "journal_mode": conn.execute("PRAGMA journal_mode").fetchone()[0],
+            "wal_bytes": os.path.getsize(wal_path) if os.path.exists(wal_path) else 0,
+            "objects": [],
+        }
+        kinds = {name: kind for kind, name in conn.execute("SELECT type, name FROM sqlite_master")}
+        try:
+            rows = conn.execute(
+                "SELECT name, COUNT(*), SUM(pgsize), SUM(unused) FROM dbstat GROUP BY name ORDER BY 3 DESC"
+            ).fetchall()
+        except sqlite3.OperationalError:
+            # 未编译 DBSTAT 时只报告文件级信息
+            rows = []
+        for name, pages, size, unused in rows:
+            out["objects"].append({
+                "name": name,
+                "type": kinds.get(name, "internal"),
+                "pages": pages,
+                "bytes": size,
+                "fill": round(1 - unused / size, 3) if size else None,
+            })
+        return out
+    finally:
+        conn.close()
+
+
+def missing_indexes(db_path: str) -> List[Tuple[str, str]]:
+    """与 db.init_db 新建的库相比缺少的索引 [(名称, CREATE 语句)]（迁移已应用后被删除的索引不会自动补回）"""
+    with tempfile.TemporaryDirectory() as tmp:
+        ref_path = os.path.join(tmp, "reference.db")
+        db.init_db(ref_path)
+        ref = sqlite3.connect(ref_path)
+        try:
+            expected = ref.execute(
+                "SELECT name, tbl_name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL ORDER BY name"
+            ).fetchall()
+        finally:
+            ref.close()
+    conn = _connect_ro(db_path)
+    try:
+        existing = {name: kind for kind, name in conn.execute("SELECT type, name FROM sqlite_master")}
+    finally:
+        conn.close()
+    return [(name, sql) for name, table, sql in expected if name not in existing and existing.get(table) == "table"]
+
+
+# ==================== 查询计划与耗时 ====================
+class _TracingSqlite:
+    """替换 db 模块中的 sqlite3：连接一律以只读方式打开，并记录执行的 SQL（参数已展开）"""
+
+    def __init__(self, statements: List[str]):
+        self._statements = statements
+
+    def __getattr__(self, name):
+        return getattr(sqlite3, name)
+
+    def connect(self, database, *args, **kwargs):
+        kwargs.pop("uri", None)
+        conn = _connect_ro(database, *args, **kwargs)
+        conn.set_trace_callback(self._statements.append)
+        return conn
+
+
+@contextmanager
+def _trace_db(statements: List[str]):
+    original = db.sqlite3
+    db.sqlite3 = _TracingSqlite(statements)
+    try:
+        yield
+    finally:
+        db.sqlite3 = original
+
+
+def _sample_params(db_path: str) -> Dict:
+    """诊断调用使用的参数：决策最多的交易对与最新时间"""
+    conn = _connect_ro(db_path)
+    try:
+        row = conn.execute(
+            "SELECT symbol, COUNT(*) FROM decisions GROUP BY symbol ORDER BY 2 DESC LIMIT 1"
+        ).fetchone()
+        latest = conn.execute("SELECT MAX(ts_ms) FROM decisions").fetchone()[0]
+    finally:
+        conn.close()
+    return {"symbol": row[0] if row else "ETH-USDT-SWAP", "latest": latest or int(time.time() * 1000)}
+
+
+# 场景的预期：普通查询 / 预期扫描或临时B树（不计执行计划问题）/ 批量读取（也不计耗时）
+NORMAL, SCAN, BULK = "", "scan", "bulk"
+
+
+def workloads(p: Dict) -> List[Tuple[str, Callable[[str], object], str]]:
+    """(场景, 调用, 预期)"""
+    sym, latest = p["symbol"], p["latest"]
+    return [
+        ("最近决策", lambda path: db.get_recent_decisions(path, symbol=sym, limit=10), NORMAL),
+        ("分页首页", lambda path: db.get_decisions_paginated(path, sym, 1, 20), NORMAL),
+        ("分页第50页", lambda path: db.get_decisions_paginated(path, sym, 50, 20), NORMAL),
+        ("最近一天", lambda path: db.get_decisions_range(path, sym, latest - _DAY_MS, None), NORMAL),
+        ("回测读取", lambda path: db.get_decisions_range(path, sym, ascending=True, blobs=False), BULK),
+        ("导出全部", lambda path: db.get_decisions_range(path, blobs=False), BULK),
+        ("全文搜索", lambda path: db.search_decisions(path, "RSI", limit=50), NORMAL),
+        ("短词搜索", lambda path: db.search_decisions(path, "阻力", symbol=sym, limit=50), SCAN),
+        ("统计-全部", lambda path: db.decision_stats(path), SCAN),
+        ("统计-7天", lambda path: db.decision_stats(path, start_ms=latest - 7 * _DAY_MS), SCAN),
+        ("模拟持仓", lambda path: db.sim_get_open_position(path, symbol=sym), NORMAL),
+        ("未平仓列表", lambda path: db.sim_list_open_positions(path), NORMAL),
+        ("持仓历史", lambda path: db.sim_list_positions(path, symbol=sym, limit=50), NORMAL),
+        ("持仓时间范围", lambda path: db.sim_positions_range(path, sym, latest - 7 * _DAY_MS), NORMAL),
+        ("加载账本", lambda path: db.sim_ledger_state(path), BULK),
+        ("权益曲线", lambda path: db.get_equity_snapshots(path, "*", max_points=500), NORMAL),
+        ("盘口快照", lambda path: db.get_orderbook_snapshots(path, sym, since_ts=latest - _DAY_MS), NORMAL),
+        ("资金费率", lambda path: db.get_funding_rates(path, sym), NORMAL),
+        ("待归档", lambda path: db.decisions_for_archive(path, latest - 90 * _DAY_MS, limit=500), NORMAL),
+        ("归档计数", lambda path: db.archive_counts(path), BULK),
+        ("导入去重键", lambda path: db.decision_time_keys(path, sym), BULK),
+    ]
+
+
+def _normalize(sql: str) -> str:
+    return re.sub(r"\s+", " ", sql).strip()
+
+
+# 系统表与全文索引内部表的扫描不计入（读取结构、FTS 配置）
+_INTERNAL_SCAN = re.compile(r"SCAN (main\.)?(sqlite_\w+|\w+_fts_\w+)\b")
+
+
+def _plan_flags(plan: List[str], small_table: Callable[[str], bool]) -> List[str]:
+    """执行计划中的问题；只涉及小表的扫描与临时B树不计"""
+    tables = [m.group(1) for m in (re.match(r"(?:SCAN|SEARCH) (?:main\.)?(\S+)", d) for d in plan) if m]
+    only_small = bool(tables) and all(small_table(t) for t in tables)
+    flags = []
+    for detail in plan:
+        if _INTERNAL_SCAN.match(detail) or only_small:
+            continue
+        if detail.startswith("SCAN ") and "VIRTUAL TABLE" not in detail and "USING" not in detail:
+            if small_table(detail.split()[1]):
+                continue
+            flags.append(f"全表扫描: {detail}")
+        elif "USE TEMP B-TREE" in detail:
+            flags.append(f"临时B树: {detail}")
+    return flags
+
+
+def query_report(db_path: str, repeat: int = 3, max_ms: float = 50.0, min_rows: int = 10000) -> List[Dict]:
+    """逐个场景调用 db.py，记录耗时中位数、执行的 SQL 与执行计划"""
+    params = _sample_params(db_path)
+    plan_conn = _connect_ro(db_path)
+    tables = {name for (name,) in plan_conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    row_counts: Dict[str, int] = {}
+
+    def small_table(name: str) -> bool:
+        # 别名（如 decisions d）无法确定行数，按大表处理
+        if name not in tables:
+            return False
+        if name not in row_counts:
+            row_counts[name] = plan_conn.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0]
+        return row_counts[name] < min_rows
+
+    results = []
+    try:
+        for name, call, expected in workloads(params):
+            statements: List[str] = []
+            timings = []
+            error = None
+            with _trace_db(statements):
+                for i in range(max(1, repeat)):
+                    started = time.perf_counter()
+                    try:
+                        call(db_path)
+                    except Exception as e:
+                        error = str(e)
+                        break
+                    timings.append((time.perf_counter() - started) * 1000)
+                    if i == 0:
+                        # 只分析第一次调用的语句
+                        first = list(statements)
+            queries, seen = [], set()
+            for sql in (first if timings else statements):
+                text = _normalize(sql)
+                if text in seen or not re.match(r"(?i)(SELECT|WITH)\b", text):
+                    continue
+                seen.add(text)
+                try:
+                    plan = [r[3] for r in plan_conn.execute("EXPLAIN QUERY PLAN " + sql)]
+                except sqlite3.Error as e:
+                    plan = [f"无法分析: {e}"]
+                queries.append({"sql": text if len(text) <= 300 else text[:297] + "...",
+                                "plan": plan, "flags": _plan_flags(plan, small_table)})
+            ms = round(statistics.median(timings), 2) if timings else None
+            problems = []
+            if error:
+                problems.append(f"调用失败: {error}")
+            if ms is not None and ms > max_ms and expected != BULK:
+                problems.append(f"耗时 {ms}ms 超过 {max_ms}ms")
+            if expected == NORMAL:
+                problems.extend(f for q in queries for f in q["flags"])
+            results.append({"name": name, "median_ms": ms, "expected": expected,
+                            "queries": queries, "problems": problems})
+    finally:
+        plan_conn.close()
+    return results
+
+
+# ==================== 修复 ====================
+def fix(db_path: str, vacuum: bool = False, vacuum_threshold: float = 0.2) -> List[str]:
+    """补齐索引与迁移、ANALYZE、截断 WAL，碎片较多时 VACUUM；返回执行的操作"""
+    actions = []
+
+    def objects():
+        # 只统计显式创建的表/索引/触发器（自动索引没有 sql，不能也不需要单独创建）
+        conn = sqlite3.connect(db_path)
+        try:
+            return {(kind, name) for kind, name in conn.execute(
+                "SELECT type, name FROM sqlite_master WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%'")}
+        finally:
+            conn.close()
+
+    before = objects()
+    applied = {m["version"] for m in db.schema_status(db_path) if m["applied_at"] is not None}
+    db.init_db(db_path)
+    migrated = [f"v{m['version']} {m['name']}" for m in db.schema_status(db_path)
+                if m["applied_at"] is not None and m["version"] not in applied]
+    if migrated:
+        actions.append(f"应用迁移: {', '.join(migrated)}")
+    created = sorted(objects() - before)
+    labels = {"table": "表", "index": "索引", "trigger": "触发器", "view": "视图"}
+    for kind in labels:
+        names = [name for k, name in created if k == kind]
+        if names:
+            actions.append(f"init_db 创建{labels[kind]}: {', '.join(names)}")
+    rows = db.run_backfills(db_path, batch_size=5000)
+    if rows:
+        actions.append(f"完成迁移回填: {rows} 行")
+    # 迁移之后再比较：索引可能依赖迁移新增的列；这里只补回 init_db 不会重建的索引（迁移已应用后被删除的）
+    conn = sqlite3.connect(db_path)
+    try:
+        for name, sql in missing_indexes(db_path):
+            conn.execute(sql)
+            conn.commit()
+            actions.append(f"创建索引 {name}")
+        conn.execute("ANALYZE")
+        conn.commit()
+        actions.append("ANALYZE")
+        if conn.execute("PRAGMA journal_mode").fetchone()[0].lower() == "wal":
+            busy, log, done = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+            actions.append(f"WAL checkpoint: {done}/{log} 页" + ("（有读取进行中，未能截断）" if busy else ""))
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    finally:
+        conn.close()
+    ratio = freelist / page_count if page_count else 0.0
+    if vacuum or ratio >= vacuum_threshold:
+        size = os.path.getsize(db_path)
+        db.vacuum(db_path)
+        actions.append(f"VACUUM: {size / 1e6:.1f}MB -> {os.path.getsize(db_path) / 1e6:.1f}MB（空闲页 {ratio:.1%}）")
+    return actions
+
+
+# ==================== 输出 ====================
+def _print_storage(s: Dict):
+    print(f"\n存储: 文件 {s['file_bytes'] / 1e6:.1f}MB，页大小 {s['page_size']}，{s['page_count']} 页，"
+          f"空闲页 {s['freelist_pages']}（{s['freelist_ratio']:.1%}），日志模式 {s['journal_mode']}，"
+          f"WAL {s['wal_bytes'] / 1e6:.1f}MB")
+    if not s["objects"]:
+        print("  （当前 SQLite 不支持 DBSTAT，无法统计各表/索引大小）")
+    for o in s["objects"]:
+        fill = f"{o['fill']:.0%}" if o["fill"] is not None else "-"
+        print(f"  {o['type']:<8} {o['name']:<40} {o['bytes'] / 1e6:>9.2f}MB {o['pages']:>8} 页  填充率 {fill}")
+
+
+def _print_queries(results: List[Dict], verbose: bool):
+    print("\n查询:")
+    for r in results:
+        ms = f"{r['median_ms']:.2f}ms" if r["median_ms"] is not None else "-"
+        mark = "!!" if r["problems"] else ("~ " if r["expected"] else "  ")
+        print(f"{mark} {r['name']:<12} {ms:>10}  {len(r['queries'])} 条SQL")
+        for p in r["problems"]:
+            print(f"     {p}")
+        if r["expected"] and not r["problems"]:
+            for f in sorted({f for q in r["queries"] for f in q["flags"]}):
+                print(f"     （预期）{f}")
+        if verbose:
+            for q in r["queries"]:
+                print(f"     SQL: {q['sql']}")
+                for line in q["plan"]:
+                    print(f"       {line}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="数据库诊断")
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--repeat", type=int, default=3, help="每个场景调用的次数（取中位数）")
+    parser.add_argument("--max-ms", type=float, default=50.0, help="超过该耗时的场景记为问题（批量读取除外）")
+    parser.add_argument("--min-rows", type=int, default=10000, help="行数少于该值的表扫描不计为问题")
+    parser.add_argument("--verbose", "-v", action="store_true", help="输出每条SQL与执行计划")
+    parser.add_argument("--json", action="store_true", help="以JSON输出报告")
+    parser.add_argument("--fix", action="store_true", help="补齐索引/迁移、ANALYZE、截断WAL、必要时VACUUM")
+    parser.add_argument("--vacuum", action="store_true", help="与 --fix 一起使用时强制 VACUUM")
+    parser.add_argument("--vacuum-threshold", type=float, default=0.2, help="空闲页比例达到该值时 VACUUM")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"数据库不存在: {args.db}", file=sys.stderr)
+        sys.exit(2)
+    actions = fix(args.db, args.vacuum, args.vacuum_threshold) if args.fix else []
+    storage = storage_report(args.db)
+    pending = [m for m in db.schema_status(args.db) if m["applied_at"] is None]
+    missing = [] if pending else [name for name, _ in missing_indexes(args.db)]
+    # 查询依赖迁移后的结构（ts_ms、全文索引、统计汇总等），未迁移的库只报告结构与存储
+    queries = [] if pending else query_report(args.db, repeat=args.repeat, max_ms=args.max_ms,
+                                                 min_rows=args.min_rows)
+    problems = len(pending) + len(missing) + sum(len(r["problems"]) for r in queries)
+    if args.json:
+        print(json.dumps({"migrations": db.schema_status(args.db), "missing_indexes": missing,
+                          "storage": storage, "queries": queries,
+                          "fix_actions": actions, "problems": problems}, ensure_ascii=False, indent=2))
+    else:
+        check_database_structure(args.db)
+        _print_storage(storage)
+        if pending:
+            print(f"\n{len(pending)} 个迁移未应用，跳过查询诊断；运行 --fix 或启动程序完成迁移后再检查")
+        else:
+            for name in missing:
+                print(f"!! 缺少索引 {name}（--fix 创建）")
+            _print_queries(queries, args.verbose)
+        for a in actions:
+            print(f"已执行: {a}")
+        print(f"\n发现 {problems} 个问题" if problems else "\n未发现问题")
+    sys.exit(1 if problems else 0)
+
+
 if __name__ == "__main__":
-    check_database_structure()
\ No newline at end of file
+    main()
@@ -0,0 +1,50 @@
+"""决策 JSON 字段压缩的管理工具：生成共享字典、改写已有行、查看存储情况。
+
+启用后 db.insert_decision 写入的四个 JSON 字段用共享字典压缩（见 db.py「JSON 字段压缩」），
+读取路径自动解码，压缩与未压缩的行可以混存。已有行用 migrate 分批改写，每批一个短事务，
+可以在程序运行时执行；中断后重新执行即可（已是目标格式的行会跳过）。
+
+用法:
+    python compress_blobs.py status
+    python compress_blobs.py enable               # 用最近的决策生成字典并启用压缩
+    python compress_blobs.py migrate --vacuum     # 压缩已有行，完成后 VACUUM 回收空间
+    python compress_blobs.py disable --migrate    # 停止压缩，并把已有行还原为文本
+
+字典生成后新写入即开始压缩；运行中的程序在重启后使用新字典（此前仍按旧字典写入，
+旧字典保留在 blob_dicts 表中，解码不受影响）。压缩大小与解码耗时见 benchmark.py --suites blobs。
+"""
+
+import argparse
+import json
+import os
+
+import db
+
+
+def main():
+    parser = argparse.ArgumentParser(description="决策 JSON 字段压缩")
+    parser.add_argument("command", choices=("status", "enable", "migrate", "disable"))
+    parser.add_argument("--db", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "decisions.db"))
+    parser.add_argument("--sample-rows", type=int, default=500, help="生成字典使用的最近决策行数")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--pause", type=float, default=0.0, help="批次之间的间隔（秒）")
+    parser.add_argument("--migrate", action="store_true", help="disable 后把已有行还原为文本")
+    parser.add_argument("--vacuum", action="store_true", help="改写后执行 VACUUM 回收空间（期间阻塞写入）")
+    args = parser.parse_args()
+
+    db.init_db(args.db)
+    if args.command == "enable":
+        print(f"已启用压缩，字典id: {db.train_blob_dictionary(args.db, sample_rows=args.sample_rows)}")
+    elif args.command == "disable":
+        db.disable_blob_compression(args.db)
+        print("已停止压缩新写入")
+    if args.command == "migrate" or (args.command == "disable" and args.migrate):
+        n = db.recompress_blobs(args.db, batch_size=args.batch_size, pause=args.pause)
+        print(f"已改写 {n} 行")
+        if args.vacuum and n:
+            db.vacuum(args.db)
+    print(json.dumps(db.blob_stats(args.db), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""仿真与回测的交易成本模型：分档手续费、按盘口深度的滑点、历史资金费率。
+
+- TieredFeeModel：按30日交易量选择 maker/taker 费率档位（二分查找）；
+- DepthSlippageModel：用成交时刻之前最近的一份盘口快照计算市价单吃单均价。每份快照在加载时
+  预先算好逐档累计数量与累计成交额，任意数量的成交均价只需一次二分查找，与档位数无关；
+  没有可用快照（过旧或尚未记录）时退回固定基点滑点；
+- HistoricalFundingModel：按本地缓存的资金费率历史计提资金费。每个交易对的结算时间与费率
+  累计和常驻内存，一笔持仓的资金费只需两次二分查找，与持仓跨越的结算次数无关；
+  缓存未覆盖的时间段按固定费率、8小时结算补齐。
+
+回测逐笔调用这些模型，每笔成本为 O(log n)，相比逐档/逐次结算遍历几乎不增加回测耗时。
+盘口快照与资金费率由实时决策周期记录到 orderbook_snapshots / funding_rates 表。
+"""
+
+import bisect
+import threading
+import time
+from itertools import accumulate
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import db
+import metrics
+import simulation
+
+COST_MODEL_FALLBACK_TOTAL = metrics.counter("onlydecide_cost_model_fallback_total",
+                                            "成本模型缺少数据而使用固定参数的次数（按模型）")
+
+# OKX 永续合约普通用户（Lv1）费率；(30日交易量USDT门槛, maker, taker)，按账户实际档位配置 SIM_FEE_TIERS
+OKX_SWAP_FEE_TIERS: List[Tuple[float, float, float]] = [
+    (0.0, 0.0002, 0.0005),
+]
+
+
+def _to_ms(when) -> int:
+    dt = simulation.parse_time(when) if when is not None else None
+    return int(dt.timestamp() * 1000) if dt is not None else int(time.time() * 1000)
+
+
+class TieredFeeModel(simulation.FeeModel):
+    """分档 maker/taker 手续费；模拟成交均按市价单（taker）计"""
+
+    def __init__(self, tiers=OKX_SWAP_FEE_TIERS, volume=0.0):
+        super().__init__(0.0)
+        self.tiers = tiers
+        self.volume = volume
+
+    def rates(self) -> Tuple[float, float]:
+        """当前交易量对应的 (maker, taker) 费率"""
+        tiers = sorted(simulation.resolve(self.tiers) or OKX_SWAP_FEE_TIERS)
+        volume = simulation.to_float(simulation.resolve(self.volume))
+        i = bisect.bisect_right([t[0] for t in tiers], volume) - 1
+        _, maker, taker = tiers[max(0, i)]
+        return float(maker), float(taker)
+
+    def fee(self, symbol: str, notional: float, maker: bool = False) -> float:
+        maker_rate, taker_rate = self.rates()
+        return abs(notional) * (maker_rate if maker else taker_rate)
+
+
+class DepthBook:
+    """一份盘口快照；每侧预先计算累计数量与累计成交额"""
+
+    __slots__ = ("ts", "mid", "_bids", "_asks")
+
+    def __init__(self, ts: int, bids: Sequence, asks: Sequence):
+        self.ts = int(ts)
+        self._bids = self._side(bids)
+        self._asks = self._side(asks)
+        best_bid = self._bids[0][0] if self._bids[0] else None
+        best_ask = self._asks[0][0] if self._asks[0] else None
+        if best_bid and best_ask:
+            self.mid = (best_bid + best_ask) / 2
+        else:
+            self.mid = best_bid or best_ask or 0.0
+
+    @staticmethod
+    def _side(levels: Sequence):
+        levels = [(float(p), float(q)) for p, q, *_ in levels if float(q) > 0]
+        prices = [p for p, _ in levels]
+        cum_qty = list(accumulate(q for _, q in levels))
+        cum_notional = list(accumulate(p * q for p, q in levels))
+        return prices, cum_qty, cum_notional
+
+    def vwap(self, buying: bool, qty: float) -> Optional[float]:
+        """市价成交 qty（币本位）的均价；超出快照深度的部分按最后一档价格成交"""
+        prices, cum_qty, cum_notional = self._asks if buying else self._bids
+        if not prices or qty <= 0 or self.mid <= 0:
+            return None
+        k = bisect.bisect_left(cum_qty, qty)
+        if k >= len(prices):
+            return (cum_notional[-1] + (qty - cum_qty[-1]) * prices[-1]) / qty
+        filled_qty = cum_qty[k - 1] if k else 0.0
+        filled_notional = cum_notional[k - 1] if k else 0.0
+        return (filled_notional + (qty - filled_qty) * prices[k]) / qty
+
+
+class DepthSlippageModel(simulation.SlippageModel):
+    """按成交时刻之前最近的盘口快照计算滑点；bps 为没有快照时的固定滑点"""
+
+    def __init__(self, db_path: str, bps=0.0, max_age=900.0, reload_interval: float = 60.0, writer=None):
+        super().__init__(bps)
+        self.db_path = db_path
+        self.writer = writer
+        self.max_age = max_age
+        self.reload_interval = reload_interval
+        self._series: Dict[str, Tuple[List[int], List[DepthBook]]] = {}
+        self._loaded_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _load(self, symbol: str) -> Tuple[List[int], List[DepthBook]]:
+        """按交易对增量加载快照（只读取比内存中更新的记录）"""
+        now = time.monotonic()
+        with self._lock:
+            series = self._series.setdefault(symbol, ([], []))
+            if now - self._loaded_at.get(symbol, -self.reload_interval) < self.reload_interval:
+                return series
+            self._loaded_at[symbol] = now
+            since = series[0][-1] if series[0] else None
+        rows = db.get_orderbook_snapshots(self.db_path, symbol, since_ts=since)
+        with self._lock:
+            for row in rows:
+                self._append(series, DepthBook(row["ts"], row["bids"], row["asks"]))
+        return series
+
+    @staticmethod
+    def _append(series, book: DepthBook):
+        times, books = series
+        if times and book.ts <= times[-1]:
+            return
+        # 先追加快照再追加时间，并发读取时 times 的下标总能在 books 中找到
+        books.append(book)
+        times.append(book.ts)
+
+    def record(self, symbol: str, snapshot: Dict):
+        """保存一份快照（{ts, bids, asks}）到数据库（有 writer 时异步写入），并直接加入内存序列"""
+        if self.writer is not None:
+            self.writer.insert_orderbook_snapshot(symbol, snapshot["ts"], snapshot["bids"], snapshot["asks"])
+        else:
+            db.insert_orderbook_snapshot(self.db_path, symbol, snapshot["ts"], snapshot["bids"], snapshot["asks"])
+        book = DepthBook(snapshot["ts"], snapshot["bids"], snapshot["asks"])
+        with self._lock:
+            self._append(self._series.setdefault(symbol, ([], [])), book)
+
+    def book_at(self, symbol: str, when=None) -> Optional[DepthBook]:
+        times, books = self._load(symbol)
+        ts = _to_ms(when)
+        i = bisect.bisect_right(times, ts) - 1
+        if i < 0:
+            return None
+        max_age = simulation.to_float(simulation.resolve(self.max_age))
+        if max_age > 0 and ts - times[i] > max_age * 1000:
+            return None
+        return books[i]
+
+    def fill_price(self, symbol: str, side: str, price: float, size: float, opening: bool, when=None) -> float:
+        buying = (side == "long") == opening
+        book = self.book_at(symbol, when)
+        vwap = book.vwap(buying, size) if book is not None else None
+        if vwap is None:
+            COST_MODEL_FALLBACK_TOTAL.inc(model="slippage")
+            return super().fill_price(symbol, side, price, size, opening, when)
+        # 快照价格与信号价格不同，按相对冲击（含半个价差）折算到信号价格上
+        return price * vwap / book.mid
+
+
+class FundingHistory:
+    """资金费率历史的内存缓存：每个交易对保存结算时间与费率累计和"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._series: Dict[str, Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, symbol: str) -> Tuple[List[int], List[float]]:
+        series = self._series.get(symbol)
+        if series is None:
+            series = self.load(symbol)
+        return series
+
+    def load(self, symbol: str) -> Tuple[List[int], List[float]]:
+        rows = db.get_funding_rates(self.db_path, symbol)
+        series = ([t for t, _ in rows], [0.0] + list(accumulate(r for _, r in rows)))
+        with self._lock:
+            self._series[symbol] = series
+        return series
+
+    def refresh(self, symbol: str, fetch: Callable[[str, Optional[int]], List[Tuple[int, float]]],
+                max_pages: int = 10) -> int:
+        """从交易所补齐比缓存更新的结算记录，返回新增条数
+
+        fetch(symbol, after_ms) 返回一页 [(结算时间毫秒, 费率), ...]（新到旧），after_ms 为 None 时
+        返回最新一页，否则返回早于 after_ms 的记录。
+        """
+        times, _ = self._get(symbol)
+        latest = times[-1] if times else None
+        fresh: Dict[int, float] = {}
+        after = None
+        for _ in range(max(1, max_pages)):
+            page = fetch(symbol, after)
+            if not page:
+                break
+            newer = [(t, r) for t, r in page if latest is None or t > latest]
+            fresh.update(newer)
+            if len(newer) < len(page):
+                break
+            after = min(t for t, _ in page)
+        if fresh:
+            db.upsert_funding_rates(self.db_path, symbol, sorted(fresh.items()))
+            self.load(symbol)
+        return len(fresh)
+
+    def rate_sum(self, symbol: str, start_ms: int, end_ms: int) -> Tuple[float, Optional[Tuple[int, int]]]:
+        """(start_ms, end_ms] 内已缓存结算的费率之和，以及缓存覆盖的 (最早, 最晚) 结算时间"""
+        times, prefix = self._get(symbol)
+        if not times:
+            return 0.0, None
+        lo = bisect.bisect_right(times, start_ms)
+        hi = bisect.bisect_right(times, end_ms)
+        return prefix[hi] - prefix[lo], (times[0], times[-1])
+
+
+class HistoricalFundingModel(simulation.FundingModel):
+    """按缓存的资金费率历史计提；rate 为缓存未覆盖时段使用的固定费率"""
+
+    def __init__(self, history: FundingHistory, rate=0.0):
+        super().__init__(rate)
+        self.history = history
+
+    def cost(self, symbol: str, side: str, notional: float, open_time, close_time) -> float:
+        start, end = simulation.parse_time(open_time), simulation.parse_time(close_time)
+        if start is None or end is None or end <= start:
+            return 0.0
+        start_ms, end_ms = int(start.timestamp() * 1000), int(end.timestamp() * 1000)
+        total, covered = self.history.rate_sum(symbol, start_ms, end_ms)
+        # 缓存未覆盖的时段（早于缓存的历史、最近一次结算尚未同步）按固定费率补齐
+        if covered is None:
+            gaps = [(start_ms, end_ms)]
+        else:
+            gaps = [(start_ms, min(end_ms, covered[0] - 1)), (max(start_ms, covered[1]), end_ms)]
+        missing = [t for a, b in gaps if b > a for t in self.settlements(a, b)]
+        if missing:
+            COST_MODEL_FALLBACK_TOTAL.inc(model="funding")
+            total += sum(self.rate_at(symbol, t) for t in missing)
+        paid = abs(notional) * total
+        return paid if side == "long" else -paid
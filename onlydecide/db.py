@@ -1,8 +1,18 @@
 import sqlite3
 import json
-from typing import List, Dict, Optional
+import threading
+import time
+import zlib
+from typing import Callable, Iterable, List, Dict, Optional
 from datetime import datetime, timezone
 
+import metrics
+
+
+def _timed(fn):
+    """记录函数耗时到 onlydecide_db_call_duration_seconds（按 func 区分）"""
+    return metrics.timed_function("onlydecide_db_call_duration_seconds", "db.py 函数耗时")(fn)
+
 
 def init_db(db_path: str):
     conn = sqlite3.connect(db_path)
@@ -49,10 +59,47 @@ def init_db(db_path: str):
             );
             """
         )
+        # 仿真成本模型输入：盘口深度快照（数量为币本位）与资金费率历史
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS orderbook_snapshots (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                symbol TEXT NOT NULL,
+                ts INTEGER NOT NULL,           -- 交易所快照时间（毫秒）
+                bids_json TEXT NOT NULL,       -- [[价格, 数量], ...] 价格从高到低
+                asks_json TEXT NOT NULL        -- [[价格, 数量], ...] 价格从低到高
+            );
+            """
+        )
         cur.execute(
             """
-            CREATE INDEX IF NOT EXISTS idx_decisions_symbol_time
-            ON decisions(symbol, timestamp);
+            CREATE TABLE IF NOT EXISTS funding_rates (
+                symbol TEXT NOT NULL,
+                funding_time INTEGER NOT NULL, -- 结算时间（毫秒）
+                rate REAL NOT NULL,
+                PRIMARY KEY (symbol, funding_time)
+            );
+            """
+        )
+        cur.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_orderbook_snapshots_symbol_ts
+            ON orderbook_snapshots(symbol, ts);
+            """
+        )
+        # 模拟账户权益快照：每次平仓一条（kind=close）+ 每小时最后一次平仓后的权益（kind=hour）；
+        # symbol='*' 为全部交易对合计
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS equity_snapshots (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                symbol TEXT NOT NULL,
+                kind TEXT NOT NULL,            -- close / hour
+                ts_ms INTEGER NOT NULL,        -- 平仓时间；hour 为所在小时的起点
+                equity REAL NOT NULL,
+                realized_pnl REAL NOT NULL,    -- 累计已实现盈亏
+                position_id INTEGER            -- 触发该快照的模拟持仓
+            );
             """
         )
         cur.execute(
@@ -62,18 +109,568 @@ def init_db(db_path: str):
             """
         )
         conn.commit()
+        # 在基础表结构之上按版本应用结构变更；需要改写历史行的迁移由 run_backfills 在后台完成
+        migrate(conn)
+    finally:
+        conn.close()
+
+
+def iso_to_ms(value) -> Optional[int]:
+    """ISO-8601 时间转毫秒时间戳（无时区按UTC），无法解析时返回 None"""
+    if value is None:
+        return None
+    try:
+        dt = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except (TypeError, ValueError):
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+
+# ==================== 结构迁移 ====================
+# 每个迁移分两步：
+# 1. 结构变更（加列、建索引等只修改表结构的操作），init_db 时在一个短事务内完成并记录版本；
+# 2. 可选的数据回填：按 id 分批改写迁移时已存在的行，每批一个短事务并在同一事务内记录进度，
+#    中断（重启、写库失败）后从上次的位置继续；回填期间新写入的行已由新代码填好，不在回填范围内。
+#    回填全部完成后执行收尾（如删除被替代的旧索引）。
+# 迁移定义：(版本, 名称, 结构变更函数(cur), 回填)；回填为 None 或
+# (表, 读取的列, 按批改写函数(conn, rows), 收尾函数(cur) 或 None)
+
+
+def _m1_schema(cur: sqlite3.Cursor):
+    # 早期版本的 decisions 表没有 executed 列（原先需要用 check_db.py 检查后手工添加）
+    _add_columns(cur, 'decisions', [('executed', 'INTEGER DEFAULT 0')])
+
+
+def _m2_schema(cur: sqlite3.Cursor):
+    # 整数毫秒时间列：排序与时间范围过滤走索引范围扫描，不再比较ISO字符串
+    _add_columns(cur, 'decisions', [('ts_ms', 'INTEGER')])
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_decisions_symbol_ts ON decisions(symbol, ts_ms DESC, id DESC)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_decisions_ts ON decisions(ts_ms DESC, id DESC)")
+
+
+def _m2_backfill(conn: sqlite3.Connection, rows: List[tuple]):
+    # 无法解析的时间记为 0
+    conn.executemany("UPDATE decisions SET ts_ms = ? WHERE id = ?",
+                     [(iso_to_ms(ts) or 0, rid) for rid, ts in rows])
+
+
+def _m2_finish(cur: sqlite3.Cursor):
+    # 按 ISO 字符串排序的旧索引已不再使用
+    cur.execute("DROP INDEX IF EXISTS idx_decisions_symbol_time")
+
+
+def _m3_schema(cur: sqlite3.Cursor):
+    _add_columns(cur, 'sim_positions', [('open_ms', 'INTEGER'), ('close_ms', 'INTEGER')])
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_sim_positions_symbol_open "
+                "ON sim_positions(symbol, open_ms DESC, id DESC)")
+
+
+def _m3_backfill(conn: sqlite3.Connection, rows: List[tuple]):
+    conn.executemany("UPDATE sim_positions SET open_ms = ?, close_ms = ? WHERE id = ?",
+                     [(iso_to_ms(o) or 0, iso_to_ms(c), rid) for rid, o, c in rows])
+
+
+def _m4_schema(cur: sqlite3.Cursor):
+    # 冷热分层：已归档行的 JSON 字段移到按月压缩文件，archived 记录所在月份（见 archive.py）
+    _add_columns(cur, 'decisions', [('archived', 'TEXT')])
+    # 只索引未归档的行，归档任务查找待归档行时不必扫过已归档的历史
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_decisions_unarchived ON decisions(ts_ms) WHERE archived IS NULL")
+
+
+def _m5_schema(cur: sqlite3.Cursor):
+    # JSON 字段压缩使用的共享字典；旧字典保留以便解码历史行，active=1 的字典用于新写入
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS blob_dicts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at TEXT NOT NULL,
+            zdict BLOB NOT NULL,
+            active INTEGER NOT NULL DEFAULT 0
+        )
+        """
+    )
+
+
+def _m6_schema(cur: sqlite3.Cursor):
+    # reason 全文索引：FTS5 trigram 分词（按连续三个字符建索引，不依赖空格分词，适合中文），
+    # 行id即决策id。表自带一份 reason 副本，未回填的行被删除/修改时触发器不会破坏索引。
+    # 当前 SQLite 未编译 FTS5 时跳过，search_decisions 退化为 LIKE 扫描。
+    try:
+        cur.execute("CREATE VIRTUAL TABLE IF NOT EXISTS decisions_fts USING fts5(reason, tokenize='trigram')")
+    except sqlite3.OperationalError:
+        return
+    cur.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS decisions_fts_ai AFTER INSERT ON decisions BEGIN
+            INSERT INTO decisions_fts(rowid, reason) VALUES (new.id, new.reason);
+        END
+        """
+    )
+    cur.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS decisions_fts_ad AFTER DELETE ON decisions BEGIN
+            DELETE FROM decisions_fts WHERE rowid = old.id;
+        END
+        """
+    )
+    cur.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS decisions_fts_au AFTER UPDATE OF reason ON decisions BEGIN
+            DELETE FROM decisions_fts WHERE rowid = old.id;
+            INSERT INTO decisions_fts(rowid, reason) VALUES (new.id, new.reason);
+        END
+        """
+    )
+
+
+def _m6_backfill(conn: sqlite3.Connection, rows: List[tuple]):
+    if not _has_fts(conn):
+        return
+    # 先删后插：回填期间已被触发器写入的行不会重复
+    conn.executemany("DELETE FROM decisions_fts WHERE rowid = ?", [(rid,) for rid, _ in rows])
+    conn.executemany("INSERT INTO decisions_fts(rowid, reason) VALUES (?, ?)", rows)
+
+
+# 决策统计汇总，由触发器随 decisions 增量更新（条数与其中已执行的条数）：
+# - decision_rollups：按 (交易对, 小时, 动作, 置信度)，用于时间范围内的统计与时间序列；
+# - decision_totals：全部历史按 (交易对, 动作, 置信度, UTC 几点)，行数固定，不限时间范围的统计直接读取。
+_ROLLUP_BUCKET_MS = 3600000
+_ROLLUP_TABLES = {
+    'decision_rollups': ('bucket_ms', "COALESCE({r}.ts_ms, 0) / 3600000 * 3600000"),
+    'decision_totals': ('hour_of_day', "COALESCE({r}.ts_ms, 0) / 3600000 % 24"),
+}
+# 回填期间 (backfill_cursor, backfill_until] 内的行尚未计入汇总，它们被删除或修改时不能扣减
+_ROLLUP_COUNTED = ("({r}.id > COALESCE((SELECT backfill_until FROM schema_migrations WHERE version = 7), 0) "
+                   "OR {r}.id <= COALESCE((SELECT backfill_cursor FROM schema_migrations WHERE version = 7), 0))")
+
+
+def _rollup_upserts(ref: str, sign: int) -> str:
+    out = []
+    for table, (column, expr) in _ROLLUP_TABLES.items():
+        out.append(
+            f"INSERT INTO {table} (symbol, {column}, action, confidence_level, n, executed) "
+            f"VALUES ({ref}.symbol, {expr.format(r=ref)}, COALESCE({ref}.action, ''), "
+            f"COALESCE({ref}.confidence_level, ''), {sign}, {sign} * (CASE WHEN {ref}.executed THEN 1 ELSE 0 END)) "
+            f"ON CONFLICT(symbol, {column}, action, confidence_level) "
+            f"DO UPDATE SET n = n + excluded.n, executed = executed + excluded.executed;"
+        )
+    return "\n".join(out)
+
+
+def _m7_schema(cur: sqlite3.Cursor):
+    for table, (column, _) in _ROLLUP_TABLES.items():
+        cur.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                symbol TEXT NOT NULL,
+                {column} INTEGER NOT NULL,
+                action TEXT NOT NULL,
+                confidence_level TEXT NOT NULL,
+                n INTEGER NOT NULL DEFAULT 0,
+                executed INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (symbol, {column}, action, confidence_level)
+            ) WITHOUT ROWID
+            """
+        )
+    # 不限交易对时按时间范围读取；WITHOUT ROWID 表的索引自带主键列，加上 n、executed 即为覆盖索引
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_decision_rollups_bucket ON decision_rollups(bucket_ms, n, executed)")
+    cur.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS decision_rollups_ai AFTER INSERT ON decisions
+        WHEN {_ROLLUP_COUNTED.format(r='new')} BEGIN
+            {_rollup_upserts('new', 1)}
+        END
+        """
+    )
+    cur.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS decision_rollups_ad AFTER DELETE ON decisions
+        WHEN {_ROLLUP_COUNTED.format(r='old')} BEGIN
+            {_rollup_upserts('old', -1)}
+        END
+        """
+    )
+    cur.execute(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS decision_rollups_au
+        AFTER UPDATE OF ts_ms, symbol, action, confidence_level, executed ON decisions
+        WHEN {_ROLLUP_COUNTED.format(r='old')} BEGIN
+            {_rollup_upserts('old', -1)}
+            {_rollup_upserts('new', 1)}
+        END
+        """
+    )
+
+
+def _m7_backfill(conn: sqlite3.Connection, rows: List[tuple]):
+    for table, (column, _) in _ROLLUP_TABLES.items():
+        counts: Dict[tuple, List[int]] = {}
+        for _, ts_ms, symbol, action, confidence, executed in rows:
+            hour = (ts_ms or 0) // _ROLLUP_BUCKET_MS
+            key = (symbol, hour * _ROLLUP_BUCKET_MS if column == 'bucket_ms' else hour % 24,
+                   action or '', confidence or '')
+            c = counts.setdefault(key, [0, 0])
+            c[0] += 1
+            c[1] += 1 if executed else 0
+        conn.executemany(
+            f"INSERT INTO {table} (symbol, {column}, action, confidence_level, n, executed) "
+            f"VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(symbol, {column}, action, confidence_level) "
+            f"DO UPDATE SET n = n + excluded.n, executed = executed + excluded.executed",
+            [k + tuple(v) for k, v in counts.items()]
+        )
+
+
+def _m8_schema(cur: sqlite3.Cursor):
+    # 权益快照唯一键按 kind 区分：小时快照每小时一条（同一小时内覆盖），平仓快照每笔平仓一条——
+    # 同一毫秒的两笔平仓不能互相覆盖，同一笔平仓重复写入（写回超时后重试）仍只保留一条
+    cur.execute("DROP INDEX IF EXISTS idx_equity_snapshots_symbol_kind_ts")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_equity_snapshots_symbol_kind_ts ON equity_snapshots(symbol, kind, ts_ms)")
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_equity_snapshots_hour "
+                "ON equity_snapshots(symbol, ts_ms) WHERE kind = 'hour'")
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_equity_snapshots_close "
+                "ON equity_snapshots(symbol, ts_ms, position_id) WHERE kind = 'close'")
+
+
+MIGRATIONS = [
+    (1, 'decisions_executed_column', _m1_schema, None),
+    (2, 'decisions_ts_ms', _m2_schema, ('decisions', ('timestamp',), _m2_backfill, _m2_finish)),
+    (3, 'sim_positions_time_ms', _m3_schema, ('sim_positions', ('open_time', 'close_time'), _m3_backfill, None)),
+    (4, 'decisions_archived', _m4_schema, None),
+    (5, 'blob_dicts', _m5_schema, None),
+    (6, 'decisions_fts', _m6_schema, ('decisions', ('reason',), _m6_backfill, None)),
+    (7, 'decision_rollups', _m7_schema,
+     ('decisions', ('ts_ms', 'symbol', 'action', 'confidence_level', 'executed'), _m7_backfill, None)),
+    (8, 'equity_snapshots_close_key', _m8_schema, None),
+]
+
+
+def _add_columns(cur: sqlite3.Cursor, table: str, columns: List[tuple]):
+    """为已有表补充缺少的列（ALTER TABLE ADD COLUMN 只修改表结构，不重写数据）"""
+    existing = {r[1] for r in cur.execute(f"PRAGMA table_info({table})")}
+    for name, decl in columns:
+        if name not in existing:
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+
+
+def _ensure_migrations_table(conn: sqlite3.Connection):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL,       -- 结构变更完成时间
+            backfill_cursor INTEGER,        -- 已回填到的 id（无需回填时为 NULL）
+            backfill_until INTEGER,         -- 需要回填的最大 id（迁移时表中已有的行）
+            completed_at TEXT               -- 回填与收尾完成时间
+        )
+        """
+    )
+
+
+def migrate(conn: sqlite3.Connection) -> List[int]:
+    """应用尚未执行的结构变更，返回本次应用的版本号"""
+    _ensure_migrations_table(conn)
+    done = {r[0] for r in conn.execute("SELECT version FROM schema_migrations")}
+    applied = []
+    for version, name, schema, backfill in MIGRATIONS:
+        if version in done:
+            continue
+        now = datetime.now(timezone.utc).isoformat()
+        cur = conn.cursor()
+        # 显式事务：DDL 与版本记录一起提交，中途失败不会留下半个迁移
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            schema(cur)
+            until = None
+            if backfill is not None:
+                until = cur.execute(f"SELECT COALESCE(MAX(id), 0) FROM {backfill[0]}").fetchone()[0]
+            pending = bool(until)
+            if not pending and backfill is not None and backfill[3] is not None:
+                backfill[3](cur)
+            cur.execute(
+                "INSERT INTO schema_migrations (version, name, applied_at, backfill_cursor, backfill_until, completed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (version, name, now, 0 if pending else None, until if pending else None, None if pending else now)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
+
+
+@_timed
+def run_backfills(db_path: str, batch_size: int = 500, pause: float = 0.0,
+                  stop: Optional[Callable[[], bool]] = None) -> int:
+    """按版本顺序执行未完成的数据回填，返回本次改写的行数
+
+    每批读取 batch_size 行并在一个短事务内改写、推进进度，批次之间释放写锁（可用 pause 让出更多时间），
+    决策写入与查询照常进行。stop() 返回 True 时在当前批次后退出，下次调用从进度处继续。
+    """
+    total = 0
+    conn = sqlite3.connect(db_path)
+    try:
+        _ensure_migrations_table(conn)
+        specs = {m[0]: m for m in MIGRATIONS}
+        pending = conn.execute(
+            "SELECT version, backfill_cursor, backfill_until FROM schema_migrations "
+            "WHERE completed_at IS NULL ORDER BY version"
+        ).fetchall()
+        for version, cursor, until in pending:
+            if version not in specs or specs[version][3] is None:
+                continue
+            table, columns, apply, finish = specs[version][3]
+            cols = ', '.join(('id',) + tuple(columns))
+            while True:
+                if stop is not None and stop():
+                    return total
+                rows = conn.execute(
+                    f"SELECT {cols} FROM {table} WHERE id > ? AND id <= ? ORDER BY id LIMIT ?",
+                    (cursor, until, batch_size)
+                ).fetchall()
+                with conn:
+                    if rows:
+                        apply(conn, rows)
+                        cursor = rows[-1][0]
+                    else:
+                        cursor = until
+                        if finish is not None:
+                            finish(conn.cursor())
+                    conn.execute(
+                        "UPDATE schema_migrations SET backfill_cursor = ?, completed_at = ? WHERE version = ?",
+                        (cursor, None if rows else datetime.now(timezone.utc).isoformat(), version)
+                    )
+                if not rows:
+                    break
+                total += len(rows)
+                if pause:
+                    time.sleep(pause)
+        return total
     finally:
         conn.close()
 
 
-def _dumps(obj) -> str:
+@_timed
+def schema_status(db_path: str) -> List[Dict]:
+    """各迁移的状态：已应用/回填进度/是否完成（未应用的迁移 applied_at 为 None）"""
+    conn = sqlite3.connect(db_path)
     try:
-        return json.dumps(obj, ensure_ascii=False)
+        conn.row_factory = sqlite3.Row
+        # 只读：尚未初始化迁移表的库视为全部未应用
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_migrations'"
+        ).fetchone()
+        rows = {r['version']: dict(r) for r in conn.execute("SELECT * FROM schema_migrations")} if exists else {}
+    finally:
+        conn.close()
+    out = []
+    for version, name, _, backfill in MIGRATIONS:
+        row = rows.get(version) or {'version': version, 'name': name, 'applied_at': None,
+                                    'backfill_cursor': None, 'backfill_until': None, 'completed_at': None}
+        row['table'] = backfill[0] if backfill else None
+        out.append(row)
+    return out
+
+
+def _dumps(obj, codec: Optional[tuple] = None):
+    """序列化为JSON文本；提供 codec（见 _blob_codec）时压缩为 BLOB，压缩后不更小则仍存文本"""
+    try:
+        text = json.dumps(obj, ensure_ascii=False)
     except Exception:
-        return "{}"
+        text = "{}"
+    return encode_blob(text, codec) if codec is not None else text
 
 
-def insert_decision(
+# ==================== JSON 字段压缩 ====================
+# 四个 JSON 字段高度重复（相同的键、K线结构与提示词模板），用从历史数据生成的共享字典做
+# raw deflate 压缩：zlib 的 zdict 相当于预先填充的滑动窗口，短文本也能引用字典中的片段。
+# 压缩值以 BLOB 存储：b'z' + 字典id(4字节小端，0 为无字典) + deflate 数据；未压缩的值仍为 TEXT，
+# 读取时按类型区分，新旧格式可以混存。压缩默认关闭，数据库中存在 active 字典时写入才压缩。
+_BLOB_MAGIC = b'z'
+_ZDICT_SIZE = 32 * 1024                         # deflate 窗口大小，字典更长的部分不会被引用
+_blob_dicts: Dict[str, Dict[int, bytes]] = {}    # db_path -> {字典id: 字典}
+_blob_active: Dict[str, Optional[int]] = {}      # db_path -> 写入使用的字典id（None 为不压缩）
+_blob_lock = threading.Lock()
+
+
+def _load_blob_dicts(db_path: str):
+    conn = sqlite3.connect(db_path)
+    try:
+        try:
+            rows = conn.execute("SELECT id, zdict, active FROM blob_dicts").fetchall()
+        except sqlite3.OperationalError:
+            rows = []
+    finally:
+        conn.close()
+    with _blob_lock:
+        _blob_dicts[db_path] = {int(i): bytes(d) for i, d, _ in rows}
+        active = [int(i) for i, _, a in rows if a]
+        _blob_active[db_path] = max(active) if active else None
+
+
+def _blob_codec(db_path: str) -> Optional[tuple]:
+    """写入使用的 (字典id, 字典)；未启用压缩时返回 None"""
+    if db_path not in _blob_active:
+        _load_blob_dicts(db_path)
+    with _blob_lock:
+        dict_id = _blob_active.get(db_path)
+        return (dict_id, _blob_dicts[db_path][dict_id]) if dict_id is not None else None
+
+
+def active_blob_dict(db_path: str) -> Optional[int]:
+    """写入使用的字典id（重新读取），未启用压缩时为 None"""
+    _load_blob_dicts(db_path)
+    return _blob_active.get(db_path)
+
+
+def encode_blob(text: str, codec: tuple):
+    dict_id, zdict = codec
+    comp = zlib.compressobj(9, zlib.DEFLATED, -15, 9, zdict=zdict) if zdict else zlib.compressobj(9, zlib.DEFLATED, -15, 9)
+    raw = text.encode('utf-8')
+    data = _BLOB_MAGIC + int(dict_id).to_bytes(4, 'little') + comp.compress(raw) + comp.flush()
+    return data if len(data) < len(raw) else text
+
+
+def decode_blob(db_path: str, value):
+    """读取路径：压缩的 BLOB 解码为JSON文本，文本与 NULL 原样返回"""
+    if not isinstance(value, (bytes, memoryview)) or value[:1] != _BLOB_MAGIC:
+        return value
+    value = bytes(value)
+    dict_id = int.from_bytes(value[1:5], 'little')
+    zdict = _blob_dicts.get(db_path, {}).get(dict_id)
+    if zdict is None:
+        # 字典可能由其他进程（如 compress_blobs.py）新生成
+        _load_blob_dicts(db_path)
+        zdict = _blob_dicts.get(db_path, {}).get(dict_id, b'')
+    return decompress_blob(value, zdict)
+
+
+def decompress_blob(value: bytes, zdict: bytes) -> str:
+    """用给定字典解压 encode_blob 的结果"""
+    decomp = zlib.decompressobj(-15, zdict=zdict) if zdict else zlib.decompressobj(-15)
+    return (decomp.decompress(value[5:]) + decomp.flush()).decode('utf-8')
+
+
+def build_blob_dictionary(samples: List[str], size: int = _ZDICT_SIZE) -> bytes:
+    """由样本JSON文本（旧到新）生成共享字典
+
+    zlib 没有字典训练功能。deflate 字典就是预先填充的窗口，直接拼接最近的完整样本效果最好：
+    在本库数据上实测比挑选高频片段小约三成，K线数值变化后仍保留键名与结构。
+    越新的样本越靠后（引用距离越近），超出 size 的较旧部分丢弃。
+    """
+    return ''.join(samples).encode('utf-8')[-size:]
+
+
+@_timed
+def train_blob_dictionary(db_path: str, sample_rows: int = 500) -> int:
+    """用最近 sample_rows 条决策的 JSON 字段生成新字典并设为写入字典，返回字典id
+
+    没有可用样本时生成空字典（仅 deflate 压缩）。之前的字典保留用于解码。
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        cols = ', '.join(_BLOB_COLUMNS)
+        rows = conn.execute(
+            f"SELECT {cols} FROM decisions WHERE archived IS NULL ORDER BY id DESC LIMIT ?", (int(sample_rows),)
+        ).fetchall()
+        samples = [decode_blob(db_path, v) for r in reversed(rows) for v in r if v]
+        zdict = build_blob_dictionary(samples)
+        with conn:
+            conn.execute("UPDATE blob_dicts SET active = 0 WHERE active = 1")
+            cur = conn.execute(
+                "INSERT INTO blob_dicts (created_at, zdict, active) VALUES (?, ?, 1)",
+                (datetime.now(timezone.utc).isoformat(), zdict)
+            )
+        dict_id = cur.lastrowid
+    finally:
+        conn.close()
+    _load_blob_dicts(db_path)
+    return dict_id
+
+
+@_timed
+def disable_blob_compression(db_path: str):
+    """停止压缩新写入（已压缩的行仍可读取，可用 recompress_blobs 还原为文本）"""
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            conn.execute("UPDATE blob_dicts SET active = 0 WHERE active = 1")
+    finally:
+        conn.close()
+    _load_blob_dicts(db_path)
+
+
+@_timed
+def blob_stats(db_path: str) -> Dict:
+    """JSON 字段的存储情况：压缩/文本行数与字节数、写入使用的字典id"""
+    conn = sqlite3.connect(db_path)
+    try:
+        out = {}
+        for col in _BLOB_COLUMNS:
+            rows = conn.execute(
+                f"SELECT typeof({col}), COUNT(*), COALESCE(SUM(length(CAST({col} AS BLOB))), 0) "
+                f"FROM decisions GROUP BY 1"
+            ).fetchall()
+            out[col] = {t: {'rows': int(n), 'bytes': int(b)} for t, n, b in rows}
+    finally:
+        conn.close()
+    return {'active_dict': active_blob_dict(db_path), 'columns': out}
+
+
+@_timed
+def recompress_blobs(db_path: str, batch_size: int = 500, pause: float = 0.0,
+                     stop: Optional[Callable[[], bool]] = None) -> int:
+    """把已有行的 JSON 字段改写为当前写入格式（启用时用当前字典压缩，未启用时还原为文本）
+
+    与 run_backfills 相同，按 id 分批、每批一个短事务，决策写入照常进行；已是目标格式的行跳过。
+    返回改写的行数。
+    """
+    _load_blob_dicts(db_path)
+    codec = _blob_codec(db_path)
+    cols = ', '.join(_BLOB_COLUMNS)
+    sets = ', '.join(f"{c} = ?" for c in _BLOB_COLUMNS)
+    total, cursor = 0, 0
+    conn = sqlite3.connect(db_path)
+    try:
+        while stop is None or not stop():
+            rows = conn.execute(
+                f"SELECT id, {cols} FROM decisions WHERE id > ? ORDER BY id LIMIT ?", (cursor, batch_size)
+            ).fetchall()
+            if not rows:
+                break
+            cursor = rows[-1][0]
+            updates = []
+            for rid, *values in rows:
+                new = []
+                for v in values:
+                    text = decode_blob(db_path, v)
+                    new.append(text if text is None or codec is None else encode_blob(text, codec))
+                if new != list(values):
+                    updates.append(tuple(new) + (rid,))
+            if updates:
+                with conn:
+                    conn.executemany(f"UPDATE decisions SET {sets} WHERE id = ?", updates)
+                total += len(updates)
+            if pause:
+                time.sleep(pause)
+        return total
+    finally:
+        conn.close()
+
+
+INSERT_DECISION_SQL = """
+    INSERT INTO decisions (
+        timestamp, symbol, current_price, action, confidence_level, reason,
+        position_size, stop_loss_price, take_profit_price,
+        market_data_json, account_status_json, position_info_json, raw_decision_json, executed, ts_ms
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def decision_row(
     db_path: str,
     symbol: str,
     market_data: Dict,
@@ -81,13 +678,14 @@ def insert_decision(
     position_info: Dict,
     decision: Dict,
     executed: int = 0
-) -> int:
-    ts = datetime.now(timezone.utc).isoformat()
+) -> tuple:
+    """生成 decisions 表一行的参数（序列化与压缩在调用线程完成），配合 INSERT_DECISION_SQL 使用"""
+    now = datetime.now(timezone.utc)
     td = decision.get("trading_decision", {})
     pm = decision.get("position_management", {})
-
-    row = (
-        ts,
+    codec = _blob_codec(db_path)
+    return (
+        now.isoformat(),
         symbol,
         float(market_data.get("current_price") or 0),
         td.get("action"),
@@ -96,31 +694,181 @@ def insert_decision(
         float(pm.get("position_size") or 0),
         float(pm.get("stop_loss_price") or 0),
         float(pm.get("take_profit_price") or 0),
-        _dumps(market_data),
-        _dumps(account_status),
-        _dumps(position_info),
-        _dumps(decision),
-        executed
+        _dumps(market_data, codec),
+        _dumps(account_status, codec),
+        _dumps(position_info, codec),
+        _dumps(decision, codec),
+        executed,
+        int(now.timestamp() * 1000),
     )
 
+
+@_timed
+def insert_decision(
+    db_path: str,
+    symbol: str,
+    market_data: Dict,
+    account_status: Dict,
+    position_info: Dict,
+    decision: Dict,
+    executed: int = 0
+) -> int:
+    row = decision_row(db_path, symbol, market_data, account_status, position_info, decision, executed)
     conn = sqlite3.connect(db_path)
     try:
         cur = conn.cursor()
-        cur.execute(
-            """
-            INSERT INTO decisions (
-                timestamp, symbol, current_price, action, confidence_level, reason,
-                position_size, stop_loss_price, take_profit_price,
-                market_data_json, account_status_json, position_info_json, raw_decision_json, executed
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            row,
-        )
+        cur.execute(INSERT_DECISION_SQL, row)
         conn.commit()
         return cur.lastrowid
     finally:
         conn.close()
 
+# ==================== 批量导入 ====================
+def _float_or_none(value) -> Optional[float]:
+    try:
+        return float(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+def import_decision_row(db_path: str, record: Dict) -> Optional[tuple]:
+    """把导出（CSV/JSON）或归档格式的一条决策记录转换为 INSERT_DECISION_SQL 的参数
+
+    缺少交易对或时间无法解析时返回 None。JSON 字段可以是文本或对象，缺失时 raw_decision_json 由
+    标量字段组装（与 insert_decision 写入的结构一致），其余为 {}；启用压缩时按当前字典压缩。
+    """
+    symbol = record.get('symbol')
+    timestamp = record.get('timestamp')
+    ts_ms = record.get('ts_ms')
+    try:
+        ts_ms = int(ts_ms) if ts_ms not in (None, '') else iso_to_ms(timestamp)
+    except (TypeError, ValueError):
+        ts_ms = iso_to_ms(timestamp)
+    if not symbol or ts_ms is None:
+        return None
+    if not timestamp:
+        timestamp = datetime.fromtimestamp(ts_ms / 1000.0, tz=timezone.utc).isoformat()
+    codec = _blob_codec(db_path)
+    action = record.get('action') or None
+    confidence = record.get('confidence_level') or None
+    reason = record.get('reason')
+    size = _float_or_none(record.get('position_size'))
+    sl = _float_or_none(record.get('stop_loss_price'))
+    tp = _float_or_none(record.get('take_profit_price'))
+
+    def blob(column: str, default):
+        value = record.get(column)
+        if value in (None, ''):
+            value = default
+        if isinstance(value, dict) and not value:
+            # 空对象压缩后不会更小
+            return "{}"
+        if isinstance(value, str):
+            return encode_blob(value, codec) if codec is not None else value
+        return _dumps(value, codec)
+
+    raw_default = {
+        "trading_decision": {"action": action, "confidence_level": confidence, "reason": reason},
+        "position_management": {"position_size": size, "stop_loss_price": sl, "take_profit_price": tp},
+    }
+    try:
+        executed = int(float(record.get('executed') or 0))
+    except (TypeError, ValueError):
+        executed = 0
+    return (
+        timestamp, symbol, _float_or_none(record.get('current_price')), action, confidence, reason,
+        size, sl, tp,
+        blob('market_data_json', {}), blob('account_status_json', {}), blob('position_info_json', {}),
+        blob('raw_decision_json', raw_default),
+        executed, ts_ms,
+    )
+
+
+@_timed
+def decision_time_keys(db_path: str, symbol: str) -> set:
+    """某交易对已有决策的毫秒时间集合（批量导入按 (symbol, ts_ms) 去重，走 symbol, ts_ms 索引）"""
+    conn = sqlite3.connect(db_path)
+    try:
+        return {r[0] for r in conn.execute("SELECT ts_ms FROM decisions WHERE symbol = ?", (symbol,))}
+    finally:
+        conn.close()
+
+
+@_timed
+def bulk_insert_decisions(
+    db_path: str,
+    batches: Iterable[List[tuple]],
+    rebuild_indexes: bool = True,
+    on_batch: Optional[Callable[[int], None]] = None
+) -> int:
+    """批量写入 import_decision_row 生成的行，返回写入行数
+
+    rebuild_indexes=True（默认）：在一个事务内删除 decisions 上的二级索引与触发器，executemany
+    写入全部批次后，按新行一次性补写全文索引与统计汇总，再按原定义重建索引与触发器。整个导入持有
+    写锁，期间其他写入等待；中途失败整体回滚，不会留下缺少索引的表。
+    rebuild_indexes=False：保留索引与触发器，每批一个事务，可以在程序运行时导入。
+    """
+    total = 0
+    conn = sqlite3.connect(db_path, isolation_level=None, timeout=30)
+    try:
+        # 重建索引时的排序使用更大的页缓存（仅本连接）
+        conn.execute("PRAGMA cache_size=-262144")
+        if not rebuild_indexes:
+            for batch in batches:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    conn.executemany(INSERT_DECISION_SQL, batch)
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+                total += len(batch)
+                if on_batch:
+                    on_batch(len(batch))
+            return total
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            first_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM decisions").fetchone()[0]
+            saved = conn.execute(
+                "SELECT type, name, sql FROM sqlite_master "
+                "WHERE tbl_name = 'decisions' AND type IN ('index', 'trigger') AND sql IS NOT NULL"
+            ).fetchall()
+            for kind, name, _ in saved:
+                conn.execute(f"DROP {kind.upper()} IF EXISTS {name}")
+            for batch in batches:
+                conn.executemany(INSERT_DECISION_SQL, batch)
+                total += len(batch)
+                if on_batch:
+                    on_batch(len(batch))
+            # 触发器未执行的派生数据：全文索引与统计汇总（新行 id 均大于回填上限，按已计入处理）
+            if _has_fts(conn):
+                conn.execute("INSERT INTO decisions_fts(rowid, reason) SELECT id, reason FROM decisions WHERE id > ?",
+                             (first_id,))
+            for table, (column, expr) in _ROLLUP_TABLES.items():
+                conn.execute(
+                    f"""
+                    INSERT INTO {table} (symbol, {column}, action, confidence_level, n, executed)
+                    SELECT symbol, {expr.format(r='decisions')}, COALESCE(action, ''), COALESCE(confidence_level, ''),
+                           COUNT(*), SUM(CASE WHEN executed THEN 1 ELSE 0 END)
+                    FROM decisions WHERE id > ? GROUP BY 1, 2, 3, 4
+                    ON CONFLICT(symbol, {column}, action, confidence_level)
+                    DO UPDATE SET n = n + excluded.n, executed = executed + excluded.executed
+                    """,
+                    (first_id,)
+                )
+            # 先建索引再建触发器
+            for kind, _, sql in sorted(saved, key=lambda r: r[0] != 'index'):
+                conn.execute(sql)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return total
+    finally:
+        conn.close()
+
+
+@_timed
 def sim_open_position(
     db_path: str,
     symbol: str,
@@ -142,16 +890,17 @@ def sim_open_position(
             """
             INSERT INTO sim_positions (
                 symbol, side, size_eth, entry_price, tp_price, sl_price,
-                status, open_time
-            ) VALUES (?, ?, ?, ?, ?, ?, 'open', ?)
+                status, open_time, open_ms
+            ) VALUES (?, ?, ?, ?, ?, ?, 'open', ?, ?)
             """,
-            (symbol, side, size_eth, entry_price, tp_price, sl_price, open_time)
+            (symbol, side, size_eth, entry_price, tp_price, sl_price, open_time, iso_to_ms(open_time))
         )
         conn.commit()
         return cur.lastrowid
     finally:
         conn.close()
 
+@_timed
 def sim_get_open_position(db_path: str, symbol: Optional[str] = None) -> Optional[Dict]:
     """获取当前开仓的模拟持仓（如存在则返回最新一条）"""
     conn = sqlite3.connect(db_path)
@@ -163,7 +912,7 @@ def sim_get_open_position(db_path: str, symbol: Optional[str] = None) -> Optiona
                 """
                 SELECT * FROM sim_positions
                 WHERE status = 'open' AND symbol = ?
-                ORDER BY open_time DESC
+                ORDER BY open_ms DESC, id DESC
                 LIMIT 1
                 """,
                 (symbol,)
@@ -173,7 +922,7 @@ def sim_get_open_position(db_path: str, symbol: Optional[str] = None) -> Optiona
                 """
                 SELECT * FROM sim_positions
                 WHERE status = 'open'
-                ORDER BY open_time DESC
+                ORDER BY open_ms DESC, id DESC
                 LIMIT 1
                 """
             )
@@ -182,17 +931,47 @@ def sim_get_open_position(db_path: str, symbol: Optional[str] = None) -> Optiona
     finally:
         conn.close()
 
+def compute_sim_pnl(side: str, entry_price: float, size_eth: float, exit_price: float,
+                    leverage: Optional[float] = None, fees: float = 0.0):
+    """计算模拟持仓的已实现盈亏，返回 (pnl_usdt, pnl_pct)；fees 为需扣除的手续费/资金费"""
+    # 多空方向盈亏：多单 (exit-entry)*size；空单 (entry-exit)*size
+    if side == 'long':
+        pnl_base = (exit_price - entry_price) * size_eth
+    else:
+        pnl_base = (entry_price - exit_price) * size_eth
+
+    # 按杠杆放大（若提供且有效）
+    try:
+        lev = float(leverage) if (leverage is not None) else 1.0
+        if lev <= 0:
+            lev = 1.0
+    except Exception:
+        lev = 1.0
+    pnl = pnl_base * lev - (fees or 0.0)
+
+    pnl_pct = 0.0
+    try:
+        if entry_price > 0:
+            pnl_pct = (pnl / (entry_price * size_eth)) * 100.0
+    except Exception:
+        pnl_pct = 0.0
+    return pnl, pnl_pct
+
+
+@_timed
 def sim_close_position(
     db_path: str,
     position_id: int,
     exit_price: float,
     close_time: Optional[str] = None,
-    leverage: Optional[float] = None
+    leverage: Optional[float] = None,
+    initial_equity: float = 10000.0
 ) -> bool:
-    """平掉指定的模拟持仓并计算已实现盈亏。
+    """平掉指定的模拟持仓并计算已实现盈亏，同时追加权益快照。
 
     参数:
     - leverage: 若提供则按该杠杆倍数放大盈亏（默认不放大）。
+    - initial_equity: 该交易对尚无权益快照时的起始权益。
     """
     if close_time is None:
         close_time = datetime.now(timezone.utc).isoformat()
@@ -206,45 +985,230 @@ def sim_close_position(
         row = cur.fetchone()
         if not row:
             return False
-        side = row['side']
-        entry_price = float(row['entry_price'] or 0)
-        size_eth = float(row['size_eth'] or 0)
+        pnl, pnl_pct = compute_sim_pnl(row['side'], float(row['entry_price'] or 0), float(row['size_eth'] or 0),
+                                       exit_price, leverage)
 
-        # 多空方向盈亏：多单 (exit-entry)*size；空单 (entry-exit)*size
-        if side == 'long':
-            pnl_base = (exit_price - entry_price) * size_eth
+        cur.execute(
+            """
+            UPDATE sim_positions
+            SET status = 'closed', close_time = ?, close_ms = ?, exit_price = ?, pnl_usdt = ?, pnl_pct = ?
+            WHERE id = ?
+            """,
+            (close_time, iso_to_ms(close_time), exit_price, pnl, pnl_pct, position_id)
+        )
+        updated = cur.rowcount > 0
+        if updated:
+            # 在最近一条平仓快照的累计盈亏基础上追加
+            realized = {}
+            for sym in (row['symbol'], '*'):
+                cur.execute(
+                    "SELECT realized_pnl FROM equity_snapshots WHERE symbol = ? AND kind = 'close' "
+                    "ORDER BY ts_ms DESC, id DESC LIMIT 1",
+                    (sym,)
+                )
+                last = cur.fetchone()
+                realized[sym] = float(last[0]) if last else 0.0
+            closed = {'id': position_id, 'symbol': row['symbol'], 'close_time': close_time, 'pnl_usdt': pnl}
+            _insert_equity_snapshots(conn, equity_snapshot_rows([closed], initial_equity, realized))
+        conn.commit()
+        return updated
+    finally:
+        conn.close()
+
+@_timed
+def sim_list_open_positions(db_path: str, symbol: Optional[str] = None) -> List[Dict]:
+    """列出所有未平仓的模拟持仓（供止盈止损监控建立索引）"""
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.row_factory = sqlite3.Row
+        cur = conn.cursor()
+        if symbol:
+            cur.execute("SELECT * FROM sim_positions WHERE status = 'open' AND symbol = ?", (symbol,))
         else:
-            pnl_base = (entry_price - exit_price) * size_eth
+            cur.execute("SELECT * FROM sim_positions WHERE status = 'open'")
+        return [{k: r[k] for k in r.keys()} for r in cur.fetchall()]
+    finally:
+        conn.close()
 
-        # 按杠杆放大（若提供且有效）
-        try:
-            lev = float(leverage) if (leverage is not None) else 1.0
-            if lev <= 0:
-                lev = 1.0
-        except Exception:
-            lev = 1.0
-        pnl = pnl_base * lev
+_SIM_COLUMNS = ('id', 'symbol', 'side', 'size_eth', 'entry_price', 'tp_price', 'sl_price', 'status',
+                'open_time', 'close_time', 'exit_price', 'pnl_usdt', 'pnl_pct')
+# 由 open_time / close_time 派生，写入时计算
+_SIM_MS_COLUMNS = ('open_ms', 'close_ms')
 
-        pnl_pct = 0.0
-        try:
-            if entry_price > 0:
-                pnl_pct = (pnl / (entry_price * size_eth)) * 100.0
-        except Exception:
-            pnl_pct = 0.0
 
+@_timed
+def sim_write_positions(db_path: str, rows: List[Dict], snapshots: Optional[List[tuple]] = None) -> int:
+    """批量写入模拟持仓（按 id 插入或覆盖整行）与权益快照，单个事务提交，返回写入的持仓行数
+
+    snapshots: [(symbol, ts_ms, equity, realized_pnl, position_id), ...]，按时间顺序
+    """
+    if not rows and not snapshots:
+        return 0
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            return write_sim_positions(conn, rows, snapshots)
+    finally:
+        conn.close()
+
+
+def write_sim_positions(conn: sqlite3.Connection, rows: List[Dict], snapshots: Optional[List[tuple]] = None) -> int:
+    """在调用方的事务内写入模拟持仓与权益快照（sim_write_positions 与 db_writer 共用）"""
+    cols = ', '.join(_SIM_COLUMNS + _SIM_MS_COLUMNS)
+    marks = ', '.join('?' for _ in _SIM_COLUMNS + _SIM_MS_COLUMNS)
+    conn.executemany(
+        f"INSERT OR REPLACE INTO sim_positions ({cols}) VALUES ({marks})",
+        [tuple(r.get(c) for c in _SIM_COLUMNS) + (iso_to_ms(r.get('open_time')), iso_to_ms(r.get('close_time')))
+         for r in rows]
+    )
+    _insert_equity_snapshots(conn, snapshots or [])
+    return len(rows)
+
+_HOUR_MS = 3600 * 1000
+
+
+def _iso_to_ms(value: Optional[str]) -> int:
+    """同 iso_to_ms，无法解析时取当前时间"""
+    ms = iso_to_ms(value)
+    return ms if ms is not None else int(datetime.now(timezone.utc).timestamp() * 1000)
+
+
+def _insert_equity_snapshots(conn: sqlite3.Connection, snapshots: List[tuple]):
+    """写入平仓快照（按 交易对+时间+持仓 去重），并用同一批数据覆盖所在小时的小时快照（同一小时内以最后一条为准）"""
+    if not snapshots:
+        return
+    conn.executemany(
+        """
+        INSERT OR REPLACE INTO equity_snapshots (symbol, kind, ts_ms, equity, realized_pnl, position_id)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        [(sym, kind, ts if kind == 'close' else ts // _HOUR_MS * _HOUR_MS, eq, pnl, pid)
+         for kind in ('close', 'hour') for sym, ts, eq, pnl, pid in snapshots]
+    )
+
+
+def equity_snapshot_rows(closed: List[Dict], initial_equity: float, realized: Optional[Dict[str, float]] = None) -> List[tuple]:
+    """按平仓顺序为每笔平仓生成交易对与合计('*')两条权益快照；realized 为此前的累计已实现盈亏（会被更新）"""
+    realized = realized if realized is not None else {}
+    out = []
+    for pos in closed:
+        pnl = float(pos.get('pnl_usdt') or 0)
+        ts = _iso_to_ms(pos.get('close_time'))
+        for sym in (pos['symbol'], '*'):
+            realized[sym] = realized.get(sym, 0.0) + pnl
+            out.append((sym, ts, float(initial_equity) + realized[sym], realized[sym], pos.get('id')))
+    return out
+
+@_timed
+def backfill_equity_snapshots(db_path: str, initial_equity: float) -> int:
+    """权益快照表为空时按已平仓记录重建（升级后首次启动），返回写入的平仓快照数"""
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.row_factory = sqlite3.Row
+        if conn.execute("SELECT 1 FROM equity_snapshots LIMIT 1").fetchone():
+            return 0
+        closed = [dict(r) for r in conn.execute(
+            "SELECT id, symbol, close_time, pnl_usdt FROM sim_positions WHERE status = 'closed'"
+        )]
+        closed.sort(key=lambda r: (_iso_to_ms(r['close_time']), r['id']))
+        snapshots = equity_snapshot_rows(closed, initial_equity)
+        with conn:
+            _insert_equity_snapshots(conn, snapshots)
+        return len(snapshots)
+    finally:
+        conn.close()
+
+@_timed
+def get_equity_snapshots(
+    db_path: str,
+    symbol: str = '*',
+    start_ms: Optional[int] = None,
+    end_ms: Optional[int] = None,
+    max_points: int = 500,
+    kind: Optional[str] = None
+) -> List[Dict]:
+    """按时间范围读取权益曲线（时间正序）。
+
+    - kind 未指定时：范围内平仓快照不超过 max_points 用 close，否则用 hour；
+    - 点数仍超过 max_points 时按等宽时间桶降采样，每桶取最后一条（桶内收盘权益）。
+    """
+    start_ms = int(start_ms) if start_ms is not None else 0
+    end_ms = int(end_ms) if end_ms is not None else 2 ** 62
+    max_points = max(2, int(max_points))
+    conn = sqlite3.connect(db_path)
+    try:
+        cur = conn.cursor()
+
+        def bounds(k):
+            cur.execute(
+                "SELECT COUNT(*), MIN(ts_ms), MAX(ts_ms) FROM equity_snapshots "
+                "WHERE symbol = ? AND kind = ? AND ts_ms BETWEEN ? AND ?",
+                (symbol, k, start_ms, end_ms)
+            )
+            return cur.fetchone()
+
+        if kind not in ('close', 'hour'):
+            kind = 'close'
+            count, lo, hi = bounds(kind)
+            if count > max_points:
+                kind = 'hour'
+                count, lo, hi = bounds(kind)
+        else:
+            count, lo, hi = bounds(kind)
+        if not count:
+            return []
+        bucket = 1
+        if count > max_points:
+            bucket = max(1, -(-(hi - lo + 1) // max_points))
+        # SQLite 中与 MAX() 同时选出的列取自 MAX 所在的那一行，即每个桶的最后一条
         cur.execute(
             """
-            UPDATE sim_positions
-            SET status = 'closed', close_time = ?, exit_price = ?, pnl_usdt = ?, pnl_pct = ?
-            WHERE id = ?
+            SELECT MAX(ts_ms), equity, realized_pnl, position_id
+            FROM equity_snapshots
+            WHERE symbol = ? AND kind = ? AND ts_ms BETWEEN ? AND ?
+            GROUP BY (ts_ms - ?) / ?
+            ORDER BY 1
             """,
-            (close_time, exit_price, pnl, pnl_pct, position_id)
+            (symbol, kind, start_ms, end_ms, lo, bucket)
         )
-        conn.commit()
-        return cur.rowcount > 0
+        return [
+            {'ts_ms': r[0], 'time': datetime.fromtimestamp(r[0] / 1000, tz=timezone.utc).isoformat(),
+             'equity': r[1], 'realized_pnl': r[2], 'position_id': r[3], 'kind': kind}
+            for r in cur.fetchall()
+        ]
     finally:
         conn.close()
 
+@_timed
+def sim_ledger_state(db_path: str) -> Dict:
+    """读取重建内存账本所需的汇总：各交易对已实现盈亏/平仓次数，以及下一个可用 id"""
+    conn = sqlite3.connect(db_path)
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            SELECT symbol, COALESCE(SUM(pnl_usdt), 0), COUNT(*)
+            FROM sim_positions
+            WHERE status = 'closed'
+            GROUP BY symbol
+            """
+        )
+        realized = {r[0]: (float(r[1] or 0), int(r[2] or 0)) for r in cur.fetchall()}
+        cur.execute("SELECT COALESCE(MAX(id), 0) FROM sim_positions")
+        max_id = int(cur.fetchone()[0] or 0)
+        # AUTOINCREMENT 不复用已删除的 id，这里保持一致
+        try:
+            cur.execute("SELECT seq FROM sqlite_sequence WHERE name = 'sim_positions'")
+            row = cur.fetchone()
+            if row and row[0]:
+                max_id = max(max_id, int(row[0]))
+        except sqlite3.OperationalError:
+            pass
+        return {'realized': realized, 'next_id': max_id + 1}
+    finally:
+        conn.close()
+
+@_timed
 def sim_list_positions(db_path: str, symbol: Optional[str] = None, limit: int = 50) -> List[Dict]:
     """列出模拟持仓/交易记录，时间倒序"""
     conn = sqlite3.connect(db_path)
@@ -256,7 +1220,7 @@ def sim_list_positions(db_path: str, symbol: Optional[str] = None, limit: int =
                 """
                 SELECT * FROM sim_positions
                 WHERE symbol = ?
-                ORDER BY open_time DESC
+                ORDER BY open_ms DESC, id DESC
                 LIMIT ?
                 """,
                 (symbol, limit)
@@ -265,7 +1229,7 @@ def sim_list_positions(db_path: str, symbol: Optional[str] = None, limit: int =
             cur.execute(
                 """
                 SELECT * FROM sim_positions
-                ORDER BY open_time DESC
+                ORDER BY open_ms DESC, id DESC
                 LIMIT ?
                 """,
                 (limit,)
@@ -275,6 +1239,7 @@ def sim_list_positions(db_path: str, symbol: Optional[str] = None, limit: int =
     finally:
         conn.close()
 
+@_timed
 def sim_clear(db_path: str) -> int:
     """清空模拟持仓/交易记录"""
     conn = sqlite3.connect(db_path)
@@ -283,6 +1248,7 @@ def sim_clear(db_path: str) -> int:
         cur.execute("SELECT COUNT(*) FROM sim_positions")
         before = cur.fetchone()[0]
         cur.execute("DELETE FROM sim_positions")
+        cur.execute("DELETE FROM equity_snapshots")
         conn.commit()
         cur.execute("SELECT COUNT(*) FROM sim_positions")
         after = cur.fetchone()[0]
@@ -291,6 +1257,103 @@ def sim_clear(db_path: str) -> int:
         conn.close()
 
 
+@_timed
+def insert_orderbook_snapshot(db_path: str, symbol: str, ts: int, bids: List, asks: List) -> int:
+    """记录一条盘口深度快照"""
+    conn = sqlite3.connect(db_path)
+    try:
+        cur = conn.cursor()
+        cur.execute(INSERT_ORDERBOOK_SQL, orderbook_row(symbol, ts, bids, asks))
+        conn.commit()
+        return cur.lastrowid
+    finally:
+        conn.close()
+
+
+INSERT_ORDERBOOK_SQL = "INSERT INTO orderbook_snapshots (symbol, ts, bids_json, asks_json) VALUES (?, ?, ?, ?)"
+
+
+def orderbook_row(symbol: str, ts: int, bids: List, asks: List) -> tuple:
+    return (symbol, int(ts), json.dumps(bids), json.dumps(asks))
+
+@_timed
+def get_orderbook_snapshots(db_path: str, symbol: str, since_ts: Optional[int] = None) -> List[Dict]:
+    """按时间正序读取盘口快照；since_ts 只返回更新的快照（增量加载）"""
+    conn = sqlite3.connect(db_path)
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            SELECT ts, bids_json, asks_json FROM orderbook_snapshots
+            WHERE symbol = ? AND ts > ?
+            ORDER BY ts ASC
+            """,
+            (symbol, int(since_ts) if since_ts is not None else -1)
+        )
+        return [{'ts': r[0], 'bids': json.loads(r[1]), 'asks': json.loads(r[2])} for r in cur.fetchall()]
+    finally:
+        conn.close()
+
+@_timed
+def upsert_funding_rates(db_path: str, symbol: str, rows: List) -> int:
+    """写入资金费率历史 [(结算时间毫秒, 费率), ...]，已存在的结算时间覆盖"""
+    if not rows:
+        return 0
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO funding_rates (symbol, funding_time, rate) VALUES (?, ?, ?)",
+                [(symbol, int(t), float(r)) for t, r in rows]
+            )
+        return len(rows)
+    finally:
+        conn.close()
+
+@_timed
+def get_funding_rates(db_path: str, symbol: str) -> List:
+    """读取资金费率历史，按结算时间正序返回 [(毫秒, 费率), ...]"""
+    conn = sqlite3.connect(db_path)
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT funding_time, rate FROM funding_rates WHERE symbol = ? ORDER BY funding_time ASC",
+            (symbol,)
+        )
+        return [(int(t), float(r)) for t, r in cur.fetchall()]
+    finally:
+        conn.close()
+
+# 归档时移到压缩文件的 JSON 字段；其余为热表常驻的标量字段
+_BLOB_COLUMNS = ('market_data_json', 'account_status_json', 'position_info_json', 'raw_decision_json')
+_SCALAR_COLUMNS = ('id', 'timestamp', 'ts_ms', 'symbol', 'current_price', 'action', 'confidence_level', 'reason',
+                   'position_size', 'stop_loss_price', 'take_profit_price', 'executed', 'archived')
+
+
+def _decision_dicts(db_path: str, rows) -> List[Dict]:
+    """sqlite3.Row 转字典：压缩的 JSON 字段解码为文本，已归档的行从归档文件补齐 JSON 字段"""
+    items = [{k: r[k] for k in r.keys()} for r in rows]
+    for item in items:
+        for col in _BLOB_COLUMNS:
+            if isinstance(item.get(col), bytes):
+                item[col] = decode_blob(db_path, item[col])
+    archived: Dict[str, List[Dict]] = {}
+    for item in items:
+        if item.get('archived') and item.get('raw_decision_json') is None:
+            archived.setdefault(item['archived'], []).append(item)
+    if archived:
+        import archive  # archive 依赖 db，这里延迟导入
+        directory = archive.archive_dir(db_path)
+        for month, part in archived.items():
+            found = archive.fetch(directory, month, [i['id'] for i in part])
+            for item in part:
+                full = found.get(item['id']) or {}
+                for col in _BLOB_COLUMNS:
+                    item[col] = full.get(col)
+    return items
+
+
+@_timed
 def get_recent_decisions(
     db_path: str,
     symbol: Optional[str] = None,
@@ -305,7 +1368,7 @@ def get_recent_decisions(
                 """
                 SELECT * FROM decisions
                 WHERE symbol = ?
-                ORDER BY timestamp DESC
+                ORDER BY ts_ms DESC, id DESC
                 LIMIT ?
                 """,
                 (symbol, limit),
@@ -314,15 +1377,13 @@ def get_recent_decisions(
             cur.execute(
                 """
                 SELECT * FROM decisions
-                ORDER BY timestamp DESC
+                ORDER BY ts_ms DESC, id DESC
                 LIMIT ?
                 """,
                 (limit,),
             )
-        rows = cur.fetchall()
         results: List[Dict] = []
-        for r in rows:
-            item = {k: r[k] for k in r.keys()}
+        for item in _decision_dicts(db_path, cur.fetchall()):
             # 还原部分JSON字段，便于直接用于AI提示词历史上下文
             try:
                 item["decision"] = json.loads(item.get("raw_decision_json") or "{}")
@@ -355,6 +1416,7 @@ def summarize_history_for_prompt(rows: List[Dict]) -> List[Dict]:
     return summarized
 
 
+@_timed
 def get_decisions_paginated(
     db_path: str,
     symbol: Optional[str],
@@ -386,7 +1448,7 @@ def get_decisions_paginated(
                 """
                 SELECT * FROM decisions
                 WHERE symbol = ?
-                ORDER BY timestamp DESC
+                ORDER BY ts_ms DESC, id DESC
                 LIMIT ? OFFSET ?
                 """,
                 (symbol, page_size, offset),
@@ -395,15 +1457,13 @@ def get_decisions_paginated(
             cur.execute(
                 """
                 SELECT * FROM decisions
-                ORDER BY timestamp DESC
+                ORDER BY ts_ms DESC, id DESC
                 LIMIT ? OFFSET ?
                 """,
                 (page_size, offset),
             )
-        rows = cur.fetchall()
         data: List[Dict] = []
-        for r in rows:
-            item = {k: r[k] for k in r.keys()}
+        for item in _decision_dicts(db_path, cur.fetchall()):
             try:
                 item["decision"] = json.loads(item.get("raw_decision_json") or "{}")
             except Exception:
@@ -414,6 +1474,7 @@ def get_decisions_paginated(
         conn.close()
 
 
+@_timed
 def get_all_decisions(db_path: str, symbol: Optional[str] = None) -> List[Dict]:
     """获取全部历史决策（可按symbol筛选），时间倒序"""
     conn = sqlite3.connect(db_path)
@@ -425,7 +1486,7 @@ def get_all_decisions(db_path: str, symbol: Optional[str] = None) -> List[Dict]:
                 """
                 SELECT * FROM decisions
                 WHERE symbol = ?
-                ORDER BY timestamp DESC
+                ORDER BY ts_ms DESC, id DESC
                 """,
                 (symbol,),
             )
@@ -433,18 +1494,285 @@ def get_all_decisions(db_path: str, symbol: Optional[str] = None) -> List[Dict]:
             cur.execute(
                 """
                 SELECT * FROM decisions
-                ORDER BY timestamp DESC
+                ORDER BY ts_ms DESC, id DESC
                 """
             )
-        rows = cur.fetchall()
-        results: List[Dict] = []
-        for r in rows:
-            results.append({k: r[k] for k in r.keys()})
-        return results
+        return _decision_dicts(db_path, cur.fetchall())
+    finally:
+        conn.close()
+
+
+def _range_where(column: str, symbol: Optional[str], start_ms: Optional[int], end_ms: Optional[int]):
+    """时间范围条件 [start_ms, end_ms)；指定了边界时，尚未回填毫秒列的旧行不在结果中"""
+    clauses, params = [], []
+    if symbol:
+        clauses.append("symbol = ?")
+        params.append(symbol)
+    if start_ms is not None:
+        clauses.append(f"{column} >= ?")
+        params.append(int(start_ms))
+    if end_ms is not None:
+        clauses.append(f"{column} < ?")
+        params.append(int(end_ms))
+    return " AND ".join(clauses) or "1", params
+
+
+@_timed
+def get_decisions_range(
+    db_path: str,
+    symbol: Optional[str] = None,
+    start_ms: Optional[int] = None,
+    end_ms: Optional[int] = None,
+    limit: Optional[int] = None,
+    ascending: bool = False,
+    blobs: bool = True
+) -> List[Dict]:
+    """按毫秒时间范围 [start_ms, end_ms) 查询决策（走 symbol, ts_ms 索引的范围扫描）
+
+    ascending=True 时按时间正序返回（回测回放），否则倒序（历史/导出）。不指定范围时与
+    get_all_decisions 相同，尚未回填的旧行按 id 排在最早处。
+    blobs=False 时只读取标量字段（回测、导出），不读取 JSON 字段，也不访问归档文件。
+    """
+    where, params = _range_where("ts_ms", symbol, start_ms, end_ms)
+    order = "ASC" if ascending else "DESC"
+    cols = "*" if blobs else ", ".join(_SCALAR_COLUMNS)
+    sql = f"SELECT {cols} FROM decisions WHERE {where} ORDER BY ts_ms {order}, id {order}"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(int(limit))
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+    if not blobs:
+        return [{k: r[k] for k in r.keys()} for r in rows]
+    return _decision_dicts(db_path, rows)
+
+
+def _has_fts(conn: sqlite3.Connection) -> bool:
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'decisions_fts'"
+    ).fetchone() is not None
+
+
+def _like_escape(text: str) -> str:
+    return "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+@_timed
+def search_decisions(
+    db_path: str,
+    query: str,
+    symbol: Optional[str] = None,
+    start_ms: Optional[int] = None,
+    end_ms: Optional[int] = None,
+    actions: Optional[List[str]] = None,
+    limit: int = 50,
+    offset: int = 0
+) -> Dict:
+    """在决策 reason 中全文搜索，可按交易对、时间范围 [start_ms, end_ms)、动作过滤，按 id 倒序（最近写入在前）
+
+    query 按空白拆分为多个词，全部包含才匹配。不少于三个字符的词走 decisions_fts 的 trigram 索引，
+    由索引按行id倒序驱动查询，凑满 limit 即停止，不必对全部命中行排序；trigram 无法索引更短的词
+    （如“突破”），这些词在索引命中的候选行上用 LIKE 过滤，查询中只有短词时按 id 倒序扫描
+    （常见词很快，罕见短词接近全表扫描）。
+    返回 {'data': [标量字段 + reason_highlight], 'has_more': bool}；未完成回填时旧行可能搜不到。
+    """
+    terms = [t for t in (query or "").split() if t]
+    if not terms:
+        return {"data": [], "has_more": False}
+    long_terms = [t for t in terms if len(t) >= 3]
+    short_terms = [t for t in terms if len(t) < 3]
+    where, params = _range_where("d.ts_ms", None, start_ms, end_ms)
+    clauses, params = [where], list(params)
+    if symbol:
+        clauses.append("d.symbol = ?")
+        params.append(symbol)
+    if actions:
+        clauses.append(f"d.action IN ({', '.join('?' * len(actions))})")
+        params.extend(actions)
+    cols = ", ".join(f"d.{c}" for c in _SCALAR_COLUMNS)
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.row_factory = sqlite3.Row
+        use_fts = bool(long_terms) and _has_fts(conn)
+        if not use_fts:
+            short_terms = terms
+        for t in short_terms:
+            clauses.append("d.reason LIKE ? ESCAPE '\\'")
+            params.append(_like_escape(t))
+        if use_fts:
+            # 每个词作为短语加引号，避免 AND/OR/NEAR 等被解析为运算符
+            match = " AND ".join('"' + t.replace('"', '""') + '"' for t in long_terms)
+            sql = (f"SELECT {cols}, highlight(decisions_fts, 0, '<mark>', '</mark>') AS reason_highlight "
+                   f"FROM decisions_fts CROSS JOIN decisions d ON d.id = decisions_fts.rowid "
+                   f"WHERE decisions_fts MATCH ? AND {' AND '.join(clauses)}")
+            params.insert(0, match)
+        else:
+            sql = f"SELECT {cols}, NULL AS reason_highlight FROM decisions d WHERE {' AND '.join(clauses)}"
+        sql += f" ORDER BY {'decisions_fts.rowid' if use_fts else 'd.id'} DESC LIMIT ? OFFSET ?"
+        params.extend([int(limit) + 1, int(offset)])
+        rows = [{k: r[k] for k in r.keys()} for r in conn.execute(sql, params)]
     finally:
         conn.close()
+    return {"data": rows[:limit], "has_more": len(rows) > limit}
 
 
+@_timed
+def decision_stats(
+    db_path: str,
+    symbol: Optional[str] = None,
+    start_ms: Optional[int] = None,
+    end_ms: Optional[int] = None,
+    bucket: str = 'hour',
+    tz_offset_hours: int = 0,
+    series_buckets: Optional[int] = None
+) -> Dict:
+    """决策统计：总数/已执行比例、按动作/置信度/交易对的分布、一天内各小时的活跃度，以及按小时或天的时间序列
+
+    全部由汇总表 GROUP BY 得到，与决策总行数无关：不限时间范围时分布读取 decision_totals（行数固定）；
+    指定 [start_ms, end_ms) 时读取 decision_rollups，耗时与范围内的小时数成正比（start 向下取整到小时）。
+    时间序列限于指定范围；不指定范围时为最近 series_buckets 个桶（默认 168 小时或 90 天）。
+    tz_offset_hours 用于按本地时区划分天与“几点”（如 8 为北京时间）。
+    汇总表回填未完成时 complete 为 False，旧数据尚未全部计入。
+    """
+    offset = int(tz_offset_hours) * _ROLLUP_BUCKET_MS
+    size = 86400000 if bucket == 'day' else _ROLLUP_BUCKET_MS
+    conn = sqlite3.connect(db_path)
+    try:
+        cur = conn.cursor()
+
+        def where(table: str, lo: Optional[int], hi: Optional[int]):
+            clauses, params = ["n != 0"], []
+            if symbol:
+                clauses.append("symbol = ?")
+                params.append(symbol)
+            if lo is not None:
+                clauses.append("bucket_ms >= ?")
+                params.append(int(lo) // _ROLLUP_BUCKET_MS * _ROLLUP_BUCKET_MS)
+            if hi is not None:
+                clauses.append("bucket_ms < ?")
+                params.append(int(hi))
+            return f"FROM {table} WHERE {' AND '.join(clauses)}", params
+
+        def add(d: Dict, key, n: int, e: int):
+            c = d.setdefault(key, {"count": 0, "executed": 0})
+            c["count"] += n
+            c["executed"] += e
+
+        if start_ms is None and end_ms is None:
+            dist = where('decision_totals', None, None)
+            hour_expr = f"(hour_of_day + {int(tz_offset_hours)} + 24) % 24"
+            # 序列：以最新的小时为终点向前 series_buckets 个桶
+            latest = cur.execute(
+                "SELECT MAX(bucket_ms) FROM decision_rollups" + (" WHERE symbol = ?" if symbol else ""),
+                (symbol,) if symbol else ()
+            ).fetchone()[0]
+            count = int(series_buckets or (90 if size == 86400000 else 168))
+            if latest is None:
+                series_src = None
+            else:
+                end = ((latest + offset) // size + 1) * size - offset
+                series_src = where('decision_rollups', end - count * size, end)
+        else:
+            dist = series_src = where('decision_rollups', start_ms, end_ms)
+            hour_expr = f"(bucket_ms / {_ROLLUP_BUCKET_MS} + {int(tz_offset_hours)} + 24) % 24"
+        # 各维度的分布由一次 GROUP BY 的结果在内存中合计（结果行数不超过 交易对×动作×置信度×24）
+        by_action: Dict[str, Dict] = {}
+        by_confidence: Dict[str, Dict] = {}
+        by_symbol: Dict[str, Dict] = {}
+        by_hour: Dict[int, Dict] = {}
+        total = executed = 0
+        for sym, action, confidence, hour, n, e in cur.execute(
+            f"SELECT symbol, action, confidence_level, {hour_expr}, SUM(n), SUM(executed) {dist[0]} "
+            f"GROUP BY 1, 2, 3, 4", dist[1]
+        ):
+            total += n
+            executed += e
+            add(by_action, action, n, e)
+            add(by_confidence, confidence, n, e)
+            add(by_symbol, sym, n, e)
+            add(by_hour, hour, n, e)
+        series = []
+        if series_src:
+            series = [
+                {"bucket_ms": b * size - offset, "count": n, "executed": e}
+                for b, n, e in cur.execute(
+                    f"SELECT (bucket_ms + {offset}) / {size}, SUM(n), SUM(executed) {series_src[0]} "
+                    f"GROUP BY 1 ORDER BY 1", series_src[1]
+                )
+            ]
+        pending = cur.execute(
+            "SELECT 1 FROM schema_migrations WHERE version = 7 AND completed_at IS NULL"
+        ).fetchone()
+        return {
+            "total": total,
+            "executed": executed,
+            "executed_ratio": round(executed / total, 4) if total else None,
+            "by_action": {k: v["count"] for k, v in sorted(by_action.items())},
+            "by_confidence": {k: v["count"] for k, v in sorted(by_confidence.items())},
+            "by_symbol": dict(sorted(by_symbol.items())),
+            "by_hour_of_day": {k: v["count"] for k, v in sorted(by_hour.items())},
+            "bucket": 'day' if size == 86400000 else 'hour',
+            "series": series,
+            "complete": pending is None,
+        }
+    finally:
+        conn.close()
+
+
+@_timed
+def rebuild_decision_rollups(db_path: str) -> int:
+    """从 decisions 全表 GROUP BY 重建汇总表（修复用，执行期间阻塞写入），返回小时汇总行数"""
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            for table, (column, expr) in _ROLLUP_TABLES.items():
+                conn.execute(f"DELETE FROM {table}")
+                conn.execute(
+                    f"""
+                    INSERT INTO {table} (symbol, {column}, action, confidence_level, n, executed)
+                    SELECT symbol, {expr.format(r='decisions')}, COALESCE(action, ''), COALESCE(confidence_level, ''),
+                           COUNT(*), SUM(CASE WHEN executed THEN 1 ELSE 0 END)
+                    FROM decisions GROUP BY 1, 2, 3, 4
+                    """
+                )
+            # 全部行已计入：结束未完成的回填，触发器对所有行生效
+            conn.execute(
+                "UPDATE schema_migrations SET backfill_cursor = backfill_until, completed_at = ? "
+                "WHERE version = 7 AND completed_at IS NULL",
+                (datetime.now(timezone.utc).isoformat(),)
+            )
+        return conn.execute("SELECT COUNT(*) FROM decision_rollups").fetchone()[0]
+    finally:
+        conn.close()
+
+
+@_timed
+def sim_positions_range(
+    db_path: str,
+    symbol: Optional[str] = None,
+    start_ms: Optional[int] = None,
+    end_ms: Optional[int] = None,
+    limit: Optional[int] = None
+) -> List[Dict]:
+    """按开仓时间范围 [start_ms, end_ms) 查询模拟持仓，时间倒序"""
+    where, params = _range_where("open_ms", symbol, start_ms, end_ms)
+    sql = f"SELECT * FROM sim_positions WHERE {where} ORDER BY open_ms DESC, id DESC"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(int(limit))
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.row_factory = sqlite3.Row
+        return [{k: r[k] for k in r.keys()} for r in conn.execute(sql, params)]
+    finally:
+        conn.close()
+
+
+@_timed
 def clear_all_decisions(db_path: str) -> int:
     """清除所有历史决策数据，返回删除的行数"""
     conn = sqlite3.connect(db_path)
@@ -453,17 +1781,89 @@ def clear_all_decisions(db_path: str) -> int:
         cur.execute("SELECT COUNT(*) FROM decisions")
         count_before = cur.fetchone()[0]
         
+        # 先清空全文索引，删除触发器逐行执行时不必再查找索引
+        if _has_fts(conn):
+            cur.execute("DELETE FROM decisions_fts")
         cur.execute("DELETE FROM decisions")
+        # 删除触发器留下的条数为0的汇总行
+        for table in _ROLLUP_TABLES:
+            cur.execute(f"DELETE FROM {table}")
         conn.commit()
         
         cur.execute("SELECT COUNT(*) FROM decisions")
         count_after = cur.fetchone()[0]
+
+        # 已归档的冷数据一并删除
+        import archive
+        archive.remove_all(archive.archive_dir(db_path))
         
         return count_before - count_after
     finally:
         conn.close()
 
 
+@_timed
+def decisions_for_archive(db_path: str, before_ms: int, limit: int = 500) -> List[Dict]:
+    """早于 before_ms 且尚未归档的决策（完整行，JSON 字段为文本，时间正序）"""
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute(
+            "SELECT * FROM decisions WHERE ts_ms < ? AND archived IS NULL ORDER BY ts_ms, id LIMIT ?",
+            (int(before_ms), int(limit))
+        ).fetchall()
+        return _decision_dicts(db_path, rows)
+    finally:
+        conn.close()
+
+
+@_timed
+def mark_decisions_archived(db_path: str, months: Dict[int, str]) -> int:
+    """在一个事务内清空已写入归档的行的 JSON 字段并记录月份，返回更新的行数"""
+    if not months:
+        return 0
+    sets = ', '.join(f"{c} = NULL" for c in _BLOB_COLUMNS)
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            cur = conn.executemany(
+                f"UPDATE decisions SET {sets}, archived = ? WHERE id = ? AND archived IS NULL",
+                [(month, rid) for rid, month in months.items()]
+            )
+        return cur.rowcount
+    finally:
+        conn.close()
+
+
+@_timed
+def archive_counts(db_path: str) -> Dict:
+    conn = sqlite3.connect(db_path)
+    try:
+        total, archived = conn.execute("SELECT COUNT(*), COUNT(archived) FROM decisions").fetchone()
+        return {'hot_rows': int(total) - int(archived), 'archived_rows': int(archived)}
+    finally:
+        conn.close()
+
+
+def set_journal_mode(db_path: str, wal: bool = True) -> str:
+    """切换日志模式（WAL 下读取不被写事务阻塞），返回切换后的模式；需在其他连接打开前调用"""
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        return conn.execute(f"PRAGMA journal_mode={'WAL' if wal else 'DELETE'}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def vacuum(db_path: str):
+    """重建库文件以回收归档释放的空间（执行期间阻塞其他写入）"""
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+
+@_timed
 def update_decision_executed(db_path: str, decision_id: int, executed: int = 1) -> bool:
     """更新决策的执行状态"""
     conn = sqlite3.connect(db_path)
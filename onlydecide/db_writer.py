@@ -0,0 +1,226 @@
+"""异步批量写库：所有写操作进入队列，由一个写线程合并为事务提交。
+
+原先每次 insert_decision / 写快照都要单独打开连接、提交一次（一次 fsync），多交易对或
+高频决策时写入彼此排队，并与读取争用数据库锁。这里改为：
+- 调用方把写操作（接收连接的函数）放入有界队列，立即得到一个 Future；
+- 写线程取出第一项后最多再等待 max_delay 秒、合并至多 max_batch 项，在一个事务内执行并提交，
+  单次提交的 fsync 由整批分摊，写延迟有上界；
+- 每项在各自的 SAVEPOINT 中执行，单项失败只回滚该项并把异常交给它的 Future，不影响同批其他写入；
+- Future 在事务提交之后才完成（ack 即已落盘），需要行 id 或确认写入的调用方 result() 等待即可；
+  flush() 等待此前提交的全部写入完成；
+- 队列满时 submit 阻塞（背压），stop() 写完队列中剩余的操作后关闭连接，之后的写入在调用线程同步执行。
+
+序列化与压缩（db.decision_row 等）在调用线程完成，写线程只执行 SQL。
+"""
+
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import db
+import metrics
+
+DB_WRITER_BATCH_SIZE = metrics.gauge("onlydecide_db_writer_last_batch_size", "写线程最近一个事务合并的写操作数")
+DB_WRITER_COMMIT_SECONDS = metrics.histogram("onlydecide_db_writer_commit_seconds", "写线程单个事务的执行与提交耗时")
+DB_WRITER_LATENCY_SECONDS = metrics.histogram("onlydecide_db_writer_latency_seconds", "写操作从提交到确认落盘的耗时")
+DB_WRITER_QUEUE = metrics.gauge("onlydecide_db_writer_queue_depth", "写队列中等待的操作数")
+DB_WRITER_ERRORS = metrics.counter("onlydecide_db_writer_errors_total", "写操作失败次数（按类型）")
+
+_Op = Tuple[Callable[[sqlite3.Connection], Any], Future, float, str]
+
+
+class DBWriter:
+    """单写线程的批量写库队列"""
+
+    def __init__(self, db_path: str, max_batch: int = 200, max_delay: float = 0.05, max_queue: int = 10000,
+                 wal: bool = True, on_error: Optional[Callable[[str, Exception], None]] = None):
+        self.db_path = db_path
+        self.max_batch = max(1, int(max_batch))
+        self.max_delay = max(0.0, float(max_delay))
+        self.wal = wal
+        self.on_error = on_error
+        self._queue: "queue.Queue[Optional[_Op]]" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stopped = False
+        self.committed = 0
+        self.batches = 0
+        self.last_error: Optional[str] = None
+
+    # ---------- 生命周期 ----------
+    def start(self) -> "DBWriter":
+        with self._lock:
+            if self._thread is None and not self._stopped:
+                self._thread = threading.Thread(target=self._run, name="DBWriter", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 10.0):
+        """写完队列中的操作后停止写线程"""
+        with self._lock:
+            if self._stopped:
+                return
+            self._stopped = True
+            thread = self._thread
+        if thread is not None:
+            self._queue.put(None)
+            thread.join(timeout)
+
+    def _connect(self) -> sqlite3.Connection:
+        # 手动管理事务（BEGIN/SAVEPOINT）
+        conn = sqlite3.connect(self.db_path, isolation_level=None, timeout=30)
+        if self.wal:
+            # WAL 下读取不被写事务阻塞；每批一次提交，synchronous=NORMAL 在 WAL 下不会损坏数据库。
+            # 切换日志模式需要独占数据库（宜先用 db.set_journal_mode 切换），其他连接占用时沿用原模式
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+            except sqlite3.Error as e:
+                self._error("wal", e)
+        return conn
+
+    # ---------- 提交写操作 ----------
+    def submit(self, fn: Callable[[sqlite3.Connection], Any], kind: str = "op") -> Future:
+        """提交一个写操作 fn(conn)，返回在事务提交后完成的 Future（结果为 fn 的返回值）"""
+        future: Future = Future()
+        op = (fn, future, time.perf_counter(), kind)
+        with self._lock:
+            queued = not self._stopped and self._thread is not None
+            if queued:
+                self._queue.put(op)
+        if not queued:
+            # 未启动或已停止：在调用线程同步执行
+            self._execute([op], self._sync_conn())
+            return future
+        DB_WRITER_QUEUE.set(self._queue.qsize())
+        return future
+
+    def _sync_conn(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, isolation_level=None, timeout=30)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待此前提交的写操作全部落盘"""
+        try:
+            self.submit(lambda conn: None, kind="flush").result(timeout)
+            return True
+        except Exception:
+            return False
+
+    def insert_decision(self, symbol: str, market_data: Dict, account_status: Dict, position_info: Dict,
+                        decision: Dict, executed: int = 0) -> Future:
+        """写入一条决策，Future 结果为行 id"""
+        row = db.decision_row(self.db_path, symbol, market_data, account_status, position_info, decision, executed)
+        return self.submit(lambda conn: conn.execute(db.INSERT_DECISION_SQL, row).lastrowid, kind="decision")
+
+    def write_sim_positions(self, rows: List[Dict], snapshots: Optional[List[tuple]] = None) -> Future:
+        """写入模拟持仓行与权益快照（SimLedger 写回），Future 结果为写入的持仓行数"""
+        rows, snapshots = list(rows), list(snapshots or [])
+        return self.submit(lambda conn: db.write_sim_positions(conn, rows, snapshots), kind="sim_positions")
+
+    def insert_orderbook_snapshot(self, symbol: str, ts: int, bids: List, asks: List) -> Future:
+        row = db.orderbook_row(symbol, ts, bids, asks)
+        return self.submit(lambda conn: conn.execute(db.INSERT_ORDERBOOK_SQL, row).lastrowid, kind="orderbook")
+
+    # ---------- 写线程 ----------
+    def _run(self):
+        conn = self._connect()
+        try:
+            while True:
+                first = self._queue.get()
+                if first is None:
+                    break
+                batch = [first]
+                deadline = time.perf_counter() + self.max_delay
+                stopping = False
+                while len(batch) < self.max_batch:
+                    remaining = deadline - time.perf_counter()
+                    try:
+                        op = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if op is None:
+                        stopping = True
+                        break
+                    batch.append(op)
+                DB_WRITER_QUEUE.set(self._queue.qsize())
+                self._execute(batch, conn)
+                if stopping:
+                    break
+            # 停止前写完剩余操作
+            rest = []
+            while True:
+                try:
+                    op = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if op is not None:
+                    rest.append(op)
+            for i in range(0, len(rest), self.max_batch):
+                self._execute(rest[i:i + self.max_batch], conn)
+        finally:
+            conn.close()
+
+    def _execute(self, batch: List[_Op], conn: sqlite3.Connection):
+        started = time.perf_counter()
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for fn, future, _, kind in batch:
+                conn.execute("SAVEPOINT op")
+                try:
+                    results.append((future, fn(conn), None))
+                    conn.execute("RELEASE op")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO op")
+                    conn.execute("RELEASE op")
+                    results.append((future, None, e))
+                    self._error(kind, e)
+            conn.execute("COMMIT")
+        except Exception as e:
+            # 开始或提交事务失败：整批失败
+            try:
+                conn.execute("ROLLBACK")
+            except Exception:
+                pass
+            self._error("commit", e)
+            for _, future, _, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            if conn is not None and self._thread is not threading.current_thread():
+                conn.close()
+        now = time.perf_counter()
+        DB_WRITER_COMMIT_SECONDS.observe(now - started)
+        DB_WRITER_BATCH_SIZE.set(len(batch))
+        self.batches += 1
+        self.committed += len(batch)
+        for (_, _, queued_at, _), (future, result, error) in zip(batch, results):
+            DB_WRITER_LATENCY_SECONDS.observe(now - queued_at)
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def _error(self, kind: str, e: Exception):
+        DB_WRITER_ERRORS.inc(kind=kind)
+        self.last_error = f"{kind}: {e}"
+        if self.on_error:
+            try:
+                self.on_error(kind, e)
+            except Exception:
+                pass
+
+    def status(self) -> Dict:
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "queue_depth": self._queue.qsize(),
+            "committed": self.committed,
+            "batches": self.batches,
+            "max_batch": self.max_batch,
+            "max_delay": self.max_delay,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,254 @@
+"""AI决策解析：预编译正则 + 单遍括号扫描 + 单次遍历的模板校验。
+
+test.py 中的 DeepSeekAI 通过本模块解析模型输出，流式增量提取也复用这里的扫描器。
+"""
+
+import json
+import re
+from typing import Dict, Iterator, List, Optional, Tuple
+
+VALID_ACTIONS = frozenset(("hold", "open_long", "open_short"))  # 移除了平仓操作
+VALID_CONFIDENCES = frozenset(("high", "medium", "low"))
+TD_FIELDS = ("action", "confidence_level", "reason")
+PM_FIELDS = ("position_size", "stop_loss_price", "take_profit_price")
+
+# 手动构建时按顺序尝试的模式（预编译，避免每次解析重复编译）
+_ACTION_PATTERNS = (
+    re.compile(r'"action"\s*:\s*"(\w+)"', re.IGNORECASE),
+    re.compile(r'action["\']?\s*:\s*["\']?(\w+)', re.IGNORECASE),
+    re.compile(r'操作["\']?\s*:\s*["\']?(\w+)', re.IGNORECASE),
+)
+_REASON_PATTERNS = (
+    re.compile(r'"reason"\s*:\s*"([^"]*)"', re.IGNORECASE),
+    re.compile(r'reason["\']?\s*:\s*["\']?([^"\']+)', re.IGNORECASE),
+    re.compile(r'理由["\']?\s*:\s*["\']?([^"\']+)', re.IGNORECASE),
+)
+# 模型偶尔照抄模板里的 // 注释或留下尾逗号，解析失败时清理后再试一次
+_LINE_COMMENT_RE = re.compile(r'("(?:[^"\\]|\\.)*")|//[^\n]*')
+_TRAILING_COMMA_RE = re.compile(r',(\s*[}\]])')
+# 回显文件中每条日志的行首
+_ECHO_LINE_RE = re.compile(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}(?:\.\d+)? - (?:ECHO|ERROR): ')
+_RAW_RESPONSE_MARK = "AI原始响应: "
+# 括号扫描用：对象外只关心 "{"；对象内关心括号与引号；字符串内只关心引号与反斜杠
+_OPEN_BRACE_RE = re.compile(r'\{')
+_STRUCT_TOKEN_RE = re.compile(r'[{}"]')
+_STRING_TOKEN_RE = re.compile(r'["\\]')
+
+DEFAULT_REASON = "基于多时间维度K线分析做出的决策"
+
+
+def default_hold_decision(reason: str, confidence_level: str = "low") -> Dict:
+    """保守的持有决策"""
+    return {
+        "trading_decision": {
+            "action": "hold",
+            "confidence_level": confidence_level,
+            "reason": reason
+        },
+        "position_management": {
+            "position_size": 0,
+            "stop_loss_price": 0,
+            "take_profit_price": 0
+        }
+    }
+
+
+def validate_decision(decision) -> bool:
+    """单次遍历校验决策是否符合模板（字段齐全、action/confidence取值合法）"""
+    if not isinstance(decision, dict):
+        return False
+    td = decision.get("trading_decision")
+    pm = decision.get("position_management")
+    if not isinstance(td, dict) or not isinstance(pm, dict):
+        return False
+    for field in TD_FIELDS:
+        if field not in td:
+            return False
+    for field in PM_FIELDS:
+        if field not in pm:
+            return False
+    return td["action"] in VALID_ACTIONS and td["confidence_level"] in VALID_CONFIDENCES
+
+
+class BraceScanner:
+    """可续扫的括号扫描器：记录字符串/转义状态与每层对象的起点，字符只扫描一次。
+
+    借助预编译正则直接跳到下一个结构字符（括号、引号、反斜杠），普通字符不进入Python循环。
+    每当一个对象闭合时产出 (start, end, depth)，内层对象先于外层对象产出；
+    顶层对象之外的引号（如说明文字中的引号）不会影响状态。
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._stack: List[int] = []
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk: str) -> Iterator[Tuple[int, int, int]]:
+        self.text += chunk
+        text = self.text
+        stack = self._stack
+        n = len(text)
+        i = self._pos
+        if self._escape and i < n:
+            self._escape = False
+            i += 1
+        while i < n:
+            if self._in_string:
+                m = _STRING_TOKEN_RE.search(text, i)
+                if m is None:
+                    break
+                i = m.end()
+                if m.group() == '"':
+                    self._in_string = False
+                elif i >= n:
+                    # 反斜杠位于末尾，被转义的字符在下一段
+                    self._escape = True
+                    break
+                else:
+                    i += 1
+                continue
+            m = (_STRUCT_TOKEN_RE if stack else _OPEN_BRACE_RE).search(text, i)
+            if m is None:
+                break
+            ch = m.group()
+            i = m.end()
+            if ch == '"':
+                self._in_string = True
+            elif ch == '{':
+                stack.append(i - 1)
+            else:
+                start = stack.pop()
+                self._pos = i
+                yield start, i, len(stack)
+        self._pos = n
+
+
+def iter_json_objects(text: str) -> Iterator[str]:
+    """单遍扫描文本，按闭合顺序产出所有括号平衡的 {...} 片段"""
+    scanner = BraceScanner()
+    for start, end, _depth in scanner.feed(text):
+        yield text[start:end]
+
+
+def _loads_lenient(candidate: str):
+    # strict=False：模型常在字符串内直接换行（多行 reason），按原样接受控制字符
+    try:
+        return json.loads(candidate, strict=False)
+    except ValueError:
+        pass
+    cleaned = _LINE_COMMENT_RE.sub(lambda m: m.group(1) or "", candidate)
+    cleaned = _TRAILING_COMMA_RE.sub(r'\1', cleaned)
+    try:
+        return json.loads(cleaned, strict=False)
+    except ValueError:
+        return None
+
+
+def extract_decision(text: str) -> Optional[Dict]:
+    """从任意文本中提取第一个符合模板的决策对象"""
+    for candidate in iter_json_objects(text):
+        if '"trading_decision"' not in candidate:
+            continue
+        obj = _loads_lenient(candidate)
+        if validate_decision(obj):
+            return obj
+    return None
+
+
+def build_decision_from_text(text: str) -> Dict:
+    """无法提取完整JSON时，用预编译正则从文本中拼出标准格式决策"""
+    decision = default_hold_decision("", confidence_level="medium")
+    td = decision["trading_decision"]
+
+    for pattern in _ACTION_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            action = match.group(1).lower()
+            if action in VALID_ACTIONS:
+                td["action"] = action
+                break
+
+    for pattern in _REASON_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            reason = match.group(1).strip()
+            if reason:
+                td["reason"] = reason
+                break
+
+    if not td["reason"]:
+        td["reason"] = DEFAULT_REASON
+    return decision
+
+
+def parse_decision(text: str) -> Tuple[Dict, str]:
+    """解析AI响应，返回 (决策, 方式)；方式为 direct / extracted / manual"""
+    stripped = (text or "").strip()
+    if stripped.startswith("{"):
+        try:
+            decision = json.loads(stripped, strict=False)
+        except ValueError:
+            decision = None
+        if validate_decision(decision):
+            return decision, "direct"
+
+    decision = extract_decision(text or "")
+    if decision is not None:
+        return decision, "extracted"
+
+    return build_decision_from_text(text or ""), "manual"
+
+
+class IncrementalDecisionExtractor:
+    """增量JSON提取器：逐段喂入流式文本，决策对象一闭合即尝试解析。
+
+    基于 BraceScanner，已扫描过的字符不会重复扫描。
+    """
+
+    def __init__(self, validator=None):
+        self.validator = validator or validate_decision
+        self._scanner = BraceScanner()
+
+    @property
+    def buffer(self) -> str:
+        return self._scanner.text
+
+    def append(self, chunk: str):
+        """仅追加文本，不再扫描（提取到决策后收集剩余内容用）"""
+        self._scanner.text += chunk
+
+    def feed(self, chunk: str) -> Optional[Dict]:
+        """追加文本片段；若得到符合模板的决策则返回，否则返回None"""
+        if not chunk:
+            return None
+        for start, end, _depth in self._scanner.feed(chunk):
+            candidate = self._scanner.text[start:end]
+            if '"trading_decision"' not in candidate:
+                continue
+            obj = _loads_lenient(candidate)
+            if isinstance(obj, dict) and self.validator(obj):
+                return obj
+        return None
+
+
+def load_echo_corpus(path: str) -> List[str]:
+    """从回显文件(huixian.txt)中提取所有“AI原始响应”，支持跨行的多行响应"""
+    corpus: List[str] = []
+    current: Optional[List[str]] = None
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for raw in f:
+            line = raw.rstrip("\r\n")
+            if _ECHO_LINE_RE.match(line):
+                if current is not None:
+                    corpus.append("\n".join(current))
+                    current = None
+                idx = line.find(_RAW_RESPONSE_MARK)
+                if idx >= 0:
+                    current = [line[idx + len(_RAW_RESPONSE_MARK):]]
+            elif current is not None:
+                current.append(line)
+    if current is not None:
+        corpus.append("\n".join(current))
+    return corpus
@@ -0,0 +1,254 @@
+"""多交易对决策引擎：每个交易对独立调度，在有界线程池中执行。
+
+- 每个交易对有独立的 AlignedSchedule（按K线收盘对齐）、快照缓存与模拟账本锁；
+- 单个调度线程只负责派发，真正的采集/决策在最多 max_workers 个工作线程中执行，
+  同一交易对同时最多运行一个周期，超时按调度策略补跑或跳过；
+- 交易所与LLM的并发上限由所有交易对共享（ExchangeLimits），避免几十个交易对在
+  同一根K线收盘时同时打满接口；
+- SnapshotCache 合并并发加载：多个交易对同时需要账户余额时只请求一次。
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import metrics
+import scheduler
+
+ENGINE_ACTIVE_WORKERS = metrics.gauge("onlydecide_engine_active_workers", "正在执行决策周期的工作线程数")
+ENGINE_QUEUE_SECONDS = metrics.histogram("onlydecide_engine_queue_wait_seconds", "周期到期后等待空闲工作线程的时间")
+ENGINE_LIMIT_WAIT_SECONDS = metrics.histogram("onlydecide_engine_limit_wait_seconds", "等待共享并发名额的时间")
+SNAPSHOT_CACHE_TOTAL = metrics.counter("onlydecide_snapshot_cache_total", "快照缓存命中/加载次数")
+
+
+class SnapshotCache:
+    """带TTL的快照缓存；同一键的并发加载只执行一次"""
+
+    def __init__(self):
+        self._data: Dict[Any, Tuple[Any, float]] = {}
+        self._lock = threading.Lock()
+        self._key_locks: Dict[Any, threading.Lock] = {}
+
+    def _key_lock(self, key) -> threading.Lock:
+        with self._lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = threading.Lock()
+            return lock
+
+    def _fresh(self, key, ttl: float):
+        item = self._data.get(key)
+        if item is not None and time.monotonic() - item[1] < ttl:
+            return item
+        return None
+
+    def get(self, key, loader: Callable[[], Any], ttl: float):
+        """返回缓存值；过期或不存在时调用 loader 加载（ttl<=0 表示不缓存，但仍记录快照）"""
+        if ttl > 0:
+            item = self._fresh(key, ttl)
+            if item is not None:
+                SNAPSHOT_CACHE_TOTAL.inc(result="hit")
+                return item[0]
+        with self._key_lock(key):
+            if ttl > 0:
+                # 等锁期间其他线程可能已完成加载
+                item = self._fresh(key, ttl)
+                if item is not None:
+                    SNAPSHOT_CACHE_TOTAL.inc(result="hit")
+                    return item[0]
+            value = loader()
+            SNAPSHOT_CACHE_TOTAL.inc(result="load")
+            self.put(key, value)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+
+    def peek(self, key) -> Tuple[Any, Optional[float]]:
+        """返回 (值, 距写入秒数)，不存在时为 (None, None)"""
+        item = self._data.get(key)
+        if item is None:
+            return None, None
+        return item[0], time.monotonic() - item[1]
+
+    def drop(self, predicate: Callable[[Any], bool]):
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                self._data.pop(key, None)
+
+
+class ExchangeLimits:
+    """所有交易对共享的并发名额（按交易所/服务区分）"""
+
+    def __init__(self, limits: Dict[str, int]):
+        self._sems = {name: threading.BoundedSemaphore(max(1, int(n))) for name, n in limits.items()}
+        self.limits = {name: max(1, int(n)) for name, n in limits.items()}
+
+    @contextmanager
+    def slot(self, name: str):
+        sem = self._sems.get(name)
+        if sem is None:
+            yield
+            return
+        started = time.perf_counter()
+        sem.acquire()
+        ENGINE_LIMIT_WAIT_SECONDS.observe(time.perf_counter() - started, limit=name)
+        try:
+            yield
+        finally:
+            sem.release()
+
+
+class SymbolState:
+    """单个交易对的调度与运行状态"""
+
+    def __init__(self, symbol: str, schedule: scheduler.AlignedSchedule):
+        self.symbol = symbol
+        self.schedule = schedule
+        # 模拟账本锁：同一交易对的开平仓（自动周期与手动接口）串行执行
+        self.ledger_lock = threading.RLock()
+        self.running = False
+        self.queued_at: Optional[float] = None
+        self.last_started: Optional[float] = None
+        self.last_finished: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def status(self) -> Dict:
+        status = self.schedule.status()
+        status.update({
+            "symbol": self.symbol,
+            "running": self.running,
+            "last_started": self.last_started,
+            "last_finished": self.last_finished,
+            "last_error": self.last_error,
+        })
+        return status
+
+
+class DecisionEngine:
+    """按交易对派发决策周期的引擎"""
+
+    def __init__(self, job: Callable[[str], None], symbols: Callable[[], Iterable[str]],
+                 interval, offset=0.0, policy="skip", max_workers: int = 4,
+                 limits: Optional[Dict[str, int]] = None,
+                 on_error: Optional[Callable[[str, Exception], None]] = None):
+        self.job = job
+        self._symbols = symbols
+        self._interval = interval
+        self._offset = offset
+        self._policy = policy
+        self.max_workers = max(1, int(max_workers))
+        self.limits = ExchangeLimits(limits or {})
+        self.cache = SnapshotCache()
+        self.on_error = on_error
+        self._states: Dict[str, SymbolState] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._thread: Optional[threading.Thread] = None
+        self._active = 0
+
+    def state(self, symbol: str) -> SymbolState:
+        """获取（必要时创建）交易对状态；手动接口也可借此拿到账本锁"""
+        with self._lock:
+            st = self._states.get(symbol)
+            if st is None:
+                schedule = scheduler.AlignedSchedule(self._interval, self._offset, self._policy,
+                                                     name=f"ai_decision:{symbol}")
+                st = self._states[symbol] = SymbolState(symbol, schedule)
+            return st
+
+    def ledger(self, symbol: str) -> threading.RLock:
+        return self.state(symbol).ledger_lock
+
+    def symbols(self) -> List[str]:
+        seen = []
+        for sym in self._symbols() or []:
+            sym = str(sym).strip()
+            if sym and sym not in seen:
+                seen.append(sym)
+        return seen
+
+    def _sync(self) -> List[SymbolState]:
+        """按当前配置增删交易对；被移除但仍在运行的交易对等本轮结束后再移除"""
+        wanted = self.symbols()
+        for sym in wanted:
+            self.state(sym)
+        with self._lock:
+            for sym in [s for s, st in self._states.items() if s not in wanted and not st.running]:
+                self._states.pop(sym, None)
+                self.cache.drop(lambda k, sym=sym: isinstance(k, tuple) and k[0] == sym)
+            return [self._states[s] for s in wanted if s in self._states]
+
+    def _run(self, st: SymbolState):
+        with self._lock:
+            self._active += 1
+            ENGINE_ACTIVE_WORKERS.set(self._active)
+        ENGINE_QUEUE_SECONDS.observe(time.time() - (st.queued_at or time.time()))
+        st.schedule.mark_started()
+        st.last_started = time.time()
+        started = time.perf_counter()
+        try:
+            self.job(st.symbol)
+            st.last_error = None
+        except Exception as e:
+            st.last_error = str(e)
+            if self.on_error:
+                self.on_error(st.symbol, e)
+        finally:
+            st.schedule.mark_finished(time.perf_counter() - started)
+            st.last_finished = time.time()
+            st.running = False
+            with self._lock:
+                self._active -= 1
+                ENGINE_ACTIVE_WORKERS.set(self._active)
+            # 让调度线程立刻重新评估（catch_up 策略可能需要立即补跑）
+            self._wake.set()
+
+    def run_forever(self):
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="DecisionWorker")
+        try:
+            while not self._stop.is_set():
+                states = self._sync()
+                now = time.time()
+                next_due = None
+                for st in states:
+                    if st.running:
+                        continue
+                    due = st.schedule.due(now)
+                    if due <= now:
+                        st.running = True
+                        st.queued_at = now
+                        self._pool.submit(self._run, st)
+                    elif next_due is None or due < next_due:
+                        next_due = due
+                # Event.wait 基于单调时钟；最多等1秒以便跟上交易对与周期的配置变化
+                timeout = 1.0 if next_due is None else min(1.0, max(0.0, next_due - time.time()))
+                self._wake.wait(timeout)
+                self._wake.clear()
+        finally:
+            self._pool.shutdown(wait=False)
+
+    def start(self, name: str = "DecisionEngine") -> "DecisionEngine":
+        self._thread = threading.Thread(target=self.run_forever, name=name, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def status(self) -> Dict:
+        with self._lock:
+            states = list(self._states.values())
+            active = self._active
+        return {
+            "max_workers": self.max_workers,
+            "active_workers": active,
+            "limits": dict(self.limits.limits),
+            "symbols": [st.status() for st in states],
+        }
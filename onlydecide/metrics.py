@@ -0,0 +1,299 @@
+"""轻量指标注册表：计数器、仪表与HDR风格的延迟直方图。
+
+- 直方图按“2的幂 + 线性子桶”分桶（类似HdrHistogram），以微秒为单位记录，
+  相对误差约 1/SUB_BUCKETS，内存只随实际出现的桶数增长。
+- render_prometheus() 输出 Prometheus 文本格式；summary() 输出JSON摘要（含分位数）。
+- 所有指标线程安全，记录一次只是一次加锁与字典更新。
+"""
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Dict, Iterable, List, Optional, Tuple
+
+SUB_BUCKET_BITS = 5
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS  # 每个2的幂区间内的线性子桶数（≈3%精度）
+# 导出到 Prometheus 的累计桶边界（秒）
+PROM_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SUMMARY_QUANTILES = (0.5, 0.9, 0.99)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict) -> LabelKey:
+    return tuple(sorted((str(k), str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(key) + ([extra] if extra else [])
+    if not items:
+        return ""
+    body = ",".join('{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+                    for k, v in items)
+    return "{" + body + "}"
+
+
+def _format_value(v: float) -> str:
+    if v == math.inf:
+        return "+Inf"
+    if float(v).is_integer():
+        return str(int(v))
+    return repr(float(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str = ""):
+        self.name = name
+        self.help = help_text
+        self._lock = threading.Lock()
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """单调递增计数器"""
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str = ""):
+        super().__init__(name, help_text)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self._header() + [f"{self.name}{_format_labels(k)} {_format_value(v)}" for k, v in items]
+
+    def snapshot(self) -> List[Dict]:
+        with self._lock:
+            return [{"labels": dict(k), "value": v} for k, v in self._values.items()]
+
+
+class Gauge(Counter):
+    """可任意设置的仪表"""
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+
+class _HdrCounts:
+    """单个标签组合的HDR分桶计数（记录单位：微秒）"""
+
+    __slots__ = ("buckets", "count", "total", "min", "max")
+
+    def __init__(self):
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    @staticmethod
+    def index_of(us: int) -> int:
+        if us < SUB_BUCKETS:
+            return us
+        exp = us.bit_length() - 1 - SUB_BUCKET_BITS
+        return ((exp + 1) << SUB_BUCKET_BITS) + ((us >> exp) - SUB_BUCKETS)
+
+    @staticmethod
+    def upper_of(index: int) -> int:
+        """桶的上界（微秒，不含）"""
+        if index < SUB_BUCKETS:
+            return index + 1
+        exp = (index >> SUB_BUCKET_BITS) - 1
+        sub = index & (SUB_BUCKETS - 1)
+        return (SUB_BUCKETS + sub + 1) << exp
+
+    def record(self, seconds: float):
+        us = max(0, int(seconds * 1e6))
+        idx = self.index_of(us)
+        self.buckets[idx] = self.buckets.get(idx, 0) + 1
+        self.count += 1
+        self.total += seconds
+        if seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        target = max(1, int(math.ceil(q * self.count)))
+        seen = 0
+        for idx in sorted(self.buckets):
+            seen += self.buckets[idx]
+            if seen >= target:
+                return min(self.upper_of(idx) / 1e6, self.max)
+        return self.max
+
+    def cumulative(self, bounds: Iterable[float]) -> List[int]:
+        items = sorted(self.buckets.items())
+        out = []
+        pos = 0
+        acc = 0
+        for b in bounds:
+            limit_us = b * 1e6
+            while pos < len(items) and self.upper_of(items[pos][0]) <= limit_us:
+                acc += items[pos][1]
+                pos += 1
+            out.append(acc)
+        return out
+
+
+class Histogram(_Metric):
+    """延迟直方图（秒）"""
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str = ""):
+        super().__init__(name, help_text)
+        self._series: Dict[LabelKey, _HdrCounts] = {}
+
+    def observe(self, seconds: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _HdrCounts()
+            series.record(seconds)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        with self._lock:
+            for key, s in self._series.items():
+                for b, c in zip(PROM_BUCKETS, s.cumulative(PROM_BUCKETS)):
+                    lines.append(f"{self.name}_bucket{_format_labels(key, ('le', _format_value(b)))} {c}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} {s.count}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(s.total)}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {s.count}")
+        return lines
+
+    def snapshot(self) -> List[Dict]:
+        out = []
+        with self._lock:
+            for key, s in self._series.items():
+                item = {
+                    "labels": dict(key),
+                    "count": s.count,
+                    "mean_ms": round(s.total / s.count * 1000, 3) if s.count else 0.0,
+                    "min_ms": round(s.min * 1000, 3) if s.count else 0.0,
+                    "max_ms": round(s.max * 1000, 3),
+                }
+                for q in SUMMARY_QUANTILES:
+                    item[f"p{int(q * 100)}_ms"] = round(s.quantile(q) * 1000, 3)
+                out.append(item)
+        return out
+
+
+class Registry:
+    """指标注册表：按名称获取或创建指标"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, help_text: str):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text)
+            elif type(metric) is not cls:
+                raise ValueError(f"指标 {name} 已注册为 {metric.kind}")
+            return metric
+
+    def counter(self, name: str, help_text: str = "") -> Counter:
+        return self._get(Counter, name, help_text)
+
+    def gauge(self, name: str, help_text: str = "") -> Gauge:
+        return self._get(Gauge, name, help_text)
+
+    def histogram(self, name: str, help_text: str = "") -> Histogram:
+        return self._get(Histogram, name, help_text)
+
+    def render_prometheus(self) -> str:
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines: List[str] = []
+        for m in metrics:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> Dict:
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        return {m.name: {"type": m.kind, "help": m.help, "series": m.snapshot()} for m in metrics}
+
+    def reset(self):
+        with self._lock:
+            self._metrics.clear()
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, help_text: str = "") -> Counter:
+    return REGISTRY.counter(name, help_text)
+
+
+def gauge(name: str, help_text: str = "") -> Gauge:
+    return REGISTRY.gauge(name, help_text)
+
+
+def histogram(name: str, help_text: str = "") -> Histogram:
+    return REGISTRY.histogram(name, help_text)
+
+
+def timed(name: str, help_text: str = "", **labels):
+    """上下文管理器：记录代码块耗时到指定直方图"""
+    return histogram(name, help_text).time(**labels)
+
+
+def timed_function(name: str, help_text: str = "", **labels):
+    """装饰器：记录函数耗时，标签默认附带 func=函数名"""
+    def decorator(fn):
+        hist = histogram(name, help_text)
+        fn_labels = dict(labels)
+        fn_labels.setdefault("func", fn.__name__)
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                hist.observe(time.perf_counter() - start, **fn_labels)
+        return wrapper
+    return decorator
+
+
+def render_prometheus() -> str:
+    return REGISTRY.render_prometheus()
+
+
+def summary() -> Dict:
+    return REGISTRY.summary()
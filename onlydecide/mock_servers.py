@@ -0,0 +1,761 @@
+"""本地模拟 OKX 与 DeepSeek 接口，用于离线压测与延迟基准。
+
+模拟的端点：
+- OKX: /api/v5/market/candles, /api/v5/market/ticker, /api/v5/market/books, /api/v5/account/balance,
+  /api/v5/account/positions, /api/v5/trade/order, /api/v5/trade/order-algo,
+  /api/v5/public/instruments, /api/v5/public/funding-rate-history
+- DeepSeek: /v1/chat/completions（支持 stream=true 的SSE流式输出）
+- 诊断: GET /_mock/stats 返回各端点请求数与注入错误数
+- OKX WebSocket（MockWSServer）: /ws/v5/public 的 tickers 与 /ws/v5/business 的 candle{bar}，
+  按固定间隔推送回放行情，可主动断开全部连接以测试重连
+
+每个端点可单独配置延迟分布、错误率与注入的错误种类（http: 返回503；okx: 返回限流业务码；
+drop: 不返回响应直接断开连接），只指定部分参数的端点其余参数沿用 default；
+行情可回放 decisions.db 中记录的快照，AI回复可回放 huixian.txt 中记录的“AI原始响应”。
+
+用法:
+    python mock_servers.py --port 8765 --replay-db decisions.db --replay-echo huixian.txt \\
+        --latency default=uniform:20,80 --latency chat=lognormal:1500,0.4 --error-rate 0.02 \\
+        --error-kinds http,okx,drop
+    OKX_BASE_URL=http://127.0.0.1:8765 DEEPSEEK_BASE_URL=http://127.0.0.1:8765/v1/chat/completions python app.py
+    # 加 --ws-port 8766 同时启动 WebSocket 行情，并设置 OKX_WS_PUBLIC_URL / OKX_WS_BUSINESS_URL
+"""
+
+import argparse
+import json
+import math
+import random
+import socketserver
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+import db
+import decision_parser
+import ws_feed
+
+# 路径 -> 端点名（延迟/错误率按端点名配置）
+ENDPOINTS = {
+    "/api/v5/market/candles": "candles",
+    "/api/v5/market/ticker": "ticker",
+    "/api/v5/account/balance": "balance",
+    "/api/v5/account/positions": "positions",
+    "/api/v5/trade/order": "order",
+    "/api/v5/trade/order-algo": "order-algo",
+    "/api/v5/public/instruments": "instruments",
+    "/api/v5/market/books": "books",
+    "/api/v5/public/funding-rate-history": "funding",
+    "/v1/chat/completions": "chat",
+}
+
+BAR_SECONDS = {"1m": 60, "5m": 300, "15m": 900, "30m": 1800, "1H": 3600, "2H": 7200, "4H": 14400, "1D": 86400}
+# decisions.db 中 market_data_json 的K线字段 -> OKX bar
+_SNAPSHOT_BARS = {"kline_5min": "5m", "kline_30min": "30m", "kline_2h": "2H", "kline_1d": "1D"}
+
+
+class LatencyModel:
+    """延迟分布，规格字符串（单位毫秒）：
+    fixed:30 | uniform:10,50 | normal:40,10 | lognormal:中位数,sigma | none
+    """
+
+    def __init__(self, spec: str = "none", rng: Optional[random.Random] = None):
+        self.spec = spec
+        self.rng = rng or random.Random()
+        kind, _, args = (spec or "none").partition(":")
+        self.kind = kind.strip().lower()
+        self.args = [float(a) for a in args.split(",") if a.strip()] if args else []
+        if self.kind not in ("none", "fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"未知的延迟分布: {spec}")
+
+    def sample_ms(self) -> float:
+        a = self.args
+        if self.kind == "fixed":
+            return a[0]
+        if self.kind == "uniform":
+            return self.rng.uniform(a[0], a[1])
+        if self.kind == "normal":
+            return max(0.0, self.rng.gauss(a[0], a[1]))
+        if self.kind == "lognormal":
+            return self.rng.lognormvariate(math.log(max(a[0], 1e-6)), a[1] if len(a) > 1 else 0.5)
+        return 0.0
+
+
+# 可注入的错误种类
+ERROR_KINDS = ("http", "okx", "drop")
+
+
+def _error_kinds(kinds) -> tuple:
+    kinds = tuple(k.strip() for k in kinds if k.strip())
+    unknown = [k for k in kinds if k not in ERROR_KINDS]
+    if unknown or not kinds:
+        raise ValueError(f"错误种类须为 {','.join(ERROR_KINDS)} 中的一个或多个: {','.join(unknown)}")
+    return kinds
+
+
+class EndpointProfile:
+    """单个端点的延迟与错误注入配置"""
+
+    def __init__(self, latency: str = "none", error_rate: float = 0.0, error_kinds=("http", "okx"),
+                 rng: Optional[random.Random] = None):
+        self.rng = rng or random.Random()
+        self.latency = LatencyModel(latency, self.rng)
+        self.error_rate = float(error_rate)
+        self.error_kinds = _error_kinds(error_kinds)
+
+    def copy(self) -> "EndpointProfile":
+        prof = EndpointProfile(error_rate=self.error_rate, error_kinds=self.error_kinds, rng=self.rng)
+        prof.latency = self.latency
+        return prof
+
+    def pick_error(self) -> Optional[str]:
+        if self.error_rate > 0 and self.rng.random() < self.error_rate:
+            return self.rng.choice(self.error_kinds)
+        return None
+
+
+class MarketReplay:
+    """行情数据源：优先回放记录的快照，没有记录时生成可复现的随机游走"""
+
+    def __init__(self, snapshots: Optional[List[Dict]] = None, seed: int = 7, base_price: float = 3500.0):
+        self.snapshots = snapshots or []
+        self.rng = random.Random(seed)
+        self.cursor = 0
+        self.price = base_price
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_db(cls, db_path: str, symbol: Optional[str] = None, **kwargs) -> "MarketReplay":
+        """从 decisions.db 读取历史 market_data_json（时间正序）作为回放快照"""
+        conn = sqlite3.connect(db_path)
+        try:
+            if symbol:
+                rows = conn.execute(
+                    "SELECT market_data_json FROM decisions WHERE symbol = ? ORDER BY timestamp ASC", (symbol,)
+                ).fetchall()
+            else:
+                rows = conn.execute("SELECT market_data_json FROM decisions ORDER BY timestamp ASC").fetchall()
+        finally:
+            conn.close()
+        snapshots = []
+        for (raw,) in rows:
+            try:
+                md = json.loads(db.decode_blob(db_path, raw) or "{}")
+            except Exception:
+                continue
+            if md.get("current_price"):
+                snapshots.append(md)
+        return cls(snapshots, **kwargs)
+
+    def advance(self):
+        """推进到下一个快照（每次ticker请求推进一次，对应一个决策周期）"""
+        with self._lock:
+            if self.snapshots:
+                self.cursor = (self.cursor + 1) % len(self.snapshots)
+            else:
+                self.price = max(1.0, self.price * (1 + self.rng.gauss(0, 0.002)))
+
+    def current_price(self) -> float:
+        if self.snapshots:
+            return float(self.snapshots[self.cursor]["current_price"])
+        return self.price
+
+    def candles(self, bar: str, limit: int) -> List[List[str]]:
+        """返回OKX格式K线（最新在前）: [ts, o, h, l, c, vol, volCcy, volCcyQuote, confirm]"""
+        if self.snapshots:
+            snap = self.snapshots[self.cursor]
+            for key, snap_bar in _SNAPSHOT_BARS.items():
+                if snap_bar == bar and snap.get(key):
+                    out = []
+                    for k in snap[key][:limit]:
+                        try:
+                            ts = int(datetime.strptime(k["timestamp"], "%Y-%m-%d %H:%M:%S").timestamp() * 1000)
+                        except Exception:
+                            ts = int(time.time() * 1000)
+                        out.append([str(ts), str(k["open"]), str(k["high"]), str(k["low"]), str(k["close"]),
+                                    str(k["volume"]), str(k["volume"]), "0", "1"])
+                    if out:
+                        return out
+        step = BAR_SECONDS.get(bar, 300)
+        now = int(time.time()) // step * step
+        price = self.current_price()
+        out = []
+        for i in range(limit):
+            o = price * (1 + self.rng.gauss(0, 0.001))
+            c = price
+            h = max(o, c) * (1 + abs(self.rng.gauss(0, 0.0008)))
+            low = min(o, c) * (1 - abs(self.rng.gauss(0, 0.0008)))
+            out.append([str((now - i * step) * 1000), f"{o:.2f}", f"{h:.2f}", f"{low:.2f}", f"{c:.2f}",
+                        f"{self.rng.uniform(500, 3000):.2f}", "0", "0", "1" if i else "0"])
+            price = o
+        return out
+
+    def order_book(self, depth: int) -> Dict:
+        """围绕当前价格生成的盘口（数量单位为张，越远档位越厚）"""
+        px = self.current_price()
+        tick = max(px * 0.00002, 0.01)
+        bids, asks = [], []
+        for i in range(depth):
+            sz = f"{self.rng.uniform(5, 40) * (1 + i / 10):.2f}"
+            bids.append([f"{px - tick * (i + 1):.2f}", sz, "0", "3"])
+            asks.append([f"{px + tick * (i + 1):.2f}", sz, "0", "3"])
+        return {"asks": asks, "bids": bids, "ts": str(int(time.time() * 1000))}
+
+    def funding_history(self, inst_id: Optional[str], after: Optional[int], limit: int) -> List[Dict]:
+        """过去30天每8小时一次的资金费率（新到旧），费率由结算时间确定，多次请求结果一致"""
+        step = 8 * 3600 * 1000
+        newest = int(time.time() * 1000) // step * step
+        oldest = newest - 90 * step
+        start = newest if after is None else (after - 1) // step * step
+        out = []
+        t = start
+        while t >= oldest and len(out) < limit:
+            rate = 0.0001 + 0.00005 * math.sin(t / step)
+            out.append({"instId": inst_id, "fundingRate": f"{rate:.8f}", "realizedRate": f"{rate:.8f}",
+                        "fundingTime": str(t)})
+            t -= step
+        return out
+
+
+class MockExchangeState:
+    """模拟账户：余额、持仓与算法订单，下单按当前回放价格成交"""
+
+    def __init__(self, market: MarketReplay, equity: float = 1000.0):
+        self.market = market
+        self.equity = equity
+        self.positions: Dict[str, Dict] = {}
+        self.algo_orders: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def place_order(self, params: Dict) -> Dict:
+        inst = params.get("instId", "ETH-USDT-SWAP")
+        sz = float(params.get("sz") or 0) * 0.1  # 张数 -> 币数量（ctVal=0.1）
+        signed = sz if params.get("side") == "buy" else -sz
+        px = self.market.current_price()
+        with self._lock:
+            pos = self.positions.get(inst, {"pos": 0.0, "avgPx": 0.0})
+            new_pos = pos["pos"] + signed
+            if abs(new_pos) < 1e-12:
+                self.positions.pop(inst, None)
+            else:
+                if pos["pos"] == 0 or (pos["pos"] > 0) == (signed > 0):
+                    avg = (abs(pos["pos"]) * pos["avgPx"] + abs(signed) * px) / abs(new_pos)
+                else:
+                    avg = pos["avgPx"]
+                self.positions[inst] = {"pos": new_pos, "avgPx": avg}
+        return {"ordId": uuid.uuid4().hex[:16], "clOrdId": "", "sCode": "0", "sMsg": ""}
+
+    def place_algo(self, params: Dict) -> Dict:
+        algo_id = uuid.uuid4().hex[:16]
+        with self._lock:
+            self.algo_orders[algo_id] = dict(params, algoId=algo_id)
+        return {"algoId": algo_id, "sCode": "0", "sMsg": ""}
+
+    def position_rows(self, inst: Optional[str]) -> List[Dict]:
+        with self._lock:
+            items = [(k, v) for k, v in self.positions.items() if not inst or k == inst]
+        return [{"instId": k, "pos": str(v["pos"] / 0.1), "avgPx": str(v["avgPx"]), "lever": "50"} for k, v in items]
+
+
+class MockLLM:
+    """模拟DeepSeek：轮流回放记录的原始响应，没有记录时按行情生成模板决策"""
+
+    def __init__(self, responses: Optional[List[str]] = None, token_ms: float = 0.0, chunk_chars: int = 4,
+                 seed: int = 7):
+        self.responses = responses or []
+        self.token_ms = token_ms
+        self.chunk_chars = max(1, chunk_chars)
+        self.rng = random.Random(seed)
+        self._index = 0
+        self._lock = threading.Lock()
+
+    def next_response(self, price: float) -> str:
+        with self._lock:
+            if self.responses:
+                text = self.responses[self._index % len(self.responses)]
+                self._index += 1
+                return text
+        action = self.rng.choice(("hold", "open_long", "open_short"))
+        direction = 1 if action == "open_long" else -1
+        decision = {
+            "trading_decision": {
+                "action": action,
+                "confidence_level": self.rng.choice(("high", "medium", "low")),
+                "reason": "模拟服务生成的决策"
+            },
+            "position_management": {
+                "position_size": 0.1 if action != "hold" else 0,
+                "stop_loss_price": round(price * (1 - 0.005 * direction), 2) if action != "hold" else 0,
+                "take_profit_price": round(price * (1 + 0.008 * direction), 2) if action != "hold" else 0
+            }
+        }
+        return json.dumps(decision, ensure_ascii=False, indent=2)
+
+    def chunks(self, text: str):
+        for i in range(0, len(text), self.chunk_chars):
+            yield text[i:i + self.chunk_chars]
+
+
+class MockServer:
+    """在后台线程中运行的模拟服务，可作为上下文管理器使用"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, market: Optional[MarketReplay] = None,
+                 llm: Optional[MockLLM] = None, profiles: Optional[Dict[str, EndpointProfile]] = None,
+                 seed: int = 7):
+        self.rng = random.Random(seed)
+        self.market = market or MarketReplay(seed=seed)
+        self.exchange = MockExchangeState(self.market)
+        self.llm = llm or MockLLM(seed=seed)
+        self.profiles: Dict[str, EndpointProfile] = {"default": EndpointProfile(rng=self.rng)}
+        self.profiles.update(profiles or {})
+        self.stats: Dict[str, Dict[str, int]] = {}
+        self._stats_lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), _make_handler(self))
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def deepseek_url(self) -> str:
+        return self.url + "/v1/chat/completions"
+
+    def profile(self, name: str) -> EndpointProfile:
+        return self.profiles.get(name) or self.profiles["default"]
+
+    def configure(self, name: str, latency: Optional[str] = None, error_rate: Optional[float] = None,
+                  error_kinds=None):
+        """运行时调整某端点（或 default）的延迟、错误率与错误种类
+
+        端点首次配置时从 default 复制，未指定的参数沿用 default 当时的设置。
+        """
+        prof = self.profiles.get(name)
+        if prof is None:
+            prof = self.profiles[name] = self.profiles["default"].copy()
+        if latency is not None:
+            prof.latency = LatencyModel(latency, self.rng)
+        if error_rate is not None:
+            prof.error_rate = float(error_rate)
+        if error_kinds is not None:
+            prof.error_kinds = _error_kinds(error_kinds)
+
+    def record(self, name: str, error: Optional[str]):
+        with self._stats_lock:
+            st = self.stats.setdefault(name, {"requests": 0, "errors": 0})
+            st["requests"] += 1
+            if error:
+                st["errors"] += 1
+
+    def point_clients(self, *clients):
+        """把 OKXDataCollector / DeepSeekAI 实例指向本服务"""
+        for c in clients:
+            if c.__class__.__name__ == "DeepSeekAI":
+                c.base_url = self.deepseek_url
+            else:
+                c.base_url = self.url
+
+    def start(self) -> "MockServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="MockServer", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def _make_handler(server: MockServer):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.0"
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def _send_json(self, obj, status: int = 200):
+            body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _okx(self, data, code: str = "0", msg: str = ""):
+            self._send_json({"code": code, "msg": msg, "data": data})
+
+        def _read_body(self) -> Dict:
+            length = int(self.headers.get("Content-Length") or 0)
+            if not length:
+                return {}
+            try:
+                return json.loads(self.rfile.read(length).decode("utf-8"))
+            except Exception:
+                return {}
+
+        def _dispatch(self, method: str):
+            parsed = urlparse(self.path)
+            path = parsed.path
+            if path == "/_mock/stats":
+                with server._stats_lock:
+                    return self._send_json({"stats": server.stats, "cursor": server.market.cursor})
+            name = ENDPOINTS.get(path)
+            if name is None:
+                return self._send_json({"code": "404", "msg": f"mock: 未模拟的路径 {path}", "data": []}, 404)
+
+            prof = server.profile(name)
+            delay_ms = prof.latency.sample_ms()
+            if delay_ms > 0:
+                time.sleep(delay_ms / 1000.0)
+            error = prof.pick_error()
+            if error == "okx" and name == "chat":
+                # DeepSeek 接口没有 OKX 业务码，本次照常返回，不计为注入错误
+                error = None
+            server.record(name, error)
+            if error == "http":
+                return self._send_json({"error": "mock injected failure"}, 503)
+            if error == "drop":
+                self.close_connection = True
+                return
+            if error == "okx":
+                return self._okx([], code="50011", msg="Too Many Requests")
+
+            query = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+            body = self._read_body() if method == "POST" else {}
+            if name == "chat":
+                return self._chat(body)
+            if name == "candles":
+                limit = int(query.get("limit") or 100)
+                return self._okx(server.market.candles(query.get("bar", "1m"), limit))
+            if name == "ticker":
+                server.market.advance()
+                px = server.market.current_price()
+                return self._okx([{"instId": query.get("instId"), "last": f"{px:.2f}", "ts": str(int(time.time() * 1000))}])
+            if name == "balance":
+                eq = server.exchange.equity
+                return self._okx([{"totalEq": str(eq), "details": [{"ccy": "USDT", "availEq": str(eq * 0.9)}]}])
+            if name == "positions":
+                return self._okx(server.exchange.position_rows(query.get("instId")))
+            if name == "order":
+                return self._okx([server.exchange.place_order(body)])
+            if name == "order-algo":
+                return self._okx([server.exchange.place_algo(body)])
+            if name == "instruments":
+                if query.get("instId"):
+                    return self._okx([{"instId": query["instId"], "ctVal": "0.1", "minSz": "0.01"}])
+                return self._okx([{"instId": s} for s in ("BTC-USDT-SWAP", "ETH-USDT-SWAP", "SOL-USDT-SWAP")])
+            if name == "books":
+                return self._okx([server.market.order_book(int(query.get("sz") or 50))])
+            if name == "funding":
+                after = int(query["after"]) if query.get("after") else None
+                return self._okx(server.market.funding_history(query.get("instId"), after,
+                                                               int(query.get("limit") or 100)))
+            return self._okx([])
+
+        def _chat(self, body: Dict):
+            text = server.llm.next_response(server.market.current_price())
+            if not body.get("stream"):
+                if server.llm.token_ms > 0:
+                    time.sleep(server.llm.token_ms * len(text) / server.llm.chunk_chars / 1000.0)
+                return self._send_json({
+                    "id": uuid.uuid4().hex,
+                    "object": "chat.completion",
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                    "usage": {"completion_tokens": len(text) // server.llm.chunk_chars}
+                })
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+            self.end_headers()
+            try:
+                for piece in server.llm.chunks(text):
+                    if server.llm.token_ms > 0:
+                        time.sleep(server.llm.token_ms / 1000.0)
+                    event = {"choices": [{"index": 0, "delta": {"content": piece}}]}
+                    self.wfile.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # 客户端提前断开（流式提前提取决策）
+
+        def do_GET(self):
+            self._dispatch("GET")
+
+        def do_POST(self):
+            self._dispatch("POST")
+
+    return Handler
+
+
+class MockWSServer:
+    """模拟 OKX WebSocket 行情：订阅后按 push_interval 推送 tickers 与K线"""
+
+    def __init__(self, market: MarketReplay, host: str = "127.0.0.1", port: int = 0,
+                 push_interval: float = 0.2, advance_on_push: bool = False):
+        self.market = market
+        self.push_interval = push_interval
+        self.advance_on_push = advance_on_push
+        self.connections: List["_WSConnection"] = []
+        self.stats = {"connections": 0, "subscriptions": 0, "messages_sent": 0}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.tcp = socketserver.ThreadingTCPServer((host, port), _make_ws_handler(self), bind_and_activate=False)
+        self.tcp.allow_reuse_address = True
+        self.tcp.daemon_threads = True
+        self.tcp.server_bind()
+        self.tcp.server_activate()
+        self._threads: List[threading.Thread] = []
+
+    @property
+    def url(self) -> str:
+        host, port = self.tcp.server_address[:2]
+        return f"ws://{host}:{port}"
+
+    @property
+    def public_url(self) -> str:
+        return self.url + "/ws/v5/public"
+
+    @property
+    def business_url(self) -> str:
+        return self.url + "/ws/v5/business"
+
+    def _push_loop(self):
+        while not self._stop.wait(self.push_interval):
+            if self.advance_on_push:
+                self.market.advance()
+            with self._lock:
+                conns = list(self.connections)
+            for conn in conns:
+                conn.push()
+
+    def drop_connections(self):
+        """断开所有客户端连接（测试重连与重新订阅）"""
+        with self._lock:
+            conns, self.connections = list(self.connections), []
+        for conn in conns:
+            conn.close()
+
+    def start(self) -> "MockWSServer":
+        for target, name in ((self.tcp.serve_forever, "MockWSServer"), (self._push_loop, "MockWSPush")):
+            t = threading.Thread(target=target, name=name, daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self.drop_connections()
+        self.tcp.shutdown()
+        self.tcp.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class _WSConnection:
+    """服务端的一条 WebSocket 连接"""
+
+    def __init__(self, server: MockWSServer, sock, path: str):
+        self.server = server
+        self.sock = sock
+        self.path = path
+        self.subs: List[Dict] = []
+        self.closed = False
+        self._send_lock = threading.Lock()
+
+    def send_text(self, text: str):
+        with self._send_lock:
+            self.sock.sendall(ws_feed.encode_frame(text.encode("utf-8"), ws_feed.OP_TEXT, mask=False))
+        with self.server._lock:
+            self.server.stats["messages_sent"] += 1
+
+    def push(self):
+        market = self.server.market
+        for arg in list(self.subs):
+            channel = arg.get("channel", "")
+            if channel == "tickers":
+                data = [{"instId": arg.get("instId"), "last": f"{market.current_price():.2f}",
+                         "ts": str(int(time.time() * 1000))}]
+            elif channel.startswith("candle"):
+                data = market.candles(channel[len("candle"):], 1)
+            else:
+                continue
+            try:
+                self.send_text(json.dumps({"arg": arg, "data": data}))
+            except OSError:
+                self.close()
+                return
+
+    def handle_message(self, text: str):
+        if text == "ping":
+            return self.send_text("pong")
+        try:
+            msg = json.loads(text)
+        except ValueError:
+            return self.send_text(json.dumps({"event": "error", "code": "60012", "msg": "Invalid request"}))
+        op = msg.get("op")
+        for arg in msg.get("args") or []:
+            channel = arg.get("channel", "")
+            # 与OKX一致：K线频道只在 business 端点提供
+            if channel.startswith("candle") != self.path.endswith("/business"):
+                self.send_text(json.dumps({"event": "error", "code": "60018", "msg": f"Wrong URL or channel:{channel}"}))
+                continue
+            if op == "subscribe":
+                if arg not in self.subs:
+                    self.subs.append(arg)
+                    with self.server._lock:
+                        self.server.stats["subscriptions"] += 1
+            elif op == "unsubscribe" and arg in self.subs:
+                self.subs.remove(arg)
+            self.send_text(json.dumps({"event": op, "arg": arg, "connId": "mock"}))
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.sock.shutdown(2)
+        except OSError:
+            pass
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+def _make_ws_handler(server: MockWSServer):
+    class Handler(socketserver.BaseRequestHandler):
+        def handle(self):
+            sock = self.request
+            raw = b""
+            while b"\r\n\r\n" not in raw:
+                chunk = sock.recv(4096)
+                if not chunk:
+                    return
+                raw += chunk
+            head, _, rest = raw.partition(b"\r\n\r\n")
+            lines = head.decode("latin-1").split("\r\n")
+            path = lines[0].split()[1] if len(lines[0].split()) > 1 else "/"
+            headers = {k.strip().lower(): v.strip() for k, _, v in (l.partition(":") for l in lines[1:])}
+            key = headers.get("sec-websocket-key")
+            if not key or path not in ("/ws/v5/public", "/ws/v5/business"):
+                sock.sendall(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n")
+                return
+            sock.sendall((
+                "HTTP/1.1 101 Switching Protocols\r\n"
+                "Upgrade: websocket\r\n"
+                "Connection: Upgrade\r\n"
+                f"Sec-WebSocket-Accept: {ws_feed.accept_key(key)}\r\n\r\n"
+            ).encode("ascii"))
+            conn = _WSConnection(server, sock, path)
+            with server._lock:
+                server.connections.append(conn)
+                server.stats["connections"] += 1
+            frames = ws_feed.FrameBuffer()
+            frames.feed(rest)
+            try:
+                while not conn.closed:
+                    frame = frames.next_frame()
+                    if frame is None:
+                        chunk = sock.recv(65536)
+                        if not chunk:
+                            break
+                        frames.feed(chunk)
+                        continue
+                    _fin, opcode, payload = frame
+                    if opcode == ws_feed.OP_CLOSE:
+                        break
+                    if opcode == ws_feed.OP_PING:
+                        with conn._send_lock:
+                            sock.sendall(ws_feed.encode_frame(payload, ws_feed.OP_PONG, mask=False))
+                    elif opcode == ws_feed.OP_TEXT:
+                        conn.handle_message(payload.decode("utf-8", errors="replace"))
+            except OSError:
+                pass
+            finally:
+                conn.close()
+                with server._lock:
+                    if conn in server.connections:
+                        server.connections.remove(conn)
+
+    return Handler
+
+
+def _parse_kv_options(values: List[str], cast=str) -> Dict:
+    """解析 name=value 形式的参数；不带 name 的值视为 default"""
+    out = {}
+    for v in values or []:
+        name, sep, val = v.partition("=")
+        if not sep:
+            name, val = "default", v
+        out[name.strip()] = cast(val.strip())
+    return out
+
+
+def build_server_from_args(args) -> MockServer:
+    market = MarketReplay.from_db(args.replay_db, seed=args.seed) if args.replay_db else MarketReplay(seed=args.seed)
+    responses = decision_parser.load_echo_corpus(args.replay_echo) if args.replay_echo else []
+    llm = MockLLM(responses, token_ms=args.llm_token_ms, seed=args.seed)
+    server = MockServer(args.host, args.port, market=market, llm=llm, seed=args.seed)
+    latencies = _parse_kv_options(args.latency)
+    rates = _parse_kv_options(args.error_rate, float)
+    kinds = _parse_kv_options(args.error_kinds, lambda v: v.split(","))
+    # 先配置 default，其余端点以它为基础
+    for name in sorted(set(latencies) | set(rates) | set(kinds), key=lambda n: n != "default"):
+        server.configure(name, latency=latencies.get(name), error_rate=rates.get(name), error_kinds=kinds.get(name))
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟 OKX / DeepSeek 服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--replay-db", help="回放该数据库中记录的行情快照")
+    parser.add_argument("--replay-echo", help="回放该回显文件中记录的AI原始响应")
+    parser.add_argument("--latency", action="append", help="端点=分布，如 chat=lognormal:1500,0.4；不带端点表示default")
+    parser.add_argument("--error-rate", action="append", help="端点=错误率，如 ticker=0.05；不带端点表示default")
+    parser.add_argument("--error-kinds", action="append",
+                        help=f"端点=错误种类（逗号分隔，可选 {','.join(ERROR_KINDS)}），如 chat=drop；不带端点表示default")
+    parser.add_argument("--llm-token-ms", type=float, default=0.0, help="流式输出每个分片的间隔（毫秒）")
+    parser.add_argument("--ws-port", type=int, default=None, help="同时启动 WebSocket 行情回放服务的端口")
+    parser.add_argument("--ws-push-ms", type=float, default=200.0, help="WebSocket 推送间隔（毫秒）")
+    args = parser.parse_args()
+
+    server = build_server_from_args(args)
+    ws_server = None
+    if args.ws_port is not None:
+        ws_server = MockWSServer(server.market, args.host, args.ws_port,
+                                 push_interval=args.ws_push_ms / 1000.0).start()
+    print(f"模拟服务已启动: {server.url}")
+    print(f"  OKX_BASE_URL={server.url}")
+    print(f"  DEEPSEEK_BASE_URL={server.deepseek_url}")
+    if ws_server is not None:
+        print(f"  OKX_WS_PUBLIC_URL={ws_server.public_url}")
+        print(f"  OKX_WS_BUSINESS_URL={ws_server.business_url}")
+    print(f"  行情快照: {len(server.market.snapshots)} 条, AI回放响应: {len(server.llm.responses)} 条")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        if ws_server is not None:
+            ws_server.stop()
+
+
+if __name__ == "__main__":
+    main()
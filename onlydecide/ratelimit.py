@@ -0,0 +1,104 @@
+"""OKX 按接口限速：令牌桶 + 排队等待（不会因限速直接失败）。
+
+OKX 的限额是“每 2 秒 N 次”。普通令牌桶（容量 N、每 2 秒补 N 个）在任意 2 秒窗口内
+最多可放行约 2N 次，仍会触发限速，因此这里把额度拆成突发容量 burst 与补充速率两部分：
+    burst + rate * window = N
+保证任意一个窗口内放行次数都不超过官方限额，同时空闲后仍允许小规模突发。
+
+取令牌采用“预约”方式：在锁内扣减（可为负数）并算出需要等待的时间，锁外睡眠，
+因此并发调用按到达顺序排队，互不饿死。
+"""
+
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import metrics
+
+RATELIMIT_WAIT_SECONDS = metrics.histogram("onlydecide_ratelimit_wait_seconds", "OKX请求因限速排队等待的时间")
+RATELIMIT_THROTTLED_TOTAL = metrics.counter("onlydecide_ratelimit_throttled_total", "需要排队等待的OKX请求次数")
+
+# OKX 公布的限速（次数, 窗口秒, 是否按交易对单独计数）
+OKX_RATE_LIMITS: Dict[str, Tuple[int, float, bool]] = {
+    "/api/v5/market/candles": (40, 2.0, False),
+    "/api/v5/market/ticker": (20, 2.0, False),
+    "/api/v5/market/books": (40, 2.0, False),
+    "/api/v5/public/funding-rate-history": (10, 2.0, True),
+    "/api/v5/public/instruments": (20, 2.0, False),
+    "/api/v5/account/balance": (10, 2.0, False),
+    "/api/v5/account/positions": (10, 2.0, False),
+    "/api/v5/trade/order": (60, 2.0, True),
+    "/api/v5/trade/order-algo": (20, 2.0, True),
+}
+DEFAULT_BURST_FRACTION = 0.1
+
+
+class TokenBucket:
+    """令牌桶：capacity 为突发容量，rate 为每秒补充的令牌数"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(capacity))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_window(cls, count: int, window: float, burst_fraction: float = DEFAULT_BURST_FRACTION) -> "TokenBucket":
+        """按“每 window 秒最多 count 次”构造，保证任意窗口内不超过 count 次"""
+        burst = min(max(1, int(count * burst_fraction)), max(1, count - 1))
+        return cls(rate=(count - burst) / window, capacity=burst)
+
+    def reserve(self, tokens: float = 1.0) -> float:
+        """预约令牌，返回需要等待的秒数（0 表示立即可用）"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """阻塞直到令牌可用，返回实际等待秒数"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class EndpointRateLimiter:
+    """按接口（以及需要时按交易对）维护令牌桶；未配置的接口不限速"""
+
+    def __init__(self, limits: Dict[str, Tuple[int, float, bool]] = None,
+                 burst_fraction: float = DEFAULT_BURST_FRACTION):
+        self.limits = dict(OKX_RATE_LIMITS if limits is None else limits)
+        self.burst_fraction = burst_fraction
+        self._buckets: Dict[Tuple[str, Optional[str]], TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, endpoint: str, inst_id: Optional[str]) -> Optional[TokenBucket]:
+        limit = self.limits.get(endpoint)
+        if limit is None:
+            return None
+        count, window, per_instrument = limit
+        key = (endpoint, inst_id if per_instrument else None)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            with self._lock:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    bucket = self._buckets[key] = TokenBucket.for_window(count, window, self.burst_fraction)
+        return bucket
+
+    def acquire(self, endpoint: str, inst_id: Optional[str] = None) -> float:
+        """排队等待接口额度，返回等待秒数"""
+        bucket = self._bucket(endpoint, inst_id)
+        if bucket is None:
+            return 0.0
+        wait = bucket.acquire()
+        RATELIMIT_WAIT_SECONDS.observe(wait, endpoint=endpoint)
+        if wait > 0:
+            RATELIMIT_THROTTLED_TOTAL.inc(endpoint=endpoint)
+        return wait
@@ -0,0 +1,162 @@
+"""只读快照副本：回测、导出、统计等重查询读取定期生成的数据库快照，不与决策写入争用主库。
+
+主库 decisions.db 由决策循环与写线程（db_writer）持续写入。回测/导出会顺序读取大量行，
+在主库上执行时占用磁盘IO与页缓存，回滚日志模式下还会持有共享锁阻塞写入。这里：
+- 后台线程每 interval 秒用 SQLite 在线备份 API 把主库复制为 <库名>_replica/snapshot-<n>.db：
+  主库为 WAL 时一次复制完整快照（读事务不阻塞写入），否则分步复制并在步间让出锁；
+- 快照改为 DELETE 日志模式并设为只读文件，任何写入都会失败；
+- 每次生成新文件再切换，正在读取旧快照的查询不受影响，保留最近两份，更早的删除；
+- path() 返回最新快照；尚未生成或已超过 max_age 秒（如复制持续失败）时返回主库路径。
+
+快照相对主库有至多 interval 秒的延迟，只用于允许延迟且不读取归档文件的查询
+（db.get_decisions_range(blobs=False)、db.decision_stats 等）。
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import metrics
+
+REPLICA_REFRESH_SECONDS = metrics.histogram("onlydecide_replica_refresh_seconds", "生成一次只读快照的耗时")
+REPLICA_AGE_SECONDS = metrics.gauge("onlydecide_replica_age_seconds", "查询使用的快照距生成的秒数")
+REPLICA_FALLBACK_TOTAL = metrics.counter("onlydecide_replica_fallback_total", "快照不可用、改读主库的次数")
+REPLICA_ERRORS = metrics.counter("onlydecide_replica_errors_total", "生成快照失败次数")
+
+# 保留的快照份数（当前 + 上一份，供生成新快照时仍在读取的查询使用）
+_KEEP = 2
+
+
+def replica_dir(db_path: str) -> str:
+    """数据库对应的快照目录（decisions.db -> decisions_replica/）"""
+    return os.path.splitext(os.path.abspath(db_path))[0] + "_replica"
+
+
+class SnapshotReplica:
+    """定期刷新的只读快照"""
+
+    def __init__(self, db_path: str, interval: float = 300.0, max_age: float = 900.0, step_pages: int = 4096,
+                 step_pause: float = 0.005, on_error: Optional[Callable[[Exception], None]] = None):
+        self.db_path = db_path
+        self.directory = replica_dir(db_path)
+        self.interval = interval
+        self.max_age = max_age
+        self.step_pages = step_pages
+        self.step_pause = step_pause
+        self.on_error = on_error
+        self._current: Optional[str] = None
+        self._created_at = 0.0
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_error: Optional[str] = None
+        self.last_refresh_seconds: Optional[float] = None
+
+    def path(self) -> str:
+        """读取使用的数据库路径：新鲜的快照，否则主库"""
+        with self._lock:
+            current, created_at = self._current, self._created_at
+        age = time.time() - created_at
+        if current is None or age > self.max_age:
+            REPLICA_FALLBACK_TOTAL.inc()
+            return self.db_path
+        REPLICA_AGE_SECONDS.set(age)
+        return current
+
+    def refresh(self) -> str:
+        """立即生成一份新快照并切换，返回快照路径"""
+        with self._refresh_lock:
+            started = time.perf_counter()
+            os.makedirs(self.directory, exist_ok=True)
+            self._seq += 1
+            target = os.path.join(self.directory, f"snapshot-{self._seq}.db")
+            tmp = target + ".tmp"
+            _remove(tmp)
+            src = sqlite3.connect(self.db_path, timeout=30)
+            dst = sqlite3.connect(tmp)
+            try:
+                if src.execute("PRAGMA journal_mode").fetchone()[0].lower() == "wal":
+                    src.backup(dst)
+                else:
+                    src.backup(dst, pages=self.step_pages, sleep=self.step_pause)
+                # 快照为只读文件，不能使用需要写 -shm 的 WAL 模式
+                dst.execute("PRAGMA journal_mode=DELETE")
+            finally:
+                dst.close()
+                src.close()
+            os.chmod(tmp, 0o444)
+            _remove(target)
+            os.replace(tmp, target)
+            with self._lock:
+                self._current, self._created_at = target, time.time()
+            self.last_refresh_seconds = time.perf_counter() - started
+            REPLICA_REFRESH_SECONDS.observe(self.last_refresh_seconds)
+            self._cleanup(keep=_KEEP)
+            return target
+
+    def _cleanup(self, keep: int):
+        """删除较旧的快照（仍被打开的文件在 Windows 上删除失败，下次再试）"""
+        for path in self._snapshots()[:-keep] if keep else self._snapshots():
+            _remove(path)
+
+    def _snapshots(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        seqs = []
+        for name in os.listdir(self.directory):
+            seq = name[len("snapshot-"):-len(".db")]
+            if name.startswith("snapshot-") and name.endswith(".db") and seq.isdigit():
+                seqs.append(int(seq))
+        return [os.path.join(self.directory, f"snapshot-{n}.db") for n in sorted(seqs)]
+
+    # ---------- 后台刷新 ----------
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+                self.last_error = None
+            except Exception as e:
+                REPLICA_ERRORS.inc()
+                self.last_error = str(e)
+                if self.on_error:
+                    try:
+                        self.on_error(e)
+                    except Exception:
+                        pass
+            self._stop.wait(self.interval)
+
+    def start(self) -> "SnapshotReplica":
+        if self._thread is None:
+            # 上次运行留下的快照不再使用
+            self._cleanup(keep=0)
+            self._thread = threading.Thread(target=self._loop, name="SnapshotReplica", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self) -> Dict:
+        with self._lock:
+            current, created_at = self._current, self._created_at
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "path": current,
+            "age_seconds": round(time.time() - created_at, 1) if current else None,
+            "interval": self.interval,
+            "max_age": self.max_age,
+            "last_refresh_seconds": round(self.last_refresh_seconds, 3) if self.last_refresh_seconds else None,
+            "last_error": self.last_error,
+        }
+
+
+def _remove(path: str):
+    try:
+        os.chmod(path, 0o644)
+        os.remove(path)
+    except OSError:
+        pass
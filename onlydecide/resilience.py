@@ -0,0 +1,173 @@
+"""交易所调用的容错层：带抖动的有限重试 + 按接口熔断 + 明确的“数据不可用”标记。
+
+- 只有幂等的 GET 请求会重试；重试间隔采用 full jitter（0 ~ base * 2^n 随机），
+  避免多个交易对在同一时刻一起重试；
+- 每个接口一个熔断器：连续出现 failure_threshold 次“暂时性”失败（网络错误、超时、
+  HTTP 5xx/429、OKX 系统繁忙类错误码）后熔断，reset_timeout 秒内直接失败，
+  之后放行一次试探请求，成功即恢复；
+- 参数错误等业务错误不重试、也不计入熔断；
+- 数据采集失败时抛出 DataUnavailable，由调用方跳过本轮，而不是用伪造数据继续。
+"""
+
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+import requests
+
+import metrics
+
+RETRY_TOTAL = metrics.counter("onlydecide_okx_retries_total", "OKX请求重试次数（按端点）")
+BREAKER_STATE = metrics.gauge("onlydecide_okx_breaker_state", "OKX熔断器状态：0=关闭 1=熔断 2=半开")
+BREAKER_REJECTED_TOTAL = metrics.counter("onlydecide_okx_breaker_rejected_total", "熔断期间被直接拒绝的请求数")
+DATA_UNAVAILABLE_TOTAL = metrics.counter("onlydecide_data_unavailable_total", "数据不可用次数（按数据源）")
+
+# OKX 暂时性错误码：系统繁忙、服务暂不可用、请求超时、限速
+TRANSIENT_OKX_CODES = frozenset(("50001", "50004", "50011", "50013", "50026"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+_STATE_VALUE = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+
+class ExchangeAPIError(Exception):
+    """交易所返回的业务错误（code != 0）"""
+
+    def __init__(self, message: str, code: str = ""):
+        super().__init__(message)
+        self.code = str(code)
+
+
+class CircuitOpenError(Exception):
+    """熔断期间直接失败"""
+
+    def __init__(self, endpoint: str, retry_in: float):
+        super().__init__(f"{endpoint} 熔断中，{retry_in:.0f}s 后重试")
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+
+class DataUnavailable(Exception):
+    """行情/账户数据暂不可用（替代原先的伪造数据）"""
+
+    def __init__(self, source: str, reason: str = ""):
+        super().__init__(f"{source} 数据不可用: {reason}" if reason else f"{source} 数据不可用")
+        self.source = source
+        self.reason = reason
+        DATA_UNAVAILABLE_TOTAL.inc(source=source)
+
+
+def is_transient(exc: BaseException) -> bool:
+    """是否为值得重试/计入熔断的暂时性错误"""
+    if isinstance(exc, ExchangeAPIError):
+        return exc.code in TRANSIENT_OKX_CODES
+    if isinstance(exc, requests.exceptions.HTTPError):
+        status = exc.response.status_code if exc.response is not None else 0
+        return status >= 500 or status == 429
+    return isinstance(exc, (requests.exceptions.RequestException, ValueError))
+
+
+class CircuitBreaker:
+    """单个接口的熔断器"""
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_timeout = float(reset_timeout)
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def _set_state(self, state: str):
+        self.state = state
+        BREAKER_STATE.set(_STATE_VALUE[state], endpoint=self.name)
+
+    def allow(self):
+        """请求前调用；熔断中抛出 CircuitOpenError"""
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            elapsed = time.monotonic() - self.opened_at
+            if self.state == OPEN and elapsed >= self.reset_timeout:
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN and not self._trial_in_flight:
+                # 半开：只放行一个试探请求
+                self._trial_in_flight = True
+                return
+            BREAKER_REJECTED_TOTAL.inc(endpoint=self.name)
+            raise CircuitOpenError(self.name, max(0.0, self.reset_timeout - elapsed))
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._trial_in_flight = False
+            if self.state != CLOSED:
+                self._set_state(CLOSED)
+
+    def record_failure(self, transient: bool = True):
+        with self._lock:
+            self._trial_in_flight = False
+            if not transient:
+                return
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    def status(self) -> Dict:
+        return {"endpoint": self.name, "state": self.state, "failures": self.failures}
+
+
+class ResilientCaller:
+    """按接口维护熔断器，并对幂等请求做带抖动的有限重试"""
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.2, max_delay: float = 2.0,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.max_attempts = max(1, int(max_attempts))
+        self.base_delay = float(base_delay)
+        self.max_delay = float(max_delay)
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, endpoint: str) -> CircuitBreaker:
+        with self._lock:
+            br = self._breakers.get(endpoint)
+            if br is None:
+                br = self._breakers[endpoint] = CircuitBreaker(endpoint, self.failure_threshold, self.reset_timeout)
+            return br
+
+    def backoff(self, attempt: int) -> float:
+        """第 attempt 次失败后的等待时间（full jitter）"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def call(self, endpoint: str, fn: Callable[[], object], idempotent: bool = True,
+             on_retry: Optional[Callable[[int, float, BaseException], None]] = None):
+        br = self.breaker(endpoint)
+        attempts = self.max_attempts if idempotent else 1
+        for attempt in range(attempts):
+            br.allow()
+            try:
+                result = fn()
+            except Exception as e:
+                transient = is_transient(e)
+                br.record_failure(transient)
+                if not transient or attempt + 1 >= attempts or br.state == OPEN:
+                    raise
+                delay = self.backoff(attempt)
+                RETRY_TOTAL.inc(endpoint=endpoint)
+                if on_retry:
+                    on_retry(attempt + 1, delay, e)
+                time.sleep(delay)
+                continue
+            br.record_success()
+            return result
+
+    def status(self):
+        with self._lock:
+            return [br.status() for br in self._breakers.values()]
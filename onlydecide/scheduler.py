@@ -0,0 +1,136 @@
+"""按K线收盘对齐的决策调度计划（AlignedSchedule），取代“执行一次再 sleep(AI_FREQUENCY)”的循环；
+由 engine.DecisionEngine 为每个交易对持有一份并在同一个调度线程中驱动。
+
+- 触发点固定在墙钟边界：k * interval + offset（如 interval=300, offset=5 即每根5m K线收盘后5秒），
+  周期不会因单次决策耗时而漂移。
+- 单次执行超过一个周期时按显式策略处理：
+  skip     跳过已错过的边界，等待下一个未来边界（默认）
+  catch_up 立即补跑错过的边界，连续补跑最多 max_catch_up 次，之后按 skip 处理
+- 每次触发记录相对边界的延迟（lag）与跳过次数，写入 metrics。
+"""
+
+import math
+import time
+from typing import Callable, Dict, Optional, Union
+
+import metrics
+
+SCHEDULER_LAG_SECONDS = metrics.histogram("onlydecide_scheduler_lag_seconds", "实际触发时间相对计划边界的延迟")
+SCHEDULER_LAST_LAG = metrics.gauge("onlydecide_scheduler_last_lag_seconds", "最近一次触发的延迟")
+SCHEDULER_SKIPPED_TOTAL = metrics.counter("onlydecide_scheduler_skipped_total", "因超时被跳过的边界数")
+SCHEDULER_RUNS_TOTAL = metrics.counter("onlydecide_scheduler_runs_total", "调度触发次数")
+SCHEDULER_RUN_SECONDS = metrics.histogram("onlydecide_scheduler_run_duration_seconds", "单次任务执行耗时")
+
+OVERRUN_POLICIES = ("skip", "catch_up")
+
+Number = Union[int, float]
+_Value = Union[Number, Callable[[], Number]]
+
+
+def _resolve(value: _Value) -> float:
+    return float(value() if callable(value) else value)
+
+
+class AlignedSchedule:
+    """纯计算的对齐调度：给出下一个边界、处理超时策略并统计延迟，不负责线程"""
+
+    def __init__(self, interval: _Value, offset: _Value = 0.0,
+                 policy: Union[str, Callable[[], str]] = "skip",
+                 max_catch_up: int = 3, name: str = "default"):
+        self._interval = interval
+        self._offset = offset
+        self._policy = policy
+        self.policy  # 构造时即校验策略名
+        self.max_catch_up = max(0, int(max_catch_up))
+        self.name = name
+        self.next_due: Optional[float] = None
+        self.last_due: Optional[float] = None
+        self.last_lag: Optional[float] = None
+        self.last_duration: Optional[float] = None
+        self.skipped = 0
+        self.runs = 0
+        self._catch_up_streak = 0
+        self._active_grid: Optional[tuple] = None
+
+    @property
+    def interval(self) -> float:
+        return max(1.0, _resolve(self._interval))
+
+    @property
+    def offset(self) -> float:
+        return _resolve(self._offset) % self.interval
+
+    @property
+    def policy(self) -> str:
+        policy = str(self._policy() if callable(self._policy) else self._policy)
+        if policy not in OVERRUN_POLICIES:
+            raise ValueError(f"未知的超时策略: {policy}")
+        return policy
+
+    def boundary_after(self, now: float) -> float:
+        """严格晚于 now 的第一个边界"""
+        interval = self.interval
+        offset = self.offset
+        k = math.floor((now - offset) / interval) + 1
+        return k * interval + offset
+
+    def due(self, now: Optional[float] = None) -> float:
+        """返回下一次应触发的墙钟时间（周期或偏移被动态修改时重新对齐）"""
+        now = time.time() if now is None else now
+        grid = (self.interval, self.offset)
+        if self.next_due is None or self._active_grid != grid:
+            self._active_grid = grid
+            self.next_due = self.boundary_after(now)
+        return self.next_due
+
+    def mark_started(self, now: Optional[float] = None) -> float:
+        """记录一次触发，返回相对边界的延迟（秒）"""
+        now = time.time() if now is None else now
+        due = self.due(now)
+        lag = max(0.0, now - due)
+        self.last_due = due
+        self.last_lag = lag
+        self.runs += 1
+        SCHEDULER_LAG_SECONDS.observe(lag, schedule=self.name)
+        SCHEDULER_LAST_LAG.set(lag, schedule=self.name)
+        SCHEDULER_RUNS_TOTAL.inc(schedule=self.name)
+        return lag
+
+    def mark_finished(self, duration: float, now: Optional[float] = None) -> float:
+        """记录执行完成并按超时策略推进到下一个边界，返回下一个边界"""
+        now = time.time() if now is None else now
+        self.last_duration = duration
+        SCHEDULER_RUN_SECONDS.observe(duration, schedule=self.name)
+        interval = self.interval
+        base = self.last_due if self.last_due is not None else now
+        candidate = base + interval
+        if candidate > now:
+            self._catch_up_streak = 0
+            self.next_due = candidate
+            return candidate
+
+        # 执行耗时越过了下一个边界
+        missed = int((now - candidate) // interval) + 1
+        if self.policy == "catch_up" and self._catch_up_streak < self.max_catch_up:
+            self._catch_up_streak += 1
+            self.next_due = candidate
+        else:
+            self._catch_up_streak = 0
+            self.skipped += missed
+            SCHEDULER_SKIPPED_TOTAL.inc(missed, schedule=self.name)
+            self.next_due = self.boundary_after(now)
+        return self.next_due
+
+    def status(self) -> Dict:
+        return {
+            "name": self.name,
+            "interval": self.interval,
+            "offset": self.offset,
+            "policy": self.policy,
+            "next_due": self.next_due,
+            "last_due": self.last_due,
+            "last_lag": self.last_lag,
+            "last_duration": self.last_duration,
+            "runs": self.runs,
+            "skipped": self.skipped,
+        }
@@ -0,0 +1,294 @@
+"""仿真模式的内存账本：持仓、成交、已实现盈亏与权益常驻内存，写库改为后台批量写回。
+
+原先每个模拟周期要分别打开连接执行 sim_get_open_position / sim_close_position（平仓前
+还要再读一次该行）/ sim_open_position。这里改为：
+- 未平仓持仓、最近成交、各交易对已实现盈亏都在内存中维护，查询无需访问数据库；
+- 开平仓只修改内存并把该行标记为待写入，同一持仓在一次写回前的多次修改（如开仓后
+  很快被止盈）合并为一行；
+- 后台线程每 flush_interval 秒把待写入的行用 executemany 在一个事务内写回 sim_positions
+  （提供 writer 时交给 db_writer 写线程，与决策写入合并提交），
+  写库失败时保留待写入数据，下一轮重试；进程退出前调用 stop() 做最后一次写回；
+- 启动时 load() 从 sim_positions 重建账本，id 由账本分配并与表的自增序列保持一致；
+- 每次平仓生成交易对与合计两条权益快照，与持仓行在同一事务写入 equity_snapshots，
+  权益曲线不再需要回放历史。
+
+sim_positions 仍是唯一的持久化格式，回测、导出等读取该表的代码无需改动。
+db_path 为 None 时账本只在内存中运行（回测回放使用），不读写数据库。
+"""
+
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+import db
+import metrics
+
+SIM_LEDGER_FLUSH_SECONDS = metrics.histogram("onlydecide_sim_ledger_flush_seconds", "模拟账本批量写回耗时")
+SIM_LEDGER_FLUSHED_ROWS = metrics.counter("onlydecide_sim_ledger_flushed_rows_total", "模拟账本写回的行数")
+SIM_LEDGER_FLUSH_ERRORS = metrics.counter("onlydecide_sim_ledger_flush_errors_total", "模拟账本写回失败次数")
+SIM_LEDGER_PENDING = metrics.gauge("onlydecide_sim_ledger_pending_rows", "等待写回的模拟持仓行数")
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class SimLedger:
+    """按交易对维护的模拟账本（线程安全）"""
+
+    def __init__(self, db_path: str, flush_interval: float = 1.0, initial_equity: float = 10000.0,
+                 leverage: Callable[[], float] = lambda: 1.0, max_fills: int = 200,
+                 on_error: Optional[Callable[[Exception], None]] = None, writer=None,
+                 flush_timeout: float = 10.0):
+        self.db_path = db_path
+        self.writer = writer
+        self.flush_interval = flush_interval
+        self.flush_timeout = flush_timeout
+        self.initial_equity = float(initial_equity)
+        self.leverage = leverage
+        self.on_error = on_error
+        self._open: Dict[str, Dict[int, Dict]] = {}
+        self._realized: Dict[str, List[float]] = {}
+        self._fills = deque(maxlen=max_fills)
+        self._pending: Dict[int, Dict] = {}
+        self._snapshots: List[tuple] = []
+        self._next_id = 1
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_flush: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    # ---------- 重建 ----------
+    def load(self) -> "SimLedger":
+        """从 sim_positions 重建账本（启动时调用）；会先写回尚未持久化的修改"""
+        if self.db_path is None:
+            return self
+        self.flush()
+        db.backfill_equity_snapshots(self.db_path, self.initial_equity)
+        state = db.sim_ledger_state(self.db_path)
+        rows = db.sim_list_open_positions(self.db_path)
+        recent = db.sim_list_positions(self.db_path, limit=self._fills.maxlen)
+        with self._lock:
+            self._open.clear()
+            for pos in sorted(rows, key=lambda r: (r.get("open_time") or "", r["id"])):
+                self._open.setdefault(pos["symbol"], {})[int(pos["id"])] = dict(pos)
+            self._realized = {s: [pnl, n] for s, (pnl, n) in state["realized"].items()}
+            self._next_id = max(self._next_id, state["next_id"])
+            self._fills.clear()
+            events = []
+            for pos in recent:
+                events.append(self._fill(pos, "open"))
+                if pos.get("status") == "closed":
+                    events.append(self._fill(pos, "close"))
+            for event in sorted(events, key=lambda e: e["time"] or ""):
+                self._fills.append(event)
+        return self
+
+    # ---------- 开平仓 ----------
+    @staticmethod
+    def _fill(pos: Dict, kind: str) -> Dict:
+        closing = kind == "close"
+        return {
+            "position_id": pos["id"],
+            "symbol": pos["symbol"],
+            "side": pos["side"],
+            "type": kind,
+            "size_eth": pos["size_eth"],
+            "price": pos["exit_price"] if closing else pos["entry_price"],
+            "time": pos["close_time"] if closing else pos["open_time"],
+            "pnl_usdt": pos["pnl_usdt"] if closing else None,
+        }
+
+    def _mark_dirty(self, pos: Dict):
+        if self.db_path is None:
+            return
+        self._pending[int(pos["id"])] = dict(pos)
+        SIM_LEDGER_PENDING.set(len(self._pending))
+        if self._thread is None and self.flush_interval and self.flush_interval > 0:
+            self.start()
+
+    def open_position(self, symbol: str, side: str, size_eth: float, entry_price: float,
+                      tp_price: float = None, sl_price: float = None, open_time: Optional[str] = None) -> int:
+        """开仓（status=open），返回持仓 id"""
+        with self._lock:
+            pid = self._next_id
+            self._next_id += 1
+            pos = {
+                "id": pid, "symbol": symbol, "side": side, "size_eth": size_eth, "entry_price": entry_price,
+                "tp_price": tp_price, "sl_price": sl_price, "status": "open",
+                "open_time": open_time or _now_iso(), "close_time": None, "exit_price": None,
+                "pnl_usdt": None, "pnl_pct": None,
+            }
+            self._open.setdefault(symbol, {})[pid] = pos
+            self._fills.append(self._fill(pos, "open"))
+            self._mark_dirty(pos)
+            return pid
+
+    def close_position(self, position_id: int, exit_price: float, close_time: Optional[str] = None,
+                       leverage: Optional[float] = None, fees: float = 0.0) -> Optional[Dict]:
+        """平掉指定持仓并计算已实现盈亏（扣除 fees）；持仓不存在或已平仓时返回 None"""
+        with self._lock:
+            pos = None
+            for positions in self._open.values():
+                pos = positions.pop(int(position_id), None)
+                if pos is not None:
+                    break
+            if pos is None:
+                return None
+            if not self._open.get(pos["symbol"]):
+                self._open.pop(pos["symbol"], None)
+            lev = self.leverage() if leverage is None else leverage
+            pnl, pnl_pct = db.compute_sim_pnl(pos["side"], float(pos["entry_price"] or 0),
+                                              float(pos["size_eth"] or 0), exit_price, lev, fees)
+            pos.update({"status": "closed", "close_time": close_time or _now_iso(),
+                        "exit_price": exit_price, "pnl_usdt": pnl, "pnl_pct": pnl_pct})
+            if self.db_path is not None:
+                before = {pos["symbol"]: self.realized_pnl(pos["symbol"]), "*": self.realized_pnl()}
+                self._snapshots.extend(db.equity_snapshot_rows([pos], self.initial_equity, before))
+            realized = self._realized.setdefault(pos["symbol"], [0.0, 0])
+            realized[0] += pnl
+            realized[1] += 1
+            self._fills.append(self._fill(pos, "close"))
+            self._mark_dirty(pos)
+            return dict(pos)
+
+    # ---------- 查询 ----------
+    def position(self, position_id: int) -> Optional[Dict]:
+        """按 id 查找未平仓持仓"""
+        with self._lock:
+            for positions in self._open.values():
+                pos = positions.get(int(position_id))
+                if pos is not None:
+                    return dict(pos)
+            return None
+
+    def get_open_position(self, symbol: Optional[str] = None) -> Optional[Dict]:
+        """当前开仓的模拟持仓（多条时返回最新一条），与 db.sim_get_open_position 一致"""
+        with self._lock:
+            latest = None
+            for sym, positions in self._open.items():
+                if symbol and sym != symbol:
+                    continue
+                for pos in positions.values():
+                    if latest is None or (pos["open_time"] or "") >= (latest["open_time"] or ""):
+                        latest = pos
+            return dict(latest) if latest else None
+
+    def list_open_positions(self, symbol: Optional[str] = None) -> List[Dict]:
+        with self._lock:
+            if symbol:
+                return [dict(p) for p in self._open.get(symbol, {}).values()]
+            return [dict(p) for positions in self._open.values() for p in positions.values()]
+
+    def fills(self, symbol: Optional[str] = None, limit: int = 50) -> List[Dict]:
+        """最近成交（开仓/平仓），时间倒序"""
+        with self._lock:
+            events = [f for f in reversed(self._fills) if not symbol or f["symbol"] == symbol]
+        return [dict(f) for f in events[:limit]]
+
+    def realized_pnl(self, symbol: Optional[str] = None) -> float:
+        with self._lock:
+            if symbol:
+                return self._realized.get(symbol, [0.0, 0])[0]
+            return sum(v[0] for v in self._realized.values())
+
+    def equity(self, symbol: Optional[str] = None, prices: Optional[Dict[str, float]] = None) -> Dict:
+        """权益 = 初始权益 + 已实现盈亏 + 未实现盈亏（提供 prices 时按该价格计算）"""
+        with self._lock:
+            realized = self.realized_pnl(symbol)
+            trades = sum(v[1] for s, v in self._realized.items() if not symbol or s == symbol)
+            unrealized = 0.0
+            lev = self.leverage()
+            for pos in self.list_open_positions(symbol):
+                price = (prices or {}).get(pos["symbol"])
+                if price:
+                    unrealized += db.compute_sim_pnl(pos["side"], float(pos["entry_price"] or 0),
+                                                     float(pos["size_eth"] or 0), price, lev)[0]
+        return {
+            "initial_equity": self.initial_equity,
+            "realized_pnl": realized,
+            "unrealized_pnl": unrealized,
+            "equity": self.initial_equity + realized + unrealized,
+            "closed_trades": trades,
+        }
+
+    # ---------- 写回 ----------
+    def flush(self) -> int:
+        """把待写入的行在一个事务内写回数据库，返回写入行数"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                snapshots, self._snapshots = self._snapshots, []
+            if not batch and not snapshots:
+                return 0
+            started = time.perf_counter()
+            try:
+                if self.writer is not None:
+                    # 写线程卡住时不无限等待：超时按写回失败处理，行放回待写入队列下次重写
+                    # （sim_positions 按 id 覆盖写入，超时后迟到的提交与重写结果一致）
+                    self.writer.write_sim_positions(list(batch.values()), snapshots).result(
+                        timeout=self.flush_timeout)
+                else:
+                    db.sim_write_positions(self.db_path, list(batch.values()), snapshots)
+            except Exception as e:
+                with self._lock:
+                    # 写回失败：放回待写入队列；写库期间又被修改的行以新版本为准
+                    for pid, row in batch.items():
+                        self._pending.setdefault(pid, row)
+                    self._snapshots[:0] = snapshots
+                    SIM_LEDGER_PENDING.set(len(self._pending))
+                SIM_LEDGER_FLUSH_ERRORS.inc()
+                self.last_error = str(e) or type(e).__name__
+                if self.on_error:
+                    self.on_error(e)
+                return 0
+            SIM_LEDGER_FLUSH_SECONDS.observe(time.perf_counter() - started)
+            SIM_LEDGER_FLUSHED_ROWS.inc(len(batch))
+            with self._lock:
+                SIM_LEDGER_PENDING.set(len(self._pending))
+            self.last_flush = time.time()
+            self.last_error = None
+            return len(batch)
+
+    def clear(self) -> int:
+        """清空模拟记录（内存与数据库），返回删除的行数"""
+        with self._flush_lock, self._lock:
+            self._pending.clear()
+            self._snapshots.clear()
+            self._open.clear()
+            self._realized.clear()
+            self._fills.clear()
+            SIM_LEDGER_PENDING.set(0)
+            return db.sim_clear(self.db_path) if self.db_path is not None else 0
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def start(self) -> "SimLedger":
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._flush_loop, name="SimLedgerFlush", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        """停止后台写回并把剩余修改写入数据库"""
+        self._stop.set()
+        self.flush()
+
+    def status(self) -> Dict:
+        with self._lock:
+            return {
+                "open_positions": sum(len(p) for p in self._open.values()),
+                "pending_rows": len(self._pending),
+                "pending_snapshots": len(self._snapshots),
+                "flush_interval": self.flush_interval,
+                "last_flush": self.last_flush,
+                "last_error": self.last_error,
+                "next_id": self._next_id,
+            }
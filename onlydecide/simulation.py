@@ -0,0 +1,283 @@
+"""仿真撮合引擎：实时模拟盘、/api/ai_decision 与历史回测共用同一条开平仓路径。
+
+每个信号（决策）按固定顺序处理：
+1. 用信号价格检查止盈止损（TPSLMonitor，按触发价平仓）；
+2. 已有持仓且出现下一条信号（open_long/open_short/hold）时按信号价平仓；
+3. 开仓信号在无持仓时按 PositionSizer 计算数量开仓。
+
+成本与杠杆由可替换的模型计算，参数既可以是数值，也可以是返回数值的函数（读取运行时配置）：
+- FeeModel：按成交名义价值（价格 * 数量 * 杠杆）收取手续费，开平两侧各收一次；
+- SlippageModel：按基点让成交价向不利方向偏移（按盘口深度计算见 cost_models）；
+- FundingModel：持仓跨越资金费结算时刻（UTC 0/8/16 点）时按名义价值计提资金费，
+  多头在正费率时支付、空头收取；
+- LeverageModel：盈亏与名义价值的放大倍数。
+手续费与资金费在平仓时从已实现盈亏中扣除。持仓记录在 SimLedger 中：实时模拟写回
+sim_positions，回测使用不落库的内存账本。
+"""
+
+import threading
+from contextlib import nullcontext
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, List, Optional
+
+import metrics
+import tpsl_monitor
+
+SIM_FILLS_TOTAL = metrics.counter("onlydecide_sim_fills_total", "仿真引擎成交次数（按类型与原因）")
+
+OPEN_ACTIONS = ("open_long", "open_short")
+SIGNAL_ACTIONS = ("open_long", "open_short", "hold")
+
+
+def resolve(value):
+    """参数可以是数值或返回数值的函数"""
+    return value() if callable(value) else value
+
+
+def to_float(value, default=0.0) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def parse_time(value) -> Optional[datetime]:
+    """解析ISO时间（或毫秒时间戳），无时区时按UTC"""
+    if isinstance(value, datetime):
+        dt = value
+    elif isinstance(value, (int, float)):
+        dt = datetime.fromtimestamp(value / 1000.0, tz=timezone.utc)
+    else:
+        try:
+            dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        except (TypeError, ValueError):
+            return None
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class FeeModel:
+    """按成交名义价值收取手续费（rate 为费率，如 0.0005 表示 0.05%）"""
+
+    def __init__(self, rate=0.0):
+        self.rate = rate
+
+    def fee(self, symbol: str, notional: float, maker: bool = False) -> float:
+        return abs(notional) * max(0.0, to_float(resolve(self.rate)))
+
+
+class SlippageModel:
+    """成交价向不利方向偏移 bps 个基点：买入上浮、卖出下调"""
+
+    def __init__(self, bps=0.0):
+        self.bps = bps
+
+    def fill_price(self, symbol: str, side: str, price: float, size: float, opening: bool, when=None) -> float:
+        """size 为按杠杆放大后的成交数量（币本位），when 为成交时间"""
+        adj = max(0.0, to_float(resolve(self.bps))) / 10000.0
+        buying = (side == "long") == opening
+        return price * (1 + adj) if buying else price * (1 - adj)
+
+
+class FundingModel:
+    """永续合约资金费：rate 为每个结算周期的费率（正费率多头支付）"""
+
+    INTERVAL_HOURS = 8
+
+    def __init__(self, rate=0.0):
+        self.rate = rate
+
+    def rate_at(self, symbol: str, when: datetime) -> float:
+        return to_float(resolve(self.rate))
+
+    def settlements(self, open_time, close_time) -> List[datetime]:
+        """(open_time, close_time] 区间内的资金费结算时刻"""
+        start, end = parse_time(open_time), parse_time(close_time)
+        if start is None or end is None or end <= start:
+            return []
+        step = timedelta(hours=self.INTERVAL_HOURS)
+        first = start.replace(minute=0, second=0, microsecond=0,
+                              hour=start.hour - start.hour % self.INTERVAL_HOURS)
+        if first <= start:
+            first += step
+        times = []
+        while first <= end:
+            times.append(first)
+            first += step
+        return times
+
+    def cost(self, symbol: str, side: str, notional: float, open_time, close_time) -> float:
+        """持仓期间的资金费（正数为支出）"""
+        total = sum(self.rate_at(symbol, t) for t in self.settlements(open_time, close_time))
+        paid = abs(notional) * total
+        return paid if side == "long" else -paid
+
+
+class LeverageModel:
+    """杠杆倍数（非法或 <=0 时按 1 倍）"""
+
+    def __init__(self, leverage=1.0):
+        self.leverage = leverage
+
+    def value(self, symbol: Optional[str] = None) -> float:
+        lev = to_float(resolve(self.leverage), 1.0)
+        return lev if lev > 0 else 1.0
+
+
+class PositionSizer:
+    """开仓数量（币本位）：AI建议数量 → 用户自定义仓位 → 上下限夹紧
+
+    - override_usdt：按USDT金额折算数量（实时模拟的“自定义仓位”）；
+    - override_size：直接指定数量（回测的 position_size 参数）；
+    - min_size/max_size：为 None 时不夹紧。
+    """
+
+    def __init__(self, override_usdt=None, override_size=None, min_size=None, max_size=None):
+        self.override_usdt = override_usdt
+        self.override_size = override_size
+        self.min_size = min_size
+        self.max_size = max_size
+
+    def size(self, signal: Dict, price: float) -> float:
+        size = to_float(signal.get("position_size"))
+        override_size = resolve(self.override_size)
+        override_usdt = resolve(self.override_usdt)
+        if override_size is not None and to_float(override_size) > 0:
+            size = to_float(override_size)
+        elif override_usdt is not None:
+            size = (to_float(override_usdt) / price) if price and price > 0 else 0.0
+        if size <= 0:
+            return 0.0
+        min_size, max_size = resolve(self.min_size), resolve(self.max_size)
+        if min_size is not None:
+            size = max(to_float(min_size), size)
+        if max_size is not None:
+            size = min(size, to_float(max_size))
+        return size
+
+
+def signal_from_decision(symbol: str, decision: Dict, price: float, timestamp: Optional[str] = None) -> Dict:
+    """把AI决策（trading_decision/position_management）转换为与 decisions 表行相同字段的信号"""
+    td = (decision or {}).get("trading_decision", {}) or {}
+    pm = (decision or {}).get("position_management", {}) or {}
+    return {
+        "symbol": symbol,
+        "timestamp": timestamp,
+        "current_price": price,
+        "action": td.get("action"),
+        "position_size": pm.get("position_size"),
+        "take_profit_price": pm.get("take_profit_price"),
+        "stop_loss_price": pm.get("stop_loss_price"),
+    }
+
+
+class SimulationEngine:
+    """按信号驱动的模拟撮合；store 为 SimLedger（或提供相同接口的账本）"""
+
+    def __init__(self, store, fees: Optional[FeeModel] = None, slippage: Optional[SlippageModel] = None,
+                 funding: Optional[FundingModel] = None, leverage: Optional[LeverageModel] = None,
+                 sizer: Optional[PositionSizer] = None, lock: Optional[Callable[[str], object]] = None,
+                 tpsl=True, on_event: Optional[Callable[[Dict], None]] = None):
+        self.store = store
+        self.fees = fees or FeeModel()
+        self.slippage = slippage or SlippageModel()
+        self.funding = funding or FundingModel()
+        self.leverage = leverage or LeverageModel()
+        self.sizer = sizer or PositionSizer()
+        self.lock = lock
+        self.tpsl_enabled = tpsl
+        self.on_event = on_event
+        # 止盈止损通过引擎平仓，与信号平仓计提相同的成本
+        self.tpsl = tpsl_monitor.TPSLMonitor(self, ledger=lock, leverage=self.leverage.value)
+        self._ctx = threading.local()
+
+    def _lock(self, symbol: str):
+        return self.lock(symbol) if self.lock else nullcontext()
+
+    def _emit(self, event: Dict):
+        SIM_FILLS_TOTAL.inc(type=event["type"], reason=event["reason"])
+        events = getattr(self._ctx, "events", None)
+        if events is not None:
+            events.append(event)
+        if self.on_event:
+            self.on_event(event)
+
+    # ---------- 持仓存储接口（供 TPSLMonitor 使用） ----------
+    def list_open_positions(self, symbol: Optional[str] = None) -> List[Dict]:
+        return self.store.list_open_positions(symbol)
+
+    def close_position(self, position_id: int, exit_price: float, close_time: Optional[str] = None,
+                       leverage: Optional[float] = None, reason: str = "signal") -> Optional[Dict]:
+        """按给定价格平仓（计入滑点、手续费与资金费），返回平仓事件"""
+        pos = self.store.position(position_id)
+        if pos is None or pos.get("status") != "open":
+            return None
+        symbol, side = pos["symbol"], pos["side"]
+        size = to_float(pos["size_eth"])
+        entry = to_float(pos["entry_price"])
+        lev = self.leverage.value(symbol) if leverage is None else leverage
+        close_time = close_time or getattr(self._ctx, "time", None) or _now_iso()
+        fill = self.slippage.fill_price(symbol, side, exit_price, size * lev, opening=False, when=close_time)
+        fees = self.fees.fee(symbol, entry * size * lev) + self.fees.fee(symbol, fill * size * lev)
+        funding = self.funding.cost(symbol, side, entry * size * lev, pos.get("open_time"), close_time)
+        closed = self.store.close_position(position_id, fill, close_time=close_time, leverage=lev,
+                                           fees=fees + funding)
+        if closed is None:
+            return None
+        event = dict(closed, type="close", reason=reason, signal_price=exit_price, leverage=lev,
+                     fees=fees, funding=funding)
+        self._emit(event)
+        return event
+
+    # ---------- 信号处理 ----------
+    def _open(self, signal: Dict, price: float, when: str) -> Optional[Dict]:
+        symbol = signal["symbol"]
+        size = self.sizer.size(signal, price)
+        if size <= 0:
+            return None
+        side = "long" if (signal.get("action") or "").lower() == "open_long" else "short"
+        lev = self.leverage.value(symbol)
+        entry = self.slippage.fill_price(symbol, side, price, size * lev, opening=True, when=when)
+        tp = to_float(signal.get("take_profit_price")) or None
+        sl = to_float(signal.get("stop_loss_price")) or None
+        pid = self.store.open_position(symbol, side, size, entry, tp_price=tp, sl_price=sl, open_time=when)
+        event = {"type": "open", "reason": "signal", "id": pid, "symbol": symbol, "side": side,
+                 "size_eth": size, "entry_price": entry, "signal_price": price, "tp_price": tp, "sl_price": sl,
+                 "open_time": when, "leverage": lev,
+                 "override_usdt": resolve(self.sizer.override_usdt)}
+        self._emit(event)
+        return event
+
+    def step(self, signal: Dict) -> List[Dict]:
+        """处理一条信号，返回本次产生的开平仓事件"""
+        symbol = signal["symbol"]
+        price = to_float(signal.get("current_price"))
+        action = (signal.get("action") or "hold").lower()
+        when = signal.get("timestamp") or _now_iso()
+        with self._lock(symbol):
+            self._ctx.events, self._ctx.time = [], when
+            try:
+                if price > 0:
+                    # 先用本轮价格检查止盈止损，避免已触发的持仓被按信号价平仓
+                    if resolve(self.tpsl_enabled):
+                        self.tpsl.on_tick(symbol, price)
+                    open_pos = self.store.get_open_position(symbol)
+                    if open_pos and action in SIGNAL_ACTIONS:
+                        self.close_position(open_pos["id"], price, close_time=when)
+                        open_pos = None
+                    if open_pos is None and action in OPEN_ACTIONS:
+                        self._open(signal, price, when)
+                    self.tpsl.sync(symbol)
+                return self._ctx.events
+            finally:
+                self._ctx.events, self._ctx.time = None, None
+
+    def apply(self, decisions: Iterable[Dict]) -> List[Dict]:
+        """按顺序处理一批信号（decisions 表行或 signal_from_decision 的结果），返回全部事件"""
+        events = []
+        for signal in decisions:
+            events.extend(self.step(signal))
+        return events
@@ -18,29 +18,100 @@ import base64
 import json
 import requests
 import logging
-import re
-from datetime import datetime, timezone, timedelta
+from datetime import datetime, timezone
 from typing import Dict, List, Optional
 import urllib.parse
 
+import decision_parser
+import metrics
+import ratelimit
+import resilience
+import ws_feed
+from decision_parser import IncrementalDecisionExtractor
+from resilience import DataUnavailable, ExchangeAPIError
+
 # ==================== 基础配置 ====================
 OKX_API_KEY = "xxxxxxxxxxxxxxxx"
 OKX_SECRET = "xxxxxxxxxxxxxxxxxxxxxxxxx"
 OKX_PASSWORD = "xxxxxxxxxxxxxxxxxxxxxxxxxx"
 DEEPSEEK_API_KEY = "xxxxxxxxxxxxxxxxxxxx"
 
+# 接口地址：可通过环境变量指向本地模拟服务（见 mock_servers.py）
+OKX_BASE_URL = os.environ.get("OKX_BASE_URL", "https://www.okx.com")
+DEEPSEEK_BASE_URL = os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com/v1/chat/completions")
+# OKX按接口限速（令牌桶，超额时排队而不是报错），额度见 ratelimit.OKX_RATE_LIMITS
+OKX_RATE_LIMIT_ENABLED = True
+OKX_RATE_LIMITER = ratelimit.EndpointRateLimiter()
+# OKX容错：幂等GET请求带抖动重试；按接口熔断，连续暂时性失败后直接失败一段时间
+OKX_RETRY_ATTEMPTS = 3
+OKX_RETRY_BASE_DELAY = 0.2  # 秒
+OKX_RETRY_MAX_DELAY = 2.0  # 秒
+OKX_BREAKER_THRESHOLD = 5
+OKX_BREAKER_RESET = 30  # 秒
+OKX_CALLER = resilience.ResilientCaller(OKX_RETRY_ATTEMPTS, OKX_RETRY_BASE_DELAY, OKX_RETRY_MAX_DELAY,
+                                        OKX_BREAKER_THRESHOLD, OKX_BREAKER_RESET)
+# OKX WebSocket行情（可选）：开启后价格与K线优先读取内存中的推送，连接过期或K线不足时回退REST
+OKX_WS_ENABLED = os.environ.get("OKX_WS_ENABLED", "0") == "1"
+OKX_WS_PUBLIC_URL = os.environ.get("OKX_WS_PUBLIC_URL", "wss://ws.okx.com:8443/ws/v5/public")
+OKX_WS_BUSINESS_URL = os.environ.get("OKX_WS_BUSINESS_URL", "wss://ws.okx.com:8443/ws/v5/business")
+OKX_WS_MAX_AGE = 5  # 秒：超过该时间未收到任何消息即视为推送中断
+
 # 测试模式控制变量
 jymkcs = False  # 仅做数据采集与AI决策，关闭交易模块测试
 
 SYMBOL = "ETH-USDT-SWAP"
+# 多交易对：除 SYMBOL 外额外跟踪的USDT永续合约，每个交易对独立调度与模拟记账
+SYMBOLS: List[str] = []
+ENGINE_MAX_WORKERS = 4  # 同时执行决策周期的工作线程上限
+ENGINE_OKX_CONCURRENCY = 4  # 所有交易对共享：同时向OKX采集数据的周期数
+ENGINE_LLM_CONCURRENCY = 2  # 所有交易对共享：同时等待DeepSeek响应的周期数
+ENGINE_ACCOUNT_TTL = 5  # 账户余额在各交易对之间共享的缓存秒数
 LEVERAGE = 50  # 默认杠杆
 # 交易尺寸下限与上限（单位：ETH）
 # OKX 永续合约 ctVal=0.1，最小张数 0.01 => 最小ETH约 0.001
 MIN_ORDER_SIZE = 0.0001  # 最小下单量（ETH）
 MAX_ORDER_SIZE = 10.0   # 最大下单量（ETH），用于安全夹紧
 AI_FREQUENCY = 300
+# 决策调度：在每个 AI_FREQUENCY 周期边界（如5m收盘）之后 AI_SCHEDULE_OFFSET 秒触发
+AI_SCHEDULE_OFFSET = 5
+AI_SCHEDULE_OVERRUN = 'skip'  # 单次决策超过一个周期时：'skip' 跳到下一边界，'catch_up' 立即补跑
 CHECK_PENDING_ORDERS_INTERVAL = 30  # 检查挂单间隔
 
+# 仿真模式止盈止损监控：在决策周期之间按价格tick检查模拟持仓的TP/SL
+SIM_TPSL_ENABLED = True
+SIM_TPSL_POLL_INTERVAL = 2  # 秒；只轮询有模拟持仓的交易对，启用WebSocket行情时另有推送驱动
+# 仿真内存账本：持仓/盈亏在内存中维护，按间隔批量写回 sim_positions
+SIM_LEDGER_FLUSH_INTERVAL = 1.0  # 秒
+SIM_LEDGER_FLUSH_TIMEOUT = 10.0  # 秒；等待DB写线程提交的上限，超时视为写回失败并在下次重试
+SIM_INITIAL_EQUITY = 10000.0  # 模拟账户初始权益（USDT）
+# 仿真成本模型（实时模拟与回测共用；回测的手续费以请求参数 fee_rate 为准）
+# 手续费档位 (30日交易量USDT门槛, maker, taker)，按交易量选档；模拟成交按taker计
+SIM_FEE_TIERS = [(0.0, 0.0002, 0.0005)]
+SIM_FEE_VOLUME_30D = 0.0  # 用于选档的30日交易量（USDT）
+SIM_SLIPPAGE_BPS = 0.0  # 没有可用盘口快照时的固定滑点（基点）
+SIM_DEPTH_SNAPSHOT_ENABLED = True  # 每个决策周期记录一份盘口深度快照，用于按成交量计算滑点
+SIM_DEPTH_LEVELS = 50  # 快照档位数
+SIM_DEPTH_MAX_AGE = 900  # 秒；成交时刻之前超过该时长的快照不再使用
+SIM_FUNDING_RATE = 0.0  # 资金费率历史未覆盖时使用的每8小时费率，正费率多头支付
+SIM_FUNDING_REFRESH = 3600  # 秒；资金费率历史的同步间隔
+# 数据库结构迁移的后台回填：每批改写行数与批次间隔（秒），批次越小对决策写入的阻塞越短
+DB_BACKFILL_BATCH_SIZE = 500
+DB_BACKFILL_PAUSE = 0.05
+# 决策冷热分层：超过保留天数的决策的JSON字段移到按月压缩归档（0 为不归档），检查间隔（秒）
+# 启用后 decisions_archive/ 目录与 decisions.db 一起才是完整数据，备份时两者都要备份
+DECISION_RETENTION_DAYS = 0
+DECISION_ARCHIVE_INTERVAL = 21600
+# 决策JSON字段用共享字典压缩存储（停止压缩用 compress_blobs.py disable）
+DB_BLOB_COMPRESSION = False
+# 异步批量写库：每个事务最多合并的写操作数、第一项入队后最长等待（秒），以及是否使用WAL日志
+DB_WRITER_MAX_BATCH = 200
+DB_WRITER_MAX_DELAY = 0.05
+DB_WAL_MODE = True
+# 只读快照：回测、导出、统计读取的主库快照刷新间隔（秒），超过最长使用时间（秒）未刷新成功时改读主库
+DB_REPLICA_ENABLED = True
+DB_REPLICA_INTERVAL = 300
+DB_REPLICA_MAX_AGE = 900
+
 # 运行时用户覆盖参数（由Web端动态设置）
 USER_OVERRIDE_ENABLED = False
 USER_OVERRIDE_POSITION_SIZE: Optional[float] = None
@@ -50,6 +121,10 @@ USER_POSITION_UNIT: str = 'USDT'
 # 交易模式控制（由Web端动态设置）
 TRADING_MODE = 'simulation'  # 'simulation' 或 'live'
 
+# AI流式响应：边接收边解析，决策JSON一闭合即可返回
+AI_STREAM_ENABLED = False
+AI_STREAM_ABORT_EARLY = True  # 提取到决策后是否立即断开剩余的流
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s'
@@ -59,6 +134,14 @@ logger = logging.getLogger()
 ERROR_FILE = "baocuo.txt"
 ECHO_FILE = "huixian.txt"
 
+# 性能指标（通过 app.py 的 /api/metrics 暴露）
+OKX_REQUEST_SECONDS = metrics.histogram("onlydecide_okx_request_duration_seconds", "OKX REST请求耗时（按端点）")
+OKX_REQUESTS_TOTAL = metrics.counter("onlydecide_okx_requests_total", "OKX REST请求次数（按端点与结果）")
+LLM_REQUEST_SECONDS = metrics.histogram("onlydecide_llm_request_duration_seconds", "DeepSeek请求耗时")
+LLM_TIME_TO_DECISION_SECONDS = metrics.histogram("onlydecide_llm_time_to_decision_seconds", "流式模式下提取到决策的耗时")
+LLM_REQUESTS_TOTAL = metrics.counter("onlydecide_llm_requests_total", "DeepSeek请求次数（按结果）")
+AI_STAGE_SECONDS = metrics.histogram("onlydecide_ai_stage_duration_seconds", "AI决策内部阶段耗时（提示词构建/解析）")
+
 
 def write_error(message: str):
     """写入错误信息到报错文件"""
@@ -84,6 +167,16 @@ def write_echo(message: str):
         logger.error(f"无法写入回显文件: {e}")
 
 
+def is_live_mode() -> bool:
+    """是否为实盘模式（按当前 TRADING_MODE，前端切换模式时修改的也是它）"""
+    return str(TRADING_MODE).lower() == 'live'
+
+
+def has_unavailable(*snapshots) -> bool:
+    """账户/持仓快照中是否有标记为不可用的（仿真模式下账户接口失败时返回的空账户/空仓）"""
+    return any(isinstance(s, dict) and s.get('unavailable') for s in snapshots)
+
+
 # ==================== 模块1: 信息收集模块 ====================
 class OKXDataCollector:
     """OKX数据收集器"""
@@ -92,7 +185,16 @@ class OKXDataCollector:
         self.api_key = api_key
         self.secret = secret
         self.password = password
-        self.base_url = "https://www.okx.com"
+        self.base_url = OKX_BASE_URL
+        self.feed = None  # 可选的 ws_feed.OKXMarketFeed，命中时价格/K线直接读内存
+        self._ct_val: Dict[str, float] = {}  # 合约面值缓存
+
+    def start_market_feed(self):
+        """启动WebSocket行情订阅（重复调用返回已有实例）"""
+        if self.feed is None:
+            self.feed = ws_feed.OKXMarketFeed(OKX_WS_PUBLIC_URL, OKX_WS_BUSINESS_URL, max_age=OKX_WS_MAX_AGE,
+                                              log=write_echo, error=write_error).start()
+        return self.feed
 
     def _generate_signature(self, timestamp: str, method: str, request_path: str, body: str = "") -> str:
         """生成OKX API签名"""
@@ -121,8 +223,25 @@ class OKXDataCollector:
         return timestamp
 
     def _make_request(self, method: str, endpoint: str, params: Dict = None) -> Dict:
-        """发送API请求"""
+        """发送API请求：按接口熔断，幂等的GET请求失败时带抖动重试"""
+        def on_retry(attempt: int, delay: float, e: BaseException):
+            write_echo(f"请求重试({attempt}): {method.upper()} {endpoint} 等待 {delay * 1000:.0f}ms - {e}")
+
+        return OKX_CALLER.call(endpoint, lambda: self._send_request(method, endpoint, params),
+                               idempotent=method.upper() == 'GET', on_retry=on_retry)
+
+    def _send_request(self, method: str, endpoint: str, params: Dict = None) -> Dict:
+        """发送单次API请求"""
+        req_start = time.perf_counter()
+        outcome = 'error'
         try:
+            # 按接口限速排队（下单类接口按交易对分别计数）；在生成时间戳与签名之前排队，
+            # 否则排队时间计入签名时间戳的时效，积压时可能被 OKX 判为过期
+            if OKX_RATE_LIMIT_ENABLED:
+                waited = OKX_RATE_LIMITER.acquire(endpoint, inst_id=(params or {}).get('instId'))
+                if waited > 0:
+                    write_echo(f"限速排队: {endpoint} 等待 {waited * 1000:.0f}ms")
+
             # 构建请求路径和URL
             request_path = endpoint
             url = self.base_url + endpoint
@@ -183,8 +302,9 @@ class OKXDataCollector:
                 error_msg = f"API错误: {result['msg']} (代码: {result['code']})"
                 # 记录详细的错误信息
                 write_error(f"{error_msg} - 请求路径: {request_path}, 参数: {params}")
-                raise Exception(error_msg)
+                raise ExchangeAPIError(error_msg, code=result['code'])
 
+            outcome = 'ok'
             return result['data']
 
         except requests.exceptions.RequestException as e:
@@ -193,9 +313,16 @@ class OKXDataCollector:
         except Exception as e:
             write_error(f"API请求失败: {e}")
             raise
+        finally:
+            OKX_REQUEST_SECONDS.observe(time.perf_counter() - req_start, endpoint=endpoint, method=method.upper())
+            OKX_REQUESTS_TOTAL.inc(endpoint=endpoint, method=method.upper(), outcome=outcome)
 
     def get_kline_data(self, symbol: str = SYMBOL, bar: str = "5m", limit: int = 6) -> List[Dict]:
         """获取K线数据"""
+        if self.feed is not None:
+            klines = self.feed.klines(symbol, bar, limit)
+            if klines is not None:
+                return klines
         try:
             endpoint = "/api/v5/market/candles"
             params = {
@@ -205,54 +332,25 @@ class OKXDataCollector:
             }
 
             data = self._make_request('GET', endpoint, params)
-            klines = []
-
-            for candle in data:
-                klines.append({
-                    "timestamp": datetime.fromtimestamp(int(candle[0]) / 1000).strftime('%Y-%m-%d %H:%M:%S'),
-                    "open": float(candle[1]),
-                    "high": float(candle[2]),
-                    "low": float(candle[3]),
-                    "close": float(candle[4]),
-                    "volume": float(candle[5])
-                })
+            klines = [ws_feed.candle_to_kline(candle) for candle in data]
+            if self.feed is not None:
+                # WS只推送最新一根，用REST结果补齐历史，之后的读取走内存
+                self.feed.seed_candles(symbol, bar, data)
 
             write_echo(f"获取{bar}K线数据成功: {len(klines)}根")
             return klines
 
         except Exception as e:
             write_error(f"获取{bar}K线数据失败: {e}")
-            # 返回模拟数据避免程序中断
-            current_time = datetime.now()
-            base_price = 3500.0
-
-            # 根据时间间隔生成不同的模拟数据
-            if bar == "5m":
-                time_delta = timedelta(minutes=5)
-            elif bar == "30m":
-                time_delta = timedelta(minutes=30)
-            elif bar == "2H":
-                time_delta = timedelta(hours=2)
-            elif bar == "1D":
-                time_delta = timedelta(days=1)
-            else:
-                time_delta = timedelta(minutes=5)
-
-            klines = []
-            for i in range(limit, 0, -1):
-                klines.append({
-                    "timestamp": (current_time - i * time_delta).strftime('%Y-%m-%d %H:%M:%S'),
-                    "open": base_price + i * 5,
-                    "high": base_price + i * 5 + 20,
-                    "low": base_price + i * 5 - 10,
-                    "close": base_price + i * 5 + 8,
-                    "volume": 1500.0 + i * 100
-                })
-
-            return klines
+            # 不再生成模拟K线，交由调用方跳过本轮
+            raise DataUnavailable(f"{bar}K线", str(e)) from e
 
     def get_current_price(self, symbol: str = SYMBOL) -> float:
         """获取当前价格（随传入交易对切换）"""
+        if self.feed is not None:
+            price = self.feed.price(symbol)
+            if price is not None:
+                return price
         try:
             write_echo(f"请求当前价格: {symbol}")
             endpoint = "/api/v5/market/ticker"
@@ -263,8 +361,49 @@ class OKXDataCollector:
             return price
         except Exception as e:
             write_error(f"获取当前价格失败: {e}")
-            write_echo("使用默认价格 3500.0 USDT")
-            return 3500.0  # 默认价格
+            raise DataUnavailable("ticker", str(e)) from e
+
+    def get_contract_value(self, symbol: str = SYMBOL) -> float:
+        """合约面值ctVal（每张合约对应的币数量），按交易对缓存"""
+        if symbol in self._ct_val:
+            return self._ct_val[symbol]
+        endpoint = "/api/v5/public/instruments"
+        data = self._make_request('GET', endpoint, {'instType': 'SWAP', 'instId': symbol})
+        ct_val = float(data[0]['ctVal'])
+        self._ct_val[symbol] = ct_val
+        return ct_val
+
+    def get_order_book(self, symbol: str = SYMBOL, depth: int = 50) -> Dict:
+        """获取盘口深度快照，数量换算为币本位：{ts, bids: [[价格, 数量]], asks: [[价格, 数量]]}"""
+        try:
+            ct_val = self.get_contract_value(symbol)
+            endpoint = "/api/v5/market/books"
+            data = self._make_request('GET', endpoint, {'instId': symbol, 'sz': depth})
+            book = data[0]
+            return {
+                'ts': int(book['ts']),
+                'bids': [[float(lv[0]), float(lv[1]) * ct_val] for lv in book.get('bids', [])],
+                'asks': [[float(lv[0]), float(lv[1]) * ct_val] for lv in book.get('asks', [])],
+            }
+        except Exception as e:
+            write_error(f"获取盘口深度失败[{symbol}]: {e}")
+            raise DataUnavailable("books", str(e)) from e
+
+    def get_funding_rate_history(self, symbol: str = SYMBOL, after: Optional[int] = None,
+                                 limit: int = 100) -> List[tuple]:
+        """获取一页历史资金费率（新到旧）：[(结算时间毫秒, 费率)]；after 为毫秒时间戳，返回更早的记录"""
+        try:
+            endpoint = "/api/v5/public/funding-rate-history"
+            params = {'instId': symbol, 'limit': limit}
+            if after is not None:
+                params['after'] = int(after)
+            data = self._make_request('GET', endpoint, params)
+            # realizedRate 为实际收取的费率，缺失时使用 fundingRate
+            return [(int(item['fundingTime']), float(item.get('realizedRate') or item['fundingRate']))
+                    for item in data]
+        except Exception as e:
+            write_error(f"获取资金费率历史失败[{symbol}]: {e}")
+            raise DataUnavailable("funding", str(e)) from e
 
     def get_account_balance(self) -> Dict:
         """获取账户余额信息"""
@@ -288,10 +427,10 @@ class OKXDataCollector:
 
         except Exception as e:
             write_error(f"获取账户余额失败: {e}")
-            return {
-                "available_OKX": 4.51,
-                "total_equity": 4.52
-            }
+            if not is_live_mode():
+                # 仿真模式只依赖公开行情（私有接口可能未配置密钥）：按空账户继续并标记不可用
+                return {"available_OKX": 0.0, "total_equity": 0.0, "unavailable": True}
+            raise DataUnavailable("balance", str(e)) from e
 
     def get_position_info(self, symbol: str = SYMBOL) -> Dict:
         """获取持仓信息"""
@@ -324,12 +463,11 @@ class OKXDataCollector:
 
         except Exception as e:
             write_error(f"获取持仓信息失败: {e}")
-            return {
-                "position_side": "flat",
-                "position_size": 0.0,
-                "entry_price": 0.0,
-                "leverage": LEVERAGE
-            }
+            if not is_live_mode():
+                # 仿真模式的持仓由模拟账本维护，交易所持仓不可用时按空仓继续并标记不可用
+                return {"position_side": "flat", "position_size": 0.0, "entry_price": 0.0,
+                        "leverage": LEVERAGE, "unavailable": True}
+            raise DataUnavailable("positions", str(e)) from e
 
     def get_algo_orders(self, algo_id: str = None) -> List[Dict]:
         # 已移除交易相关接口：算法订单查询
@@ -362,10 +500,61 @@ class OKXDataCollector:
 class DeepSeekAI:
     """DeepSeek AI交易决策"""
 
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, stream: Optional[bool] = None):
         self.api_key = api_key
-        self.base_url = "https://api.deepseek.com/v1/chat/completions"
+        self.base_url = DEEPSEEK_BASE_URL
         self.last_profit = 0.0  # 记录上次策略盈利
+        self.stream = stream  # None 表示跟随全局 AI_STREAM_ENABLED
+
+    def _stream_enabled(self) -> bool:
+        if self.stream is not None:
+            return bool(self.stream)
+        return bool(AI_STREAM_ENABLED)
+
+    def _request_completion_stream(self, headers: Dict, payload: Dict) -> tuple:
+        """以流式方式请求AI，返回 (已接收文本, 提前提取到的决策或None)"""
+        payload = dict(payload, stream=True)
+        extractor = IncrementalDecisionExtractor(validator=self._validate_decision_format)
+        decision = None
+        ai_start = time.time()
+        first_token_at = None
+        aborted = False
+        response = requests.post(self.base_url, headers=headers, json=payload, timeout=30, stream=True)
+        try:
+            response.raise_for_status()
+            for raw in response.iter_lines():
+                if not raw:
+                    continue
+                line = raw.decode('utf-8', errors='replace') if isinstance(raw, bytes) else raw
+                if not line.startswith('data:'):
+                    continue
+                data = line[5:].strip()
+                if data == '[DONE]':
+                    break
+                try:
+                    delta = json.loads(data)['choices'][0].get('delta') or {}
+                except Exception:
+                    continue
+                piece = delta.get('content') or ''
+                if not piece:
+                    continue
+                if first_token_at is None:
+                    first_token_at = time.time()
+                    write_echo(f"AI首个token耗时: {first_token_at - ai_start:.2f}秒")
+                if decision is None:
+                    decision = extractor.feed(piece)
+                    if decision is not None:
+                        LLM_TIME_TO_DECISION_SECONDS.observe(time.time() - ai_start)
+                        write_echo(f"AI流式提取决策耗时: {time.time() - ai_start:.2f}秒")
+                        if AI_STREAM_ABORT_EARLY:
+                            aborted = True
+                            break
+                else:
+                    extractor.append(piece)
+        finally:
+            response.close()
+        write_echo(f"AI响应耗时: {time.time() - ai_start:.2f}秒（流式{'，已提前断开' if aborted else ''}）")
+        return extractor.buffer, decision
 
     def get_trading_decision(self, market_data: Dict, account_status: Dict, position_info: Dict, history: Optional[List[Dict]] = None, symbol: Optional[str] = None) -> Dict:
         """获取AI交易决策"""
@@ -377,7 +566,8 @@ class DeepSeekAI:
             write_echo(f"上次策略盈利: {self.last_profit:.6f} USDT")
 
             # 构建AI提示词 - 优化版模板（包含历史上下文）
-            prompt = self._build_prompt(market_data, account_status, position_info, history)
+            with AI_STAGE_SECONDS.time(stage='prompt_build'):
+                prompt = self._build_prompt(market_data, account_status, position_info, history)
             write_echo(f"构建AI提示词完成，长度: {len(prompt)} 字符")
 
             headers = {
@@ -467,18 +657,35 @@ class DeepSeekAI:
             except Exception:
                 pass
             write_echo("准备调用AI接口 deepseek-chat，温度: 1, max_tokens: 2000")
-            ai_start = time.time()
-            response = requests.post(self.base_url, headers=headers, json=payload, timeout=30)
-            response.raise_for_status()
-            result = response.json()
-            ai_duration = time.time() - ai_start
-            write_echo(f"AI响应耗时: {ai_duration:.2f}秒")
-            ai_response = result['choices'][0]['message']['content']
+            streamed_decision = None
+            llm_mode = 'stream' if self._stream_enabled() else 'full'
+            llm_start = time.perf_counter()
+            try:
+                if llm_mode == 'stream':
+                    ai_response, streamed_decision = self._request_completion_stream(headers, payload)
+                else:
+                    ai_start = time.time()
+                    response = requests.post(self.base_url, headers=headers, json=payload, timeout=30)
+                    response.raise_for_status()
+                    result = response.json()
+                    ai_duration = time.time() - ai_start
+                    write_echo(f"AI响应耗时: {ai_duration:.2f}秒")
+                    ai_response = result['choices'][0]['message']['content']
+            except Exception:
+                LLM_REQUESTS_TOTAL.inc(mode=llm_mode, outcome='error')
+                raise
+            finally:
+                LLM_REQUEST_SECONDS.observe(time.perf_counter() - llm_start, mode=llm_mode)
+            LLM_REQUESTS_TOTAL.inc(mode=llm_mode, outcome='ok')
             write_echo("AI原始响应接收成功")
             # 记录AI原始响应到回显文件以便调试
             write_echo(f"AI原始响应: {ai_response}")
 
-            decision = self._parse_ai_response(ai_response)
+            if streamed_decision is not None:
+                write_echo("流式增量解析JSON成功")
+                decision = streamed_decision
+            else:
+                decision = self._parse_ai_response(ai_response)
 
             # 记录AI决策详细信息
             write_echo("=== AI交易决策 ===")
@@ -555,146 +762,28 @@ class DeepSeekAI:
         return json.dumps(input_data, indent=2, ensure_ascii=False)
 
     def _parse_ai_response(self, response: str) -> Dict:
-        """解析AI响应 - 优化解析能力"""
+        """解析AI响应 - 单遍扫描提取，见 decision_parser"""
         try:
             write_echo("开始解析AI响应")
-            # 首先尝试直接解析整个响应
-            try:
-                decision = json.loads(response)
-                if self._validate_decision_format(decision):
-                    write_echo("直接解析JSON成功")
-                    return decision
-            except:
-                pass
-
-            # 如果直接解析失败，尝试提取符合我们模板的JSON部分
-            pattern = r'\{\s*"trading_decision"\s*:\s*\{[^{}]*\},\s*"position_management"\s*:\s*\{[^{}]*\}\s*\}'
-            matches = re.findall(pattern, response, re.DOTALL)
-
-            for match in matches:
-                try:
-                    # 清理JSON字符串
-                    json_str = match.replace('\n', ' ').replace('\t', ' ')
-                    # 移除多余的空白字符
-                    json_str = re.sub(r'\s+', ' ', json_str).strip()
-
-                    decision = json.loads(json_str)
-                    if self._validate_decision_format(decision):
-                        write_echo("从响应中成功提取标准JSON决策")
-                        return decision
-                except Exception as e:
-                    write_error(f"提取的JSON解析失败: {e}")
-                    continue
-
-            # 如果正则匹配失败，尝试手动构建标准格式
-            write_echo("尝试手动构建标准格式决策")
-            return self._build_standard_decision_from_response(response)
+            parse_start = time.perf_counter()
+            decision, method = decision_parser.parse_decision(response)
+            AI_STAGE_SECONDS.observe(time.perf_counter() - parse_start, stage='parse', method=method)
+            if method == "direct":
+                write_echo("直接解析JSON成功")
+            elif method == "extracted":
+                write_echo("从响应中成功提取标准JSON决策")
+            else:
+                write_echo(f"手动构建决策: {decision['trading_decision']['action']}")
+            return decision
 
         except Exception as e:
             write_error(f"解析AI响应失败: {e}")
             # 返回默认的持有决策
-            return {
-                "trading_decision": {
-                    "action": "hold",
-                    "confidence_level": "low",
-                    "reason": "AI响应解析失败，采用保守策略"
-                },
-                "position_management": {
-                    "position_size": 0,
-                    "stop_loss_price": 0,
-                    "take_profit_price": 0
-                }
-            }
-
-    def _build_standard_decision_from_response(self, response: str) -> Dict:
-        """从AI响应中手动构建标准格式决策"""
-        try:
-            # 默认决策
-            decision = {
-                "trading_decision": {
-                    "action": "hold",
-                    "confidence_level": "medium",
-                    "reason": ""
-                },
-                "position_management": {
-                    "position_size": 0,
-                    "stop_loss_price": 0,
-                    "take_profit_price": 0
-                }
-            }
-
-            # 尝试从响应中提取action
-            action_patterns = [
-                r'"action"\s*:\s*"(\w+)"',
-                r'action["\']?\s*:\s*["\']?(\w+)',
-                r'操作["\']?\s*:\s*["\']?(\w+)'
-            ]
-
-            for pattern in action_patterns:
-                match = re.search(pattern, response, re.IGNORECASE)
-                if match:
-                    action = match.group(1).lower()
-                    valid_actions = ["hold", "open_long", "open_short"]  # 移除了平仓操作
-                    if action in valid_actions:
-                        decision["trading_decision"]["action"] = action
-                        break
-
-            # 尝试提取reason
-            reason_patterns = [
-                r'"reason"\s*:\s*"([^"]*)"',
-                r'reason["\']?\s*:\s*["\']?([^"\']+)',
-                r'理由["\']?\s*:\s*["\']?([^"\']+)'
-            ]
-
-            for pattern in reason_patterns:
-                match = re.search(pattern, response, re.IGNORECASE)
-                if match:
-                    reason = match.group(1).strip()
-                    if reason:
-                        decision["trading_decision"]["reason"] = reason
-                        break
-
-            # 如果没找到reason，使用默认值
-            if not decision["trading_decision"]["reason"]:
-                decision["trading_decision"]["reason"] = "基于多时间维度K线分析做出的决策"
-
-            write_echo(f"手动构建决策: {decision['trading_decision']['action']}")
-            return decision
-
-        except Exception as e:
-            write_error(f"手动构建决策失败: {e}")
-            raise
+            return decision_parser.default_hold_decision("AI响应解析失败，采用保守策略")
 
     def _validate_decision_format(self, decision: Dict) -> bool:
         """验证决策格式是否符合模板"""
-        try:
-            # 检查必需字段是否存在
-            if "trading_decision" not in decision or "position_management" not in decision:
-                return False
-
-            td = decision["trading_decision"]
-            pm = decision["position_management"]
-
-            if not all(field in td for field in ["action", "confidence_level", "reason"]):
-                return False
-
-            if not all(field in pm for field in ["position_size", "stop_loss_price", "take_profit_price"]):
-                return False
-
-            # 验证action值的有效性（移除了平仓操作）
-            valid_actions = ["hold", "open_long", "open_short"]
-            if td["action"] not in valid_actions:
-                return False
-
-            # 验证confidence_level值的有效性
-            valid_confidences = ["high", "medium", "low"]
-            if td["confidence_level"] not in valid_confidences:
-                return False
-
-            return True
-
-        except:
-            return False
+        return decision_parser.validate_decision(decision)
 
     def update_profit(self, profit: float):
         """更新上次策略盈利"""
@@ -1530,12 +1619,9 @@ class ETHTradingBot:
             write_echo(json.dumps(ai_decision, indent=2, ensure_ascii=False))
 
             # 5. 根据交易模式决定是否执行交易
-            try:
-                mode = TRADING_MODE
-            except Exception:
-                mode = 'simulation'
-
-            if str(mode).lower() == 'live':
+            if is_live_mode() and has_unavailable(account_status, position_info):
+                write_error("交易模式=live，但账户或持仓数据不可用，本周期不下单")
+            elif is_live_mode():
                 write_echo("交易模式=live，尝试执行交易")
                 try:
                     ok = self.trading_executor.execute_trade(ai_decision, current_price, is_test=False)
@@ -1551,6 +1637,9 @@ class ETHTradingBot:
             write_echo("AI决策周期完成")
             return AI_FREQUENCY  # 返回频率后再次检查
 
+        except DataUnavailable as e:
+            write_error(f"市场数据不可用，跳过本轮AI决策: {e}")
+            return AI_FREQUENCY
         except Exception as e:
             write_error(f"动态交易周期执行失败: {e}")
             return AI_FREQUENCY  # 出错时返回正常频率
@@ -0,0 +1,179 @@
+"""仿真模式的止盈止损监控：每个价格tick检查所有未平仓模拟持仓的 TP/SL。
+
+每个交易对维护两个按触发价排序的列表：
+- up:   价格 >= 触发价时触发（多单止盈、空单止损）
+- down: 价格 <= 触发价时触发（多单止损、空单止盈）
+一次tick只需两次二分查找即可找出全部被触发的持仓，没有触发时开销为 O(log n)，
+与持仓数量基本无关。触发后按触发价调用持仓存储（仿真引擎 SimulationEngine）的 close_position 平仓。
+
+tick 来源可以是轮询（start 启动的线程，只轮询有持仓的交易对）或推送（on_tick 直接回调，
+例如 WebSocket 行情）。平仓在交易对的账本锁内进行，与决策周期的开平仓互斥。
+"""
+
+import bisect
+import math
+import threading
+import time
+from contextlib import nullcontext
+from typing import Callable, Dict, List, Optional, Tuple
+
+import metrics
+
+TPSL_TRIGGERS_TOTAL = metrics.counter("onlydecide_tpsl_triggers_total", "模拟持仓止盈止损触发次数")
+TPSL_TICK_SECONDS = metrics.histogram("onlydecide_tpsl_tick_duration_seconds", "单次tick检查耗时（不含平仓）")
+TPSL_OPEN_TRIGGERS = metrics.gauge("onlydecide_tpsl_open_triggers", "索引中的止盈止损触发点数量")
+
+# (触发价, 持仓id, 类型)；类型为 tp / sl
+_Entry = Tuple[float, int, str]
+
+
+class _SymbolIndex:
+    def __init__(self):
+        self.up: List[_Entry] = []
+        self.down: List[_Entry] = []
+        self.entries: Dict[int, List[Tuple[List[_Entry], _Entry]]] = {}
+
+    def add(self, pos: Dict):
+        pid = int(pos["id"])
+        self.remove(pid)
+        side = pos.get("side")
+        added = []
+        for kind, price in (("tp", pos.get("tp_price")), ("sl", pos.get("sl_price"))):
+            try:
+                price = float(price or 0)
+            except (TypeError, ValueError):
+                price = 0.0
+            if price <= 0:
+                continue
+            rising = (side == "long") == (kind == "tp")
+            target = self.up if rising else self.down
+            entry = (price, pid, kind)
+            bisect.insort(target, entry)
+            added.append((target, entry))
+        if added:
+            self.entries[pid] = added
+
+    def remove(self, pid: int):
+        for target, entry in self.entries.pop(pid, []):
+            i = bisect.bisect_left(target, entry)
+            if i < len(target) and target[i] == entry:
+                del target[i]
+
+    def triggered(self, price: float) -> List[_Entry]:
+        """返回该价格下触发的条目；同一持仓同时满足时以止损为准"""
+        hits = self.down[bisect.bisect_left(self.down, (price, -math.inf)):]
+        hits += self.up[:bisect.bisect_right(self.up, (price, math.inf))]
+        if not hits:
+            return []
+        chosen: Dict[int, _Entry] = {}
+        for entry in hits:
+            prev = chosen.get(entry[1])
+            if prev is None or (entry[2] == "sl" and prev[2] != "sl"):
+                chosen[entry[1]] = entry
+        return list(chosen.values())
+
+    def __len__(self):
+        return len(self.up) + len(self.down)
+
+
+class TPSLMonitor:
+    """模拟持仓止盈止损监控"""
+
+    def __init__(self, store, ledger: Optional[Callable[[str], object]] = None,
+                 leverage: Callable[[], float] = lambda: 1.0,
+                 on_close: Optional[Callable[[Dict], None]] = None):
+        # 持仓存储：需提供 list_open_positions(symbol=None) 与 close_position(pid, exit_price, leverage=, reason=)
+        self.store = store
+        self.ledger = ledger
+        self.leverage = leverage
+        self.on_close = on_close
+        self._index: Dict[str, _SymbolIndex] = {}
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _ledger(self, symbol: str):
+        return self.ledger(symbol) if self.ledger else nullcontext()
+
+    def _update_gauge(self):
+        TPSL_OPEN_TRIGGERS.set(sum(len(ix) for ix in self._index.values()))
+
+    def load(self):
+        """从持仓存储重建全部索引（启动或清空模拟记录后调用）"""
+        rows = self.store.list_open_positions()
+        with self._lock:
+            self._index.clear()
+            for pos in rows:
+                self._index.setdefault(pos["symbol"], _SymbolIndex()).add(pos)
+            for symbol in [s for s, ix in self._index.items() if not len(ix)]:
+                del self._index[symbol]
+            self._update_gauge()
+
+    def sync(self, symbol: str):
+        """重建单个交易对的索引（决策周期开平仓后调用）"""
+        rows = self.store.list_open_positions(symbol=symbol)
+        with self._lock:
+            index = _SymbolIndex()
+            for pos in rows:
+                index.add(pos)
+            if len(index):
+                self._index[symbol] = index
+            else:
+                self._index.pop(symbol, None)
+            self._update_gauge()
+
+    def symbols(self) -> List[str]:
+        with self._lock:
+            return [s for s, ix in self._index.items() if len(ix)]
+
+    def on_tick(self, symbol: str, price: float) -> int:
+        """处理一个价格tick，返回本次平仓数量"""
+        if not price or price <= 0:
+            return 0
+        started = time.perf_counter()
+        with self._lock:
+            index = self._index.get(symbol)
+            hits = index.triggered(price) if index is not None else []
+        TPSL_TICK_SECONDS.observe(time.perf_counter() - started)
+        if not hits:
+            return 0
+        closed = 0
+        with self._ledger(symbol):
+            for trigger, pid, kind in hits:
+                with self._lock:
+                    index = self._index.get(symbol)
+                    # 等锁期间持仓可能已被决策周期平掉并重新同步
+                    if index is None or pid not in index.entries:
+                        continue
+                    index.remove(pid)
+                    self._update_gauge()
+                if self.store.close_position(pid, exit_price=trigger, leverage=self.leverage(), reason=kind):
+                    closed += 1
+                    TPSL_TRIGGERS_TOTAL.inc(kind=kind)
+                    if self.on_close:
+                        self.on_close({"id": pid, "symbol": symbol, "kind": kind,
+                                       "trigger_price": trigger, "tick_price": price})
+        return closed
+
+    def _poll_loop(self, price_fn: Callable[[str], float], interval: float):
+        while not self._stop.wait(interval):
+            for symbol in self.symbols():
+                try:
+                    self.on_tick(symbol, price_fn(symbol))
+                except Exception:
+                    # 取价失败（如数据不可用）时等待下一轮
+                    continue
+
+    def start(self, price_fn: Callable[[str], float], interval: float = 2.0) -> "TPSLMonitor":
+        """启动轮询线程：只对有止盈止损的交易对取价"""
+        self._thread = threading.Thread(target=self._poll_loop, args=(price_fn, interval),
+                                        name="TPSLMonitor", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self) -> Dict:
+        with self._lock:
+            return {s: {"triggers": len(ix), "positions": len(ix.entries)} for s, ix in self._index.items()}
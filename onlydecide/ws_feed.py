@@ -0,0 +1,503 @@
+"""OKX WebSocket 行情订阅（可选）：把 tickers 与 5m/30m/2H/1D K线推送维护在内存中。
+
+- 公共频道 tickers 走 /ws/v5/public，K线频道 candle{bar} 走 /ws/v5/business；
+- 只用标准库实现 RFC6455 客户端（文本帧、分片、ping/pong、close），不引入新依赖；
+- 断线后按带抖动的指数退避重连，并重新订阅全部交易对；断线期间的数据视为失效，
+  读取方回退到 REST，重连后由首次 REST 结果补齐历史K线（WS 只推送最新一根）；
+- 连接空闲时发送 "ping"，收到任何消息（含 "pong"）即视为存活，超过 max_age 未收到则判定过期。
+
+OKXDataCollector 设置 feed 后，get_current_price / get_kline_data 优先读取这里的内存状态。
+本地测试可使用 mock_servers.MockWSServer 回放行情。
+"""
+
+import base64
+import hashlib
+import json
+import os
+import random
+import socket
+import ssl
+import struct
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import metrics
+
+WS_MESSAGES_TOTAL = metrics.counter("onlydecide_ws_messages_total", "WebSocket收到的消息数（按连接）")
+WS_RECONNECTS_TOTAL = metrics.counter("onlydecide_ws_reconnects_total", "WebSocket重连次数（按连接）")
+WS_READS_TOTAL = metrics.counter("onlydecide_ws_reads_total", "行情读取来源（ws=内存命中，rest=回退REST）")
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+OP_CONT, OP_TEXT, OP_BINARY, OP_CLOSE, OP_PING, OP_PONG = 0x0, 0x1, 0x2, 0x8, 0x9, 0xA
+
+DEFAULT_BARS = ("5m", "30m", "2H", "1D")
+SUBSCRIBE_BATCH = 20  # 每条订阅消息最多携带的频道数
+
+
+class WebSocketClosed(ConnectionError):
+    """连接被对端关闭或握手失败"""
+
+
+def accept_key(key: str) -> str:
+    """握手时由 Sec-WebSocket-Key 计算 Sec-WebSocket-Accept"""
+    return base64.b64encode(hashlib.sha1((key + WS_GUID).encode("ascii")).digest()).decode("ascii")
+
+
+def _mask(payload: bytes, key: bytes) -> bytes:
+    if not payload:
+        return payload
+    # 按整数整体异或，比逐字节循环快得多
+    n = len(payload)
+    repeated = (key * (n // 4 + 1))[:n]
+    return (int.from_bytes(payload, "big") ^ int.from_bytes(repeated, "big")).to_bytes(n, "big")
+
+
+def encode_frame(payload: bytes, opcode: int = OP_TEXT, mask: bool = True) -> bytes:
+    """编码单个完整帧（客户端必须掩码，服务端不得掩码）"""
+    n = len(payload)
+    head = bytearray([0x80 | opcode])
+    mask_bit = 0x80 if mask else 0
+    if n < 126:
+        head.append(mask_bit | n)
+    elif n < 65536:
+        head.append(mask_bit | 126)
+        head += struct.pack("!H", n)
+    else:
+        head.append(mask_bit | 127)
+        head += struct.pack("!Q", n)
+    if mask:
+        key = os.urandom(4)
+        return bytes(head) + key + _mask(payload, key)
+    return bytes(head) + payload
+
+
+class FrameBuffer:
+    """增量解帧：喂入任意字节片段，取出完整帧 (fin, opcode, payload)"""
+
+    def __init__(self):
+        self._buf = bytearray()
+
+    def feed(self, data: bytes):
+        self._buf += data
+
+    def next_frame(self) -> Optional[Tuple[bool, int, bytes]]:
+        buf = self._buf
+        if len(buf) < 2:
+            return None
+        fin = bool(buf[0] & 0x80)
+        opcode = buf[0] & 0x0F
+        masked = bool(buf[1] & 0x80)
+        n = buf[1] & 0x7F
+        pos = 2
+        if n == 126:
+            if len(buf) < 4:
+                return None
+            n = struct.unpack_from("!H", buf, 2)[0]
+            pos = 4
+        elif n == 127:
+            if len(buf) < 10:
+                return None
+            n = struct.unpack_from("!Q", buf, 2)[0]
+            pos = 10
+        key = b""
+        if masked:
+            if len(buf) < pos + 4:
+                return None
+            key = bytes(buf[pos:pos + 4])
+            pos += 4
+        if len(buf) < pos + n:
+            return None
+        payload = bytes(buf[pos:pos + n])
+        del buf[:pos + n]
+        if masked:
+            payload = _mask(payload, key)
+        return fin, opcode, payload
+
+
+class WebSocketClient:
+    """最小化的 RFC6455 客户端（阻塞式，单线程读、加锁写）"""
+
+    def __init__(self, url: str, timeout: float = 10.0):
+        self.url = url
+        self.timeout = timeout
+        self.sock: Optional[socket.socket] = None
+        self._frames = FrameBuffer()
+        self._fragments: List[bytes] = []
+        self._send_lock = threading.Lock()
+
+    def connect(self) -> "WebSocketClient":
+        u = urlparse(self.url)
+        secure = u.scheme == "wss"
+        host = u.hostname or "localhost"
+        port = u.port or (443 if secure else 80)
+        sock = socket.create_connection((host, port), timeout=self.timeout)
+        if secure:
+            sock = ssl.create_default_context().wrap_socket(sock, server_hostname=host)
+        key = base64.b64encode(os.urandom(16)).decode("ascii")
+        path = (u.path or "/") + (f"?{u.query}" if u.query else "")
+        request = (
+            f"GET {path} HTTP/1.1\r\n"
+            f"Host: {host}:{port}\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key}\r\n"
+            "Sec-WebSocket-Version: 13\r\n\r\n"
+        )
+        sock.sendall(request.encode("ascii"))
+        raw = b""
+        while b"\r\n\r\n" not in raw:
+            chunk = sock.recv(4096)
+            if not chunk:
+                sock.close()
+                raise WebSocketClosed("握手期间连接关闭")
+            raw += chunk
+        head, _, rest = raw.partition(b"\r\n\r\n")
+        lines = head.decode("latin-1").split("\r\n")
+        headers = {k.strip().lower(): v.strip() for k, _, v in (l.partition(":") for l in lines[1:])}
+        if lines[0].split()[1:2] != ["101"] or headers.get("sec-websocket-accept") != accept_key(key):
+            sock.close()
+            raise WebSocketClosed(f"握手失败: {lines[0]}")
+        self.sock = sock
+        self._frames.feed(rest)
+        return self
+
+    def _send(self, payload: bytes, opcode: int):
+        if self.sock is None:
+            raise WebSocketClosed("连接未建立")
+        with self._send_lock:
+            self.sock.sendall(encode_frame(payload, opcode, mask=True))
+
+    def send_text(self, text: str):
+        self._send(text.encode("utf-8"), OP_TEXT)
+
+    def recv(self, timeout: Optional[float] = None) -> Optional[str]:
+        """读取一条完整文本消息；超时返回 None（已读到的部分保留到下次）"""
+        if self.sock is None:
+            raise WebSocketClosed("连接未建立")
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            frame = self._frames.next_frame()
+            if frame is not None:
+                fin, opcode, payload = frame
+                if opcode == OP_PING:
+                    self._send(payload, OP_PONG)
+                    continue
+                if opcode == OP_PONG:
+                    continue
+                if opcode == OP_CLOSE:
+                    self.close()
+                    raise WebSocketClosed("对端关闭连接")
+                self._fragments.append(payload)
+                if not fin:
+                    continue
+                data = b"".join(self._fragments)
+                self._fragments = []
+                return data.decode("utf-8", errors="replace")
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return None
+            self.sock.settimeout(remaining)
+            try:
+                chunk = self.sock.recv(65536)
+            except socket.timeout:
+                return None
+            if not chunk:
+                self.close()
+                raise WebSocketClosed("连接已断开")
+            self._frames.feed(chunk)
+
+    def close(self):
+        sock, self.sock = self.sock, None
+        if sock is None:
+            return
+        try:
+            sock.sendall(encode_frame(b"", OP_CLOSE, mask=True))
+        except OSError:
+            pass
+        try:
+            sock.close()
+        except OSError:
+            pass
+
+
+def candle_to_kline(candle: List) -> Dict:
+    """OKX K线数组 -> 项目内部使用的K线字典（与 REST 采集格式一致）"""
+    return {
+        "timestamp": datetime.fromtimestamp(int(candle[0]) / 1000).strftime('%Y-%m-%d %H:%M:%S'),
+        "open": float(candle[1]),
+        "high": float(candle[2]),
+        "low": float(candle[3]),
+        "close": float(candle[4]),
+        "volume": float(candle[5])
+    }
+
+
+class MarketState:
+    """内存行情：tickers 属于 public 连接，K线属于 business 连接；连接断开时清空对应数据"""
+
+    def __init__(self, max_candles: int = 300):
+        self.max_candles = max_candles
+        self._lock = threading.Lock()
+        self._last_recv: Dict[str, Optional[float]] = {}
+        self._tickers: Dict[str, Tuple[float, int]] = {}
+        self._candles: Dict[Tuple[str, str], Dict[int, List]] = {}
+
+    def touch(self, conn: str):
+        self._last_recv[conn] = time.monotonic()
+
+    def alive(self, conn: str, max_age: float) -> bool:
+        last = self._last_recv.get(conn)
+        return last is not None and time.monotonic() - last <= max_age
+
+    def disconnected(self, conn: str):
+        with self._lock:
+            self._last_recv[conn] = None
+            if conn == "public":
+                self._tickers.clear()
+            elif conn == "business":
+                self._candles.clear()
+
+    def on_ticker(self, item: Dict):
+        inst = item.get("instId")
+        if not inst or not item.get("last"):
+            return
+        with self._lock:
+            self._tickers[inst] = (float(item["last"]), int(item.get("ts") or 0))
+
+    def on_candles(self, inst: str, bar: str, rows: List[List]):
+        with self._lock:
+            series = self._candles.setdefault((inst, bar), {})
+            for row in rows:
+                series[int(row[0])] = row
+            if len(series) > self.max_candles:
+                for ts in sorted(series)[:len(series) - self.max_candles]:
+                    series.pop(ts, None)
+
+    def seed_candles(self, inst: str, bar: str, rows: List[List], max_age: float):
+        """用 REST 结果补齐历史K线；推送中已有的同一根K线以推送为准"""
+        if not self.alive("business", max_age):
+            return
+        with self._lock:
+            series = self._candles.setdefault((inst, bar), {})
+            for row in rows:
+                series.setdefault(int(row[0]), row)
+
+    def price(self, inst: str, max_age: float) -> Optional[float]:
+        if not self.alive("public", max_age):
+            return None
+        item = self._tickers.get(inst)
+        return item[0] if item else None
+
+    def klines(self, inst: str, bar: str, limit: int, max_age: float) -> Optional[List[Dict]]:
+        """最新在前的K线；不足 limit 根或连接过期时返回 None"""
+        if not self.alive("business", max_age):
+            return None
+        with self._lock:
+            series = self._candles.get((inst, bar))
+            if not series or len(series) < limit:
+                return None
+            rows = [series[ts] for ts in sorted(series, reverse=True)[:limit]]
+        return [candle_to_kline(r) for r in rows]
+
+    def status(self) -> Dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "last_message_age": {k: (None if v is None else round(now - v, 3)) for k, v in self._last_recv.items()},
+                "tickers": {k: v[0] for k, v in self._tickers.items()},
+                "candle_series": {f"{k[0]}:{k[1]}": len(v) for k, v in self._candles.items()},
+            }
+
+
+class _FeedConnection:
+    """单条 WebSocket 连接：订阅、心跳、解析推送与断线重连"""
+
+    def __init__(self, feed: "OKXMarketFeed", name: str, url: str):
+        self.feed = feed
+        self.name = name
+        self.url = url
+        self.subs: List[Dict] = []
+        self._subs_lock = threading.Lock()
+        self.client: Optional[WebSocketClient] = None
+        self.connected = False
+        self.reconnects = 0
+        self._thread: Optional[threading.Thread] = None
+
+    def subscribe(self, args: List[Dict]):
+        with self._subs_lock:
+            new = [a for a in args if a not in self.subs]
+            self.subs.extend(new)
+        if new and self.connected:
+            try:
+                self._send_subscribe(new)
+            except Exception as e:
+                self.feed._error(f"WebSocket订阅失败[{self.name}]: {e}")
+
+    def _send_subscribe(self, args: List[Dict]):
+        for i in range(0, len(args), SUBSCRIBE_BATCH):
+            self.client.send_text(json.dumps({"op": "subscribe", "args": args[i:i + SUBSCRIBE_BATCH]}))
+
+    def _handle(self, text: str):
+        state = self.feed.state
+        state.touch(self.name)
+        WS_MESSAGES_TOTAL.inc(conn=self.name)
+        if text == "pong":
+            return
+        msg = json.loads(text)
+        if "event" in msg:
+            if msg["event"] == "error":
+                self.feed._error(f"WebSocket错误[{self.name}]: {msg.get('code')} {msg.get('msg')}")
+            return
+        arg = msg.get("arg") or {}
+        channel = arg.get("channel", "")
+        data = msg.get("data") or []
+        if channel == "tickers":
+            for item in data:
+                state.on_ticker(item)
+                self.feed._notify(item)
+        elif channel.startswith("candle"):
+            state.on_candles(arg.get("instId"), channel[len("candle"):], data)
+
+    def _session(self):
+        self.client = WebSocketClient(self.url, timeout=self.feed.connect_timeout).connect()
+        self.connected = True
+        self.feed.state.touch(self.name)
+        self.feed._log(f"WebSocket已连接[{self.name}]: {self.url}")
+        with self._subs_lock:
+            subs = list(self.subs)
+        if subs:
+            self._send_subscribe(subs)
+        awaiting_pong = False
+        while not self.feed._stop.is_set():
+            text = self.client.recv(timeout=self.feed.ping_interval)
+            if text is None:
+                if awaiting_pong:
+                    raise WebSocketClosed("心跳超时")
+                self.client.send_text("ping")
+                awaiting_pong = True
+                continue
+            awaiting_pong = False
+            try:
+                self._handle(text)
+            except ValueError:
+                pass
+
+    def run(self):
+        failures = 0
+        while not self.feed._stop.is_set():
+            try:
+                self._session()
+            except Exception as e:
+                if not self.feed._stop.is_set():
+                    self.feed._error(f"WebSocket断开[{self.name}]: {e}")
+            finally:
+                was_connected = self.connected
+                self.connected = False
+                self.feed.state.disconnected(self.name)
+                if self.client is not None:
+                    self.client.close()
+            if self.feed._stop.is_set():
+                break
+            failures = 0 if was_connected else failures + 1
+            self.reconnects += 1
+            WS_RECONNECTS_TOTAL.inc(conn=self.name)
+            # 带抖动的指数退避，避免与服务端恢复时的其他客户端同时重连
+            delay = random.uniform(0, min(self.feed.max_backoff, 0.5 * (2 ** failures)))
+            self.feed._stop.wait(delay)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name=f"OKXFeed-{self.name}", daemon=True)
+        self._thread.start()
+
+
+class OKXMarketFeed:
+    """OKX 公共行情订阅：价格与K线读取为内存查找"""
+
+    def __init__(self, public_url: str, business_url: str, bars=DEFAULT_BARS, max_age: float = 5.0,
+                 ping_interval: Optional[float] = None, connect_timeout: float = 10.0, max_backoff: float = 30.0,
+                 log: Optional[Callable[[str], None]] = None, error: Optional[Callable[[str], None]] = None):
+        self.bars = tuple(bars)
+        self.max_age = float(max_age)
+        # 空闲一半 max_age 即发 ping，保证存活连接的最近消息时间不会超过 max_age
+        self.ping_interval = ping_interval or max(0.5, self.max_age / 2)
+        self.connect_timeout = connect_timeout
+        self.max_backoff = max_backoff
+        self.state = MarketState()
+        self._log_fn = log
+        self._error_fn = error
+        self._stop = threading.Event()
+        self._tracked: set = set()
+        self._listeners: List[Callable[[str, float], None]] = []
+        self.public = _FeedConnection(self, "public", public_url)
+        self.business = _FeedConnection(self, "business", business_url)
+
+    def _log(self, msg: str):
+        if self._log_fn:
+            self._log_fn(msg)
+
+    def _error(self, msg: str):
+        if self._error_fn:
+            self._error_fn(msg)
+
+    def add_listener(self, fn: Callable[[str, float], None]):
+        """注册价格推送回调 fn(inst_id, price)，在接收线程中调用"""
+        self._listeners.append(fn)
+
+    def _notify(self, item: Dict):
+        if not self._listeners or not item.get("last"):
+            return
+        inst, price = item.get("instId"), float(item["last"])
+        for fn in self._listeners:
+            try:
+                fn(inst, price)
+            except Exception as e:
+                self._error(f"行情回调失败: {e}")
+
+    def start(self) -> "OKXMarketFeed":
+        self.public.start()
+        self.business.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        for conn in (self.public, self.business):
+            if conn.client is not None:
+                conn.client.close()
+
+    def track(self, inst_id: str):
+        """订阅交易对的 tickers 与各周期K线（重复调用无副作用）"""
+        if inst_id in self._tracked:
+            return
+        self._tracked.add(inst_id)
+        self.public.subscribe([{"channel": "tickers", "instId": inst_id}])
+        self.business.subscribe([{"channel": f"candle{bar}", "instId": inst_id} for bar in self.bars])
+
+    def price(self, inst_id: str) -> Optional[float]:
+        self.track(inst_id)
+        price = self.state.price(inst_id, self.max_age)
+        WS_READS_TOTAL.inc(kind="price", source="ws" if price is not None else "rest")
+        return price
+
+    def klines(self, inst_id: str, bar: str, limit: int) -> Optional[List[Dict]]:
+        if bar not in self.bars:
+            return None
+        self.track(inst_id)
+        klines = self.state.klines(inst_id, bar, limit, self.max_age)
+        WS_READS_TOTAL.inc(kind="klines", source="ws" if klines is not None else "rest")
+        return klines
+
+    def seed_candles(self, inst_id: str, bar: str, rows: List[List]):
+        if bar in self.bars:
+            self.state.seed_candles(inst_id, bar, rows, self.max_age)
+
+    def status(self) -> Dict:
+        status = self.state.status()
+        status.update({
+            "tracked": sorted(self._tracked),
+            "connections": {c.name: {"url": c.url, "connected": c.connected, "reconnects": c.reconnects,
+                                     "subscriptions": len(c.subs)} for c in (self.public, self.business)},
+        })
+        return status